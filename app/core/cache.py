@@ -1,16 +1,405 @@
 
-import redis
-import json
-import pickle
+import redis.asyncio as redis
+import array
+import asyncio
 import hashlib
+import inspect
+import math
+import operator
+import time
+import msgspec
+import orjson
 
-from typing import Optional, Any
+from bson import Decimal128, ObjectId
+from collections import OrderedDict
+from typing import Optional, Any, Dict, List, Callable, Tuple, Iterable, Awaitable, Union
 
 from app.core.config import settings
 from app.core.utils import Utils, logger
 
-# Cliente Redis
-redis_client = redis.from_url(settings.CACHE.REDIS_URL)
+# Hash rápido opcional para las claves de caché (no requieren seguridad criptográfica)
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+# Configuración de caché resuelta una sola vez al importar
+_ENABLE_CACHE = bool(settings.CACHE.ENABLE_CACHE)
+_DEFAULT_TTL = settings.CACHE.CACHE_TTL
+_KEY_HASH = settings.CACHE.CACHE_KEY_HASH
+
+# Pool de conexiones compartido, acotado al tamaño configurado
+redis_pool = redis.BlockingConnectionPool.from_url(
+    settings.CACHE.REDIS_URL,
+    max_connections=settings.CACHE.REDIS_POOL_SIZE,
+    socket_keepalive=True,
+    health_check_interval=30,
+    decode_responses=False
+)
+
+# Cliente Redis asíncrono
+redis_client = redis.Redis(connection_pool=redis_pool)
+
+# Códigos de extensión msgpack de los tipos BSON, que así conservan su tipo.
+# msgspec serializa por sí mismo Decimal y las fechas sin zona horaria como
+# texto, y así se leen de vuelta
+_EXT_OBJECT_ID = 1
+_EXT_DECIMAL128 = 2
+
+def _enc_hook(obj: Any) -> Any:
+    """Convierte a tipos msgpack los objetos que msgspec no serializa por sí solo"""
+    # Valores de documentos de MongoDB
+    if isinstance(obj, ObjectId):
+        return msgspec.msgpack.Ext(_EXT_OBJECT_ID, obj.binary)
+    if isinstance(obj, Decimal128):
+        return msgspec.msgpack.Ext(_EXT_DECIMAL128, str(obj).encode())
+    # Serializar objetos Pydantic como diccionarios
+    if hasattr(obj, "model_dump"):
+        # Pydantic V2+
+        return obj.model_dump()
+    if hasattr(obj, "dict"):
+        # Pydantic V1
+        return obj.dict()
+    return Utils.JSON.default(obj)
+
+
+# Serialización msgpack reutilizable
+def _ext_hook(code: int, data: memoryview) -> Any:
+    """Reconstruye los valores guardados como extensión por _enc_hook"""
+    if code == _EXT_OBJECT_ID:
+        return ObjectId(bytes(data))
+    if code == _EXT_DECIMAL128:
+        return Decimal128(bytes(data).decode())
+    return msgspec.msgpack.Ext(code, bytes(data))
+
+_ENC = msgspec.msgpack.Encoder(enc_hook=_enc_hook)
+_DEC = msgspec.msgpack.Decoder(ext_hook=_ext_hook)
+
+# Prefijo de 1 byte que indica el formato del valor almacenado
+_TAG_MSGPACK = b"\x01"
+_TAG_STR = b"\x02"
+_TAG_BYTES = b"\x03"
+
+# Deserializador por prefijo de formato
+_DECODERS: Dict[bytes, Callable[[bytes], Any]] = {
+    _TAG_MSGPACK: _DEC.decode,
+    _TAG_STR: bytes.decode,
+    _TAG_BYTES: bytes,
+}
+
+
+def _serialize(value: Any) -> bytes:
+    """Serializa un valor al formato etiquetado que se guarda en Redis"""
+    if isinstance(value, str):
+        return _TAG_STR + value.encode("utf-8")
+    if isinstance(value, (bytes, bytearray)):
+        return _TAG_BYTES + value
+    return _TAG_MSGPACK + _ENC.encode(value)
+
+
+def _deserialize(value: Optional[bytes], default: Any = None) -> Any:
+    """Deserializa un valor leído de Redis según su prefijo de formato"""
+    if value is None:
+        return default
+    
+    decode = _DECODERS.get(value[:1])
+    if decode is None:
+        # Los contadores de INCRBY (Cache.increment) se guardan como enteros
+        # ASCII sin etiqueta
+        try:
+            return int(value)
+        except ValueError:
+            # Valor con formato desconocido (p. ej. escrito por una versión anterior)
+            return default
+    
+    return decode(value[1:])
+
+
+def _to_model(value: Any, model: Optional[type], default: Any = None) -> Any:
+    """Reconstruye el modelo indicado a partir de un diccionario deserializado"""
+    if model is None or not isinstance(value, dict):
+        return value
+    
+    try:
+        return model(**value)
+    except Exception as e:
+        logger.warning(f"Error rebuilding {model.__name__} from cache: {e}")
+        return default
+
+
+# Cola de escrituras pendientes: las escrituras no bloquean la petición y se
+# envían a Redis en lotes mediante un pipeline desde una tarea en segundo plano
+_WRITE_QUEUE_SIZE = 10000
+_FLUSH_BATCH_SIZE = 256
+
+_write_queue: Optional[asyncio.Queue] = None
+_flusher_task: Optional[asyncio.Task] = None
+
+
+def _enqueue_write(key: str, payload: bytes, ttl: int) -> bool:
+    """Encola una escritura y arranca el flusher si no está en marcha"""
+    global _write_queue, _flusher_task
+    
+    if _write_queue is None:
+        _write_queue = asyncio.Queue(maxsize=_WRITE_QUEUE_SIZE)
+    if _flusher_task is None or _flusher_task.done():
+        _flusher_task = asyncio.get_running_loop().create_task(_flusher())
+    
+    try:
+        _write_queue.put_nowait((key, payload, ttl))
+        return True
+    except asyncio.QueueFull:
+        logger.warning(f"Cache write queue full, dropping write for key {key}")
+        return False
+
+
+async def _flusher() -> None:
+    """Vacía la cola de escrituras en lotes de hasta _FLUSH_BATCH_SIZE elementos"""
+    while True:
+        batch = [await _write_queue.get()]
+        while len(batch) < _FLUSH_BATCH_SIZE:
+            try:
+                batch.append(_write_queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for key, payload, ttl in batch:
+                    pipe.set(key, payload, ex=ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Error flushing cache writes: {e}")
+        finally:
+            for _ in batch:
+                _write_queue.task_done()
+
+
+async def _drain_writes() -> None:
+    """Espera a que se apliquen las escrituras encoladas (preserva el orden con borrados)"""
+    if _write_queue is not None and _flusher_task is not None and not _flusher_task.done():
+        await _write_queue.join()
+
+
+# Caché local en proceso para lecturas frecuentes (client-side caching): solo
+# para las claves de los espacios de nombres configurados, que se registran
+# como PREFIX de CLIENT TRACKING en modo BCAST; Redis notifica las claves
+# modificadas con esos prefijos y el listener las expulsa de la caché local.
+# Las entradas caducan además a los pocos segundos por si se pierde algún aviso
+_LOCAL_CACHE_SIZE = settings.CACHE.CACHE_LOCAL_SIZE
+_LOCAL_CACHE_TTL = settings.CACHE.CACHE_LOCAL_TTL
+_LOCAL_NAMESPACES = frozenset(settings.CACHE.CACHE_LOCAL_PREFIXES)
+_LOCAL_PREFIXES: Tuple[str, ...] = tuple(f"{namespace}:" for namespace in settings.CACHE.CACHE_LOCAL_PREFIXES)
+_INVALIDATE_CHANNEL = "__redis__:invalidate"
+_TRACKING_RETRY_SECONDS = 30
+
+_local_cache: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+_local_cache_ready = False
+_invalidation_gen = 0
+_tracking_task: Optional[asyncio.Task] = None
+_tracking_retry_at = 0.0
+
+
+def _ensure_tracking() -> None:
+    """Arranca el listener de invalidaciones si la caché local está habilitada"""
+    global _tracking_task
+    
+    if _LOCAL_CACHE_SIZE <= 0 or not _LOCAL_PREFIXES:
+        return
+    if _tracking_task is not None and not _tracking_task.done():
+        return
+    
+    loop = asyncio.get_running_loop()
+    if loop.time() >= _tracking_retry_at:
+        _tracking_task = loop.create_task(_tracking_listener())
+
+
+def _local_get(key: str) -> Optional[bytes]:
+    """Devuelve el valor serializado de la caché local, si está disponible"""
+    if not _local_cache_ready or not key.startswith(_LOCAL_PREFIXES):
+        return None
+    
+    entry = _local_cache.get(key)
+    if entry is None:
+        return None
+    if time.monotonic() >= entry[1]:
+        del _local_cache[key]
+        return None
+    
+    _local_cache.move_to_end(key)
+    return entry[0]
+
+
+def _local_put(key: str, value: Optional[bytes], gen: int) -> None:
+    """
+    Guarda un valor leído de Redis en la caché local. Si llegó alguna
+    invalidación mientras se leía (gen distinto) el valor se descarta.
+    """
+    if not _local_cache_ready or value is None or gen != _invalidation_gen:
+        return
+    if not key.startswith(_LOCAL_PREFIXES):
+        return
+    
+    _local_cache[key] = (value, time.monotonic() + _LOCAL_CACHE_TTL)
+    _local_cache.move_to_end(key)
+    if len(_local_cache) > _LOCAL_CACHE_SIZE:
+        _local_cache.popitem(last=False)
+
+
+def _local_invalidate(keys: Optional[Iterable[Any]]) -> None:
+    """Expulsa claves de la caché local (None la vacía por completo)"""
+    global _invalidation_gen
+    
+    _invalidation_gen += 1
+    if keys is None:
+        _local_cache.clear()
+        return
+    
+    for key in keys:
+        _local_cache.pop(key.decode() if isinstance(key, bytes) else key, None)
+
+
+async def _tracking_listener() -> None:
+    """
+    Suscribe una conexión dedicada a __redis__:invalidate y activa el tracking
+    en modo BCAST, con un PREFIX por espacio de nombres local, redirigido a
+    ella. Mientras está activo, la caché local se usa en Cache.get; al
+    (re)conectar y si la conexión falla, la caché local se vacía.
+    """
+    global _local_cache_ready, _tracking_retry_at
+    
+    pubsub_conn = redis_pool.make_connection()
+    tracking_conn = redis_pool.make_connection()
+    
+    try:
+        await pubsub_conn.connect()
+        await pubsub_conn.send_command("CLIENT", "ID")
+        client_id = await pubsub_conn.read_response()
+        await pubsub_conn.send_command("SUBSCRIBE", _INVALIDATE_CHANNEL)
+        await pubsub_conn.read_response()
+        
+        await tracking_conn.connect()
+        prefix_args = [arg for prefix in _LOCAL_PREFIXES for arg in ("PREFIX", prefix)]
+        await tracking_conn.send_command("CLIENT", "TRACKING", "ON", "REDIRECT", client_id, "BCAST", *prefix_args)
+        await tracking_conn.read_response()
+        
+        # Lo leído antes de esta conexión no tiene avisos garantizados
+        _local_invalidate(None)
+        _local_cache_ready = True
+        
+        while True:
+            message = await pubsub_conn.read_response(timeout=None)
+            # Formato: [b"message", b"__redis__:invalidate", [claves] | None]
+            if isinstance(message, list) and len(message) == 3 and message[0] == b"message":
+                _local_invalidate(message[2])
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.warning(f"Redis client-side caching unavailable: {e}")
+        _tracking_retry_at = asyncio.get_running_loop().time() + _TRACKING_RETRY_SECONDS
+    finally:
+        _local_cache_ready = False
+        _local_invalidate(None)
+        for conn in (pubsub_conn, tracking_conn):
+            try:
+                await conn.disconnect()
+            except Exception:
+                pass
+
+
+# Rellenos de caché en curso por clave (get_or_set): las peticiones concurrentes
+# sobre la misma clave esperan al mismo resultado en lugar de recalcularlo. El
+# relleno corre en una tarea propia, así que cancelar a quien lo inició no
+# cancela a los demás
+_inflight: Dict[str, asyncio.Task] = {}
+
+
+async def _fill(key: str, factory: Callable[[], Union[Any, Awaitable[Any]]], ttl: Optional[int]) -> Any:
+    """Lee la clave de Redis y, si no existe, la calcula con factory y la guarda"""
+    try:
+        value = _deserialize(await redis_client.get(key))
+    except Exception as e:
+        logger.error(f"Error getting cache: {e}")
+        value = None
+    
+    if value is None:
+        value = factory()
+        if inspect.isawaitable(value):
+            value = await value
+        
+        if value is not None:
+            try:
+                # NX: no sobrescribir si otro proceso ya rellenó la clave
+                await redis_client.set(
+                    key,
+                    _serialize(value),
+                    ex=ttl if ttl is not None else _DEFAULT_TTL,
+                    nx=True
+                )
+            except Exception as e:
+                logger.error(f"Error setting cache: {e}")
+    
+    return value
+
+
+def _fill_done(key: str, task: asyncio.Task) -> None:
+    """Retira el relleno terminado y marca su excepción como recuperada"""
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        task.exception()
+
+
+def _new_key_hash(data: bytes) -> Any:
+    """Crea el objeto hash usado para generar claves de caché"""
+    if _KEY_HASH == "md5":
+        return hashlib.md5(data)
+    if blake3 is not None:
+        return blake3.blake3(data)
+    return hashlib.blake2b(data, digest_size=16)
+
+
+def _key_hexdigest(h: Any) -> str:
+    """Devuelve el digest hexadecimal de 32 caracteres de una clave de caché"""
+    if blake3 is not None and isinstance(h, blake3.blake3):
+        return h.hexdigest(16)
+    return h.hexdigest()
+
+
+# Longitud máxima de una clave que se usa tal cual, sin aplicar hash
+_RAW_KEY_MAX_LEN = 64
+
+# Codificadores directos para los tipos admitidos por Cache.compile_key
+# Opciones orjson para serializar argumentos complejos de forma determinista
+_KEY_JSON_OPTS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+_FAST_KEY_ENCODERS: Dict[type, Callable[[Any], bytes]] = {
+    str: str.encode,
+    int: lambda value: b"%d" % value,
+    float: lambda value: repr(value).encode(),
+    bool: lambda value: b"True" if value else b"False",
+}
+
+
+def _key_bytes(value: Any) -> bytes:
+    """Convierte un argumento de la clave de caché a bytes"""
+    try:
+        # Para tipos simples, codificar directamente
+        encode = _FAST_KEY_ENCODERS.get(type(value))
+        if encode is not None:
+            return encode(value)
+        if value is None:
+            return b"None"
+        # Para ApiKeyInDB u objetos con clave 'key', usar solo esa propiedad
+        if hasattr(value, "key") and isinstance(getattr(value, "key"), str):
+            return value.key.encode()
+        # Para otros objetos, añadir su JSON canónico directamente: el hash de la
+        # clave completa ya acota la longitud, no hace falta resumirlo aparte
+        return orjson.dumps(value, option=_KEY_JSON_OPTS, default=Utils.JSON.default)
+    except Exception as e:
+        # En caso de error, usar el str del objeto
+        logger.warning(f"Error serializing arg for cache key: {e}")
+        return str(value).encode()
 
 
 class Cache:
@@ -29,54 +418,65 @@ class Cache:
             **kwargs: Argumentos de palabras clave
             
         Returns:
-            Clave de caché en formato MD5
+            Clave de caché: la propia clave si es corta y ASCII, o su digest
+            hexadecimal de 32 caracteres en otro caso (precedido de "prefijo:"
+            si el prefijo es un espacio de nombres de la caché local)
         """
-        key_parts = [prefix]
+        buf = bytearray(prefix.encode())
         
         # Procesar argumentos posicionales
         for arg in args:
-            try:
-                # Para tipos simples, usar directamente
-                if isinstance(arg, (str, int, float, bool, type(None))):
-                    key_parts.append(str(arg))
-                # Para ApiKeyInDB u objetos con clave 'key', usar solo esa propiedad
-                elif hasattr(arg, "key") and isinstance(getattr(arg, "key"), str):
-                    key_parts.append(getattr(arg, "key"))
-                # Para otros objetos, usar representación JSON con el encoder personalizado
-                else:
-                    json_str = json.dumps(arg, sort_keys=True, cls=Utils.JSON.CustomJSONEncoder)
-                    key_parts.append(hashlib.md5(json_str.encode()).hexdigest())
-            except Exception as e:
-                # En caso de error, usar hash del str del objeto
-                logger.warning(f"Error serializing arg for cache key: {e}")
-                key_parts.append(hashlib.md5(str(arg).encode()).hexdigest())
+            buf += b":"
+            buf += _key_bytes(arg)
         
         # Procesar argumentos de palabras clave (ordenados por clave)
         for k in sorted(kwargs.keys()):
-            v = kwargs[k]
-            key_parts.append(f"{k}:")
+            buf += b":" + k.encode() + b"::"
+            buf += _key_bytes(kwargs[k])
+        
+        # Las claves cortas se usan directamente; el hash solo acota la longitud
+        if len(buf) <= _RAW_KEY_MAX_LEN and b":" in buf and buf.isascii():
+            return buf.decode()
+        
+        digest = _key_hexdigest(_new_key_hash(buf))
+        return f"{prefix}:{digest}" if prefix in _LOCAL_NAMESPACES else digest
+    
+    @staticmethod
+    def compile_key(prefix: str, arg_types: Tuple[type, ...] = (str, int)) -> Callable[..., str]:
+        """
+        Precompila un generador de claves para un prefijo fijo. El estado del hash
+        con el prefijo ya aplicado se calcula una vez y se copia en cada llamada.
+        A diferencia de generate_key, siempre aplica el hash, por lo que es la
+        opción adecuada cuando los argumentos son credenciales (p. ej. API keys).
+        
+        Args:
+            prefix: Prefijo para la clave
+            arg_types: Tipos de argumento que se codifican por la vía rápida
             
-            try:
-                # Similar a los args, pero con manejo específico para kwargs
-                if isinstance(v, (str, int, float, bool, type(None))):
-                    key_parts.append(str(v))
-                elif hasattr(v, "key") and isinstance(getattr(v, "key"), str):
-                    key_parts.append(getattr(v, "key"))
-                else:
-                    json_str = json.dumps(v, sort_keys=True, cls=Utils.JSON.CustomJSONEncoder)
-                    key_parts.append(hashlib.md5(json_str.encode()).hexdigest())
-            except Exception as e:
-                logger.warning(f"Error serializing kwarg {k} for cache key: {e}")
-                key_parts.append(hashlib.md5(str(v).encode()).hexdigest())
+        Returns:
+            Función que recibe los argumentos posicionales y devuelve la clave
+            como digest hexadecimal de 32 caracteres (precedido de "prefijo:" si
+            el prefijo es un espacio de nombres de la caché local)
+        """
+        base = _new_key_hash(prefix.encode())
+        namespace = f"{prefix}:" if prefix in _LOCAL_NAMESPACES else ""
+        encoders = {t: _FAST_KEY_ENCODERS[t] for t in arg_types if t in _FAST_KEY_ENCODERS}
         
-        # Unir todas las partes con ':'
-        key = ":".join(key_parts)
+        def fast_key(*args) -> str:
+            buf = bytearray()
+            for arg in args:
+                buf += b":"
+                encode = encoders.get(type(arg))
+                buf += encode(arg) if encode is not None else _key_bytes(arg)
+            
+            h = base.copy()
+            h.update(buf)
+            return namespace + _key_hexdigest(h)
         
-        # Aplicar hash MD5 para limitar longitud y asegurar compatibilidad
-        return hashlib.md5(key.encode()).hexdigest()
+        return fast_key
     
     @staticmethod
-    def set(key: str, value: Any, ttl: Optional[int] = None) -> bool:
+    async def set(key: str, value: Any, ttl: Optional[int] = None) -> bool:
         """
         Almacena un valor en caché
         
@@ -86,71 +486,138 @@ class Cache:
             ttl: Tiempo de vida en segundos (opcional)
             
         Returns:
-            True si se almacenó correctamente, False en caso contrario
+            True si se encoló la escritura, False en caso contrario
         """
-        if not settings.CACHE.ENABLE_CACHE:
+        if not _ENABLE_CACHE:
             return False
         
-        ttl = ttl if ttl is not None else settings.CACHE.CACHE_TTL
+        ttl = ttl if ttl is not None else _DEFAULT_TTL
         
         try:
-            # Intentar serializar objetos Pydantic antes de usar pickle
-            if hasattr(value, "model_dump"):
-                # Pydantic V2+
-                value = json.dumps(value.model_dump(), cls=Utils.JSON.CustomJSONEncoder)
-            elif hasattr(value, "dict"):
-                # Pydantic V1
-                value = json.dumps(value.dict(), cls=Utils.JSON.CustomJSONEncoder)
-            # Para otros objetos complejos, usar pickle
-            elif not isinstance(value, (str, int, float, bool, type(None))):
-                value = pickle.dumps(value)
-            
-            return redis_client.set(key, value, ex=ttl)
+            _local_invalidate((key,))
+            return _enqueue_write(key, _serialize(value), ttl)
         except Exception as e:
             logger.error(f"Error setting cache: {e}")
             return False
     
     @staticmethod
-    def get(key: str, default: Any = None) -> Any:
+    async def get(key: str, default: Any = None, model: Optional[type] = None) -> Any:
         """
         Recupera un valor de la caché
         
         Args:
             key: Clave de caché
             default: Valor por defecto si no se encuentra
+            model: Modelo (p. ej. Pydantic) con el que reconstruir el valor (opcional)
             
         Returns:
             Valor almacenado o default si no existe
         """
-        if not settings.CACHE.ENABLE_CACHE:
+        if not _ENABLE_CACHE:
             return default
         
         try:
-            value = redis_client.get(key)
+            _ensure_tracking()
+            
+            value = _local_get(key)
             if value is None:
-                return default
+                gen = _invalidation_gen
+                value = await redis_client.get(key)
+                _local_put(key, value, gen)
             
-            # Intentar deserializar
-            try:
-                # Primero intentar como JSON (para objetos Pydantic)
-                return json.loads(value)
-            except (TypeError, json.JSONDecodeError):
-                try:
-                    # Luego intentar como pickle
-                    return pickle.loads(value)
-                except Exception:
-                    # Si no es JSON ni pickle, devolver como está
-                    # (posiblemente bytes que deben ser decodificados)
-                    try:
-                        return value.decode('utf-8')
-                    except (AttributeError, UnicodeDecodeError):
-                        return value
+            if value is None:
+                return default
+            return _to_model(_deserialize(value, default), model, default)
         except Exception as e:
             logger.error(f"Error getting cache: {e}")
             return default
     
     @staticmethod
-    def delete(key: str) -> bool:
+    async def get_or_set(
+        key: str,
+        factory: Callable[[], Union[Any, Awaitable[Any]]],
+        ttl: Optional[int] = None
+    ) -> Any:
+        """
+        Recupera un valor de la caché o lo calcula y almacena si no existe.
+        Las llamadas concurrentes con la misma clave comparten una única
+        ejecución de factory.
+        
+        Args:
+            key: Clave de caché
+            factory: Función (síncrona o asíncrona) que calcula el valor
+            ttl: Tiempo de vida en segundos (opcional)
+            
+        Returns:
+            Valor almacenado o el calculado por factory
+        """
+        if not _ENABLE_CACHE:
+            value = factory()
+            return await value if inspect.isawaitable(value) else value
+        
+        task = _inflight.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(_fill(key, factory, ttl))
+            _inflight[key] = task
+            task.add_done_callback(lambda done: _fill_done(key, done))
+        
+        return await asyncio.shield(task)
+    
+    @staticmethod
+    async def mget(keys: List[str], default: Any = None) -> List[Any]:
+        """
+        Recupera varios valores de la caché en un único round-trip
+        
+        Args:
+            keys: Claves de caché
+            default: Valor por defecto para las claves que no se encuentren
+            
+        Returns:
+            Lista de valores en el mismo orden que las claves
+        """
+        if not _ENABLE_CACHE or not keys:
+            return [default] * len(keys)
+        
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.get(key)
+                results = await pipe.execute()
+            
+            return [_deserialize(value, default) for value in results]
+        except Exception as e:
+            logger.error(f"Error getting cache (batch): {e}")
+            return [default] * len(keys)
+    
+    @staticmethod
+    async def mset(items: Dict[str, Any], ttl: Optional[int] = None) -> bool:
+        """
+        Almacena varios valores en caché en un único round-trip
+        
+        Args:
+            items: Diccionario clave -> valor a almacenar
+            ttl: Tiempo de vida en segundos (opcional)
+            
+        Returns:
+            True si se encolaron todas las escrituras, False en caso contrario
+        """
+        if not _ENABLE_CACHE or not items:
+            return False
+        
+        ttl = ttl if ttl is not None else _DEFAULT_TTL
+        
+        try:
+            _local_invalidate(items.keys())
+            return all([
+                _enqueue_write(key, _serialize(value), ttl)
+                for key, value in items.items()
+            ])
+        except Exception as e:
+            logger.error(f"Error setting cache (batch): {e}")
+            return False
+    
+    @staticmethod
+    async def delete(key: str) -> bool:
         """
         Elimina una clave de la caché
         
@@ -160,34 +627,80 @@ class Cache:
         Returns:
             True si se eliminó, False en caso contrario
         """
-        if not settings.CACHE.ENABLE_CACHE:
+        if not _ENABLE_CACHE:
             return False
         
         try:
-            return redis_client.delete(key) > 0
+            await _drain_writes()
+            _local_invalidate((key,))
+            # UNLINK libera la memoria en segundo plano en el servidor Redis
+            return await redis_client.unlink(key) > 0
         except Exception as e:
             logger.error(f"Error deleting cache: {e}")
             return False
     
     @staticmethod
-    def flush() -> bool:
+    async def mdelete(keys: List[str]) -> int:
+        """
+        Elimina varias claves de la caché en un único round-trip
+        
+        Args:
+            keys: Claves a eliminar
+            
+        Returns:
+            Número de claves eliminadas
+        """
+        if not _ENABLE_CACHE or not keys:
+            return 0
+        
+        try:
+            await _drain_writes()
+            _local_invalidate(keys)
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.unlink(key)
+                results = await pipe.execute()
+            
+            return sum(results)
+        except Exception as e:
+            logger.error(f"Error deleting cache (batch): {e}")
+            return 0
+    
+    @staticmethod
+    async def invalidate(keys: Iterable[str]) -> int:
+        """
+        Invalida un conjunto de claves (p. ej. tras una escritura) con un único
+        pipeline de UNLINK
+        
+        Args:
+            keys: Claves a invalidar
+            
+        Returns:
+            Número de claves eliminadas
+        """
+        return await Cache.mdelete(list(keys))
+    
+    @staticmethod
+    async def flush() -> bool:
         """
         Limpia toda la caché
         
         Returns:
             True si se limpió correctamente, False en caso contrario
         """
-        if not settings.CACHE.ENABLE_CACHE:
+        if not _ENABLE_CACHE:
             return False
         
         try:
-            return redis_client.flushdb()
+            await _drain_writes()
+            _local_invalidate(None)
+            return await redis_client.flushdb()
         except Exception as e:
             logger.error(f"Error flushing cache: {e}")
             return False
     
     @staticmethod
-    def exists(key: str) -> bool:
+    async def exists(key: str) -> bool:
         """
         Verifica si una clave existe en la caché
         
@@ -197,17 +710,18 @@ class Cache:
         Returns:
             True si la clave existe, False en caso contrario
         """
-        if not settings.CACHE.ENABLE_CACHE:
+        if not _ENABLE_CACHE:
             return False
         
         try:
-            return redis_client.exists(key) > 0
+            await _drain_writes()
+            return await redis_client.exists(key) > 0
         except Exception as e:
             logger.error(f"Error checking cache existence: {e}")
             return False
     
     @staticmethod
-    def increment(key: str, amount: int = 1) -> int:
+    async def increment(key: str, amount: int = 1) -> int:
         """
         Incrementa el valor de una clave
         
@@ -218,17 +732,19 @@ class Cache:
         Returns:
             Nuevo valor o 0 si falla
         """
-        if not settings.CACHE.ENABLE_CACHE:
+        if not _ENABLE_CACHE:
             return 0
         
         try:
-            return redis_client.incrby(key, amount)
+            _local_invalidate((key,))
+            await _drain_writes()
+            return await redis_client.incrby(key, amount)
         except Exception as e:
             logger.error(f"Error incrementing cache: {e}")
             return 0
     
     @staticmethod
-    def expire(key: str, ttl: int) -> bool:
+    async def expire(key: str, ttl: int) -> bool:
         """
         Establece un tiempo de expiración para una clave
         
@@ -239,11 +755,169 @@ class Cache:
         Returns:
             True si se estableció, False en caso contrario
         """
-        if not settings.CACHE.ENABLE_CACHE:
+        if not _ENABLE_CACHE:
             return False
         
         try:
-            return redis_client.expire(key, ttl)
+            await _drain_writes()
+            return await redis_client.expire(key, ttl)
         except Exception as e:
             logger.error(f"Error setting expiration: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    @staticmethod
+    async def close() -> None:
+        """
+        Aplica las escrituras pendientes y cierra el cliente Redis
+        """
+        global _flusher_task, _tracking_task
+        
+        try:
+            await _drain_writes()
+        except Exception as e:
+            logger.error(f"Error draining cache writes: {e}")
+        
+        if _flusher_task is not None:
+            _flusher_task.cancel()
+            _flusher_task = None
+        
+        if _tracking_task is not None:
+            _tracking_task.cancel()
+            _tracking_task = None
+        
+        await redis_client.aclose()
+        await redis_pool.disconnect()
+
+
+# Caché semántica: similitud mínima, vida y número de preguntas guardadas por contexto
+_SEMANTIC_THRESHOLD = settings.CACHE.SEMANTIC_CACHE_THRESHOLD
+_SEMANTIC_TTL = settings.CACHE.SEMANTIC_CACHE_TTL
+_SEMANTIC_ENTRIES = settings.CACHE.SEMANTIC_CACHE_ENTRIES
+
+
+def _unit_vector(embedding: List[float]) -> array.array:
+    """Normaliza un embedding a norma 1 (float32), de modo que el coseno es el producto escalar"""
+    norm = math.sqrt(sum(x * x for x in embedding)) or 1.0
+    return array.array("f", (x / norm for x in embedding))
+
+
+class SemanticCache:
+    """
+    Caché de respuestas de la IA por similitud semántica. Cada contexto (scope:
+    esquema, consulta SQL, resultados...) guarda en Redis una lista acotada de
+    preguntas ya respondidas con su embedding; una pregunta nueva reutiliza la
+    respuesta de la más parecida si supera el umbral de similitud.
+    """
+    
+    @staticmethod
+    def _key(tag: str, scope: Any) -> str:
+        """Clave Redis de la lista de entradas de un contexto"""
+        return Cache.generate_key(f"semantic:{tag}", scope)
+    
+    @staticmethod
+    def _exact_key(tag: str, scope: Any, text: str) -> str:
+        """Clave Redis de la respuesta a una pregunta exacta en un contexto"""
+        return Cache.generate_key(f"semantic-exact:{tag}", scope, text)
+    
+    @staticmethod
+    async def lookup(
+        tag: str,
+        scope: Any,
+        text: str,
+        embed: Callable[[str], Awaitable[List[float]]]
+    ) -> Tuple[Any, Optional[array.array]]:
+        """
+        Busca la respuesta de una pregunta parecida hecha en el mismo contexto.
+        Primero prueba la pregunta exacta, que no necesita calcular el embedding.
+        
+        Args:
+            tag: Tipo de respuesta (versiona las entradas)
+            scope: Contexto en el que la respuesta es válida
+            text: Pregunta del usuario
+            embed: Función asíncrona que calcula el embedding de un texto
+            
+        Returns:
+            Tupla (respuesta o None, embedding normalizado de la pregunta o
+            None si no se calculó), para guardarla después con store
+        """
+        if not _ENABLE_CACHE:
+            return None, None
+        
+        # Pregunta idéntica: una lectura, sin llamada de embedding
+        try:
+            value = _deserialize(await redis_client.get(SemanticCache._exact_key(tag, scope, text)))
+            if value is not None:
+                return value, None
+        except Exception as e:
+            logger.error(f"Error getting semantic cache: {e}")
+        
+        try:
+            vector = _unit_vector(await embed(text))
+        except Exception as e:
+            logger.error(f"Error computing embedding: {e}")
+            return None, None
+        
+        try:
+            entries = await redis_client.lrange(SemanticCache._key(tag, scope), 0, -1)
+        except Exception as e:
+            logger.error(f"Error getting semantic cache: {e}")
+            return None, vector
+        
+        best_score, best_value = _SEMANTIC_THRESHOLD, None
+        for entry in entries:
+            try:
+                embedding_bytes, value = _DEC.decode(entry)
+            except Exception:
+                continue
+            cached = array.array("f")
+            cached.frombytes(embedding_bytes)
+            if len(cached) != len(vector):
+                continue
+            score = sum(map(operator.mul, vector, cached))
+            if score >= best_score:
+                best_score, best_value = score, value
+        
+        return best_value, vector
+    
+    @staticmethod
+    async def store(
+        tag: str,
+        scope: Any,
+        text: str,
+        vector: Optional[array.array],
+        value: Any,
+        ttl: Optional[int] = None
+    ) -> bool:
+        """
+        Guarda la respuesta de una pregunta: la entrada exacta y, si hay
+        embedding, la entrada en la lista de su contexto, en una sola
+        transacción (MULTI/EXEC).
+        
+        Args:
+            tag: Tipo de respuesta (versiona las entradas)
+            scope: Contexto en el que la respuesta es válida
+            text: Pregunta del usuario
+            vector: Embedding normalizado devuelto por lookup (o None)
+            value: Respuesta a guardar
+            ttl: Tiempo de vida en segundos (opcional)
+            
+        Returns:
+            True si se guardó, False en caso contrario
+        """
+        if not _ENABLE_CACHE or value is None:
+            return False
+        
+        ttl = ttl if ttl is not None else _SEMANTIC_TTL
+        key = SemanticCache._key(tag, scope)
+        try:
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.set(SemanticCache._exact_key(tag, scope, text), _serialize(value), ex=ttl)
+                if vector is not None:
+                    pipe.lpush(key, _ENC.encode((vector.tobytes(), value)))
+                    pipe.ltrim(key, 0, _SEMANTIC_ENTRIES - 1)
+                    pipe.expire(key, ttl)
+                await pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error setting semantic cache: {e}")
+            return False
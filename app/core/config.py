@@ -1,103 +1,155 @@
-from pydantic import BaseModel, Field
+from dataclasses import dataclass, field
 import os
 from dotenv import load_dotenv
-from typing import List, Dict, Optional, Any
+from functools import lru_cache
+from typing import List, Dict, Optional, Any, Tuple, FrozenSet
 
 # Cargar variables de entorno
 load_dotenv()
 
+# Instantánea de las variables de entorno, leída una sola vez al importar
+_ENV: Dict[str, str] = dict(os.environ)
+
+# Valores de entorno que se interpretan como verdadero
+_TRUE = frozenset({"true", "1", "yes", "y", "on", "t"})
+
+def _envbool(name: str, default: bool = False) -> bool:
+    """Lee una variable de entorno booleana; si no está definida devuelve default"""
+    value = _ENV.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in _TRUE
+
 def get_cors_origins() -> List[str]:
     """Obtiene los CORS origins desde variables de entorno"""
-    cors_origins = os.environ.get("CORS_ORIGINS", "*")
+    cors_origins = _ENV.get("CORS_ORIGINS", "*")
     if cors_origins == "*":
         return ["*"]
     return [origin.strip() for origin in cors_origins.split(",") if origin.strip()]
 
-class SecuritySettings(BaseModel):
-    SECRET_KEY: str = os.environ.get("SECRET_KEY", "insecure-secret-key-for-dev")
-    TOKEN_EXPIRATION_MINUTES: int = int(os.environ.get("TOKEN_EXPIRATION_MINUTES", "30"))
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+_CORS_ORIGINS: Tuple[str, ...] = tuple(get_cors_origins())
+
+@dataclass(slots=True, frozen=True)
+class SecuritySettings:
+    SECRET_KEY: str = _ENV.get("SECRET_KEY", "insecure-secret-key-for-dev")
+    TOKEN_EXPIRATION_MINUTES: int = int(_ENV.get("TOKEN_EXPIRATION_MINUTES", "30"))
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = int(_ENV.get("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
     ALGORITHM: str = "HS256"
     API_KEY_NAME: str = "X-API-Key"
-    CORS_ORIGINS: List[str] = Field(default_factory=get_cors_origins)
-
-class SSOSettings(BaseModel):
-    ENABLED: bool = Field(bool(os.getenv("SSO_ENABLED", "True")))
-    GLOBODAIN_SSO_URL: str = Field(os.getenv("GLOBODAIN_SSO_URL"))
-    GLOBODAIN_CLIENT_ID: str = Field(os.getenv("GLOBODAIN_CLIENT_ID"))
-    GLOBODAIN_CLIENT_SECRET: str = Field(os.getenv("GLOBODAIN_CLIENT_SECRET"))
-    GLOBODAIN_REDIRECT_URI: str = Field(os.getenv("GLOBODAIN_REDIRECT_URI"))
-    GLOBODAIN_SUCCESS_REDIRECT: str = Field(os.getenv("GLOBODAIN_SUCCESS_REDIRECT"))
+    CORS_ORIGINS: Tuple[str, ...] = _CORS_ORIGINS
+
+@dataclass(slots=True, frozen=True)
+class SSOSettings:
+    ENABLED: bool = _envbool("SSO_ENABLED", True)
+    GLOBODAIN_SSO_URL: Optional[str] = _ENV.get("GLOBODAIN_SSO_URL")
+    GLOBODAIN_CLIENT_ID: Optional[str] = _ENV.get("GLOBODAIN_CLIENT_ID")
+    GLOBODAIN_CLIENT_SECRET: Optional[str] = _ENV.get("GLOBODAIN_CLIENT_SECRET")
+    GLOBODAIN_REDIRECT_URI: Optional[str] = _ENV.get("GLOBODAIN_REDIRECT_URI")
+    GLOBODAIN_SUCCESS_REDIRECT: Optional[str] = _ENV.get("GLOBODAIN_SUCCESS_REDIRECT")
     
-    VALIDATION_URL: str = Field(os.getenv("SSO_VALIDATION_URL", "http://localhost:8000/api/auth/validate-token"))
-    CLIENT_ID: str = Field(os.getenv("SSO_CLIENT_ID", ""))
-    REDIRECT_URI: str = Field(os.getenv("SSO_REDIRECT_URI", ""))
-
-class MongoDBSettings(BaseModel):
-    MONGODB_URL: str = os.environ.get("MONGODB_URL", "mongodb://localhost:27017")
-    MONGODB_DB_NAME: str = os.environ.get("MONGODB_DB_NAME", "corebrain")
-    MAX_CONNECTIONS: int = int(os.environ.get("MONGODB_MAX_CONNECTIONS", "10"))
-    MIN_CONNECTIONS: int = int(os.environ.get("MONGODB_MIN_CONNECTIONS", "1"))
-    CONNECTION_TIMEOUT: int = int(os.environ.get("MONGODB_CONNECTION_TIMEOUT", "5000"))
-
-class AnthropicSettings(BaseModel):
-    ANTHROPIC_API_KEY: str = os.environ.get("ANTHROPIC_API_KEY", "")
+    VALIDATION_URL: str = _ENV.get("SSO_VALIDATION_URL", "http://localhost:8000/api/auth/validate-token")
+    CLIENT_ID: str = _ENV.get("SSO_CLIENT_ID", "")
+    REDIRECT_URI: str = _ENV.get("SSO_REDIRECT_URI", "")
+
+@dataclass(slots=True, frozen=True)
+class MongoDBSettings:
+    MONGODB_URL: str = _ENV.get("MONGODB_URL", "mongodb://localhost:27017")
+    MONGODB_DB_NAME: str = _ENV.get("MONGODB_DB_NAME", "corebrain")
+    MAX_CONNECTIONS: int = int(_ENV.get("MONGODB_MAX_CONNECTIONS", "10"))
+    MIN_CONNECTIONS: int = int(_ENV.get("MONGODB_MIN_CONNECTIONS", "1"))
+    CONNECTION_TIMEOUT: int = int(_ENV.get("MONGODB_CONNECTION_TIMEOUT", "5000"))
+
+@dataclass(slots=True, frozen=True)
+class AnthropicSettings:
+    ANTHROPIC_API_KEY: str = _ENV.get("ANTHROPIC_API_KEY", "")
     # Cheapest models
-    ANTHROPIC_MODEL: str = os.environ.get("ANTHROPIC_MODEL", "claude-3-haiku-20240307")
+    ANTHROPIC_MODEL: str = _ENV.get("ANTHROPIC_MODEL", "claude-3-haiku-20240307")
     # Tokens limit
-    MAX_TOKENS: int = int(os.environ.get("MAX_TOKENS", "512"))
-    TEMPERATURE: float = float(os.environ.get("TEMPERATURE", "0.7"))
-
-class OpenAISettings(BaseModel):
-    OPENAI_API_KEY: str = os.environ.get("OPENAI_API_KEY", "")
-    OPENAI_MODEL: str = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
-    MAX_TOKENS: int = int(os.environ.get("MAX_TOKENS", "512"))
-    TEMPERATURE: float = float(os.environ.get("TEMPERATURE", "0.7"))
-
-class CacheSettings(BaseModel):
-    REDIS_URL: str = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
-    CACHE_TTL: int = int(os.environ.get("CACHE_TTL", "3600"))
-    ENABLE_CACHE: bool = os.environ.get("ENABLE_CACHE", "True").lower() in ("true", "1", "yes")
-
-class RateLimitSettings(BaseModel):
-    REQUESTS_PER_MINUTE: int = int(os.environ.get("REQUESTS_PER_MINUTE", "60"))
-    BURST_SIZE: int = int(os.environ.get("BURST_SIZE", "5"))
-    ENABLE_RATE_LIMIT: bool = os.environ.get("ENABLE_RATE_LIMIT", "True").lower() in ("true", "1", "yes")
-
-class Settings(BaseModel):
+    MAX_TOKENS: int = int(_ENV.get("MAX_TOKENS", "512"))
+    TEMPERATURE: float = float(_ENV.get("TEMPERATURE", "0.7"))
+
+@dataclass(slots=True, frozen=True)
+class OpenAISettings:
+    OPENAI_API_KEY: str = _ENV.get("OPENAI_API_KEY", "")
+    OPENAI_MODEL: str = _ENV.get("OPENAI_MODEL", "gpt-4o-mini")
+    # Modelo para la identificación de colecciones (tarea de clasificación)
+    OPENAI_MODEL_CLASSIFIER: str = _ENV.get("OPENAI_MODEL_CLASSIFIER", "gpt-4o-mini")
+    # Modelo de embeddings de la caché semántica
+    EMBEDDING_MODEL: str = _ENV.get("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+    MAX_TOKENS: int = int(_ENV.get("MAX_TOKENS", "512"))
+    TEMPERATURE: float = float(_ENV.get("TEMPERATURE", "0.7"))
+    # Agrupación de consultas de colecciones concurrentes: tamaño máximo y espera (1 la desactiva)
+    COLLECTIONS_BATCH_SIZE: int = int(_ENV.get("COLLECTIONS_BATCH_SIZE", "8"))
+    COLLECTIONS_BATCH_LATENCY_MS: int = int(_ENV.get("COLLECTIONS_BATCH_LATENCY_MS", "50"))
+
+@dataclass(slots=True, frozen=True)
+class CacheSettings:
+    REDIS_URL: str = _ENV.get("REDIS_URL", "redis://localhost:6379/0")
+    REDIS_POOL_SIZE: int = int(_ENV.get("REDIS_POOL_SIZE", str(max(32, 2 * (os.cpu_count() or 1)))))
+    CACHE_TTL: int = int(_ENV.get("CACHE_TTL", "3600"))
+    ENABLE_CACHE: bool = _envbool("ENABLE_CACHE", True)
+    # Algoritmo para las claves de caché: "blake3" o "md5" (compatibilidad con claves antiguas)
+    CACHE_KEY_HASH: str = _ENV.get("CACHE_KEY_HASH", "blake3").lower()
+    # Entradas de la caché local invalidada por Redis (0 la desactiva)
+    CACHE_LOCAL_SIZE: int = int(_ENV.get("CACHE_LOCAL_SIZE", "4096"))
+    # Espacios de nombres de clave que usan la caché local (se registran como PREFIX del tracking) y vida de sus entradas
+    CACHE_LOCAL_PREFIXES: Tuple[str, ...] = tuple(
+        prefix.strip() for prefix in _ENV.get("CACHE_LOCAL_PREFIXES", "api_key,db_info,sql_schema").split(",") if prefix.strip()
+    )
+    CACHE_LOCAL_TTL: int = int(_ENV.get("CACHE_LOCAL_TTL", "30"))
+    # Caché semántica de respuestas de OpenAI: similitud mínima, vida y entradas por contexto
+    SEMANTIC_CACHE_THRESHOLD: float = float(_ENV.get("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+    SEMANTIC_CACHE_TTL: int = int(_ENV.get("SEMANTIC_CACHE_TTL", str(7 * 24 * 3600)))
+    SEMANTIC_CACHE_ENTRIES: int = int(_ENV.get("SEMANTIC_CACHE_ENTRIES", "64"))
+
+@dataclass(slots=True, frozen=True)
+class RateLimitSettings:
+    REQUESTS_PER_MINUTE: int = int(_ENV.get("REQUESTS_PER_MINUTE", "60"))
+    BURST_SIZE: int = int(_ENV.get("BURST_SIZE", "5"))
+    ENABLE_RATE_LIMIT: bool = _envbool("ENABLE_RATE_LIMIT", True)
+
+@dataclass(slots=True, frozen=True)
+class Settings:
     # Meta
     APP_NAME: str = "Corebrain API"
-    APP_URL: str = os.environ.get("APP_URL", "http://localhost:8080")
+    APP_URL: str = _ENV.get("APP_URL", "http://localhost:8080")
     API_V1_STR: str = "/api"
-    DEBUG: bool = os.environ.get("DEBUG", "False").lower() in ("true", "1", "yes")
-    ENVIRONMENT: str = os.environ.get("ENVIRONMENT", "development")
+    DEBUG: bool = _envbool("DEBUG")
+    ENVIRONMENT: str = _ENV.get("ENVIRONMENT", "development")
     
     # Componentes
-    SECURITY: SecuritySettings = SecuritySettings()
-    SSO: SSOSettings = SSOSettings()
-    MONGODB: MongoDBSettings = MongoDBSettings()
-    ANTHROPIC: AnthropicSettings = AnthropicSettings()
-    OPENAI: OpenAISettings = OpenAISettings()
-    CACHE: CacheSettings = CacheSettings()
-    RATE_LIMIT: RateLimitSettings = RateLimitSettings()
+    SECURITY: SecuritySettings = field(default_factory=SecuritySettings)
+    SSO: SSOSettings = field(default_factory=SSOSettings)
+    MONGODB: MongoDBSettings = field(default_factory=MongoDBSettings)
+    ANTHROPIC: AnthropicSettings = field(default_factory=AnthropicSettings)
+    OPENAI: OpenAISettings = field(default_factory=OpenAISettings)
+    CACHE: CacheSettings = field(default_factory=CacheSettings)
+    RATE_LIMIT: RateLimitSettings = field(default_factory=RateLimitSettings)
     
     # Niveles de acceso para API keys
-    API_KEY_PERMISSION_LEVELS: Dict[str, List[str]] = {
-        "read": ["read"],
-        "write": ["read", "write"],
-        "admin": ["read", "write", "admin"]
-    }
+    API_KEY_PERMISSION_LEVELS: Dict[str, FrozenSet[str]] = field(default_factory=lambda: {
+        "read": frozenset({"read"}),
+        "write": frozenset({"read", "write"}),
+        "admin": frozenset({"read", "write", "admin"})
+    })
+    
+    # Colecciones permitidas por nivel de acceso ("*" es un comodín que se comprueba antes)
+    COLLECTION_ACCESS: Dict[str, FrozenSet[str]] = field(default_factory=lambda: {
+        "read": frozenset({"products", "categories", "public_info"}),
+        "write": frozenset({"products", "categories", "orders", "public_info"}),
+        "admin": frozenset({"*"})  # Acceso a todas las colecciones
+    })
     
-    # Colecciones permitidas por nivel de acceso
-    COLLECTION_ACCESS: Dict[str, List[str]] = {
-        "read": ["products", "categories", "public_info"],
-        "write": ["products", "categories", "orders", "public_info"],
-        "admin": ["*"]  # Acceso a todas las colecciones
-    }
+    def __post_init__(self):
+        # Normalizar a frozenset aunque se pasen listas al construir la configuración
+        for name in ("API_KEY_PERMISSION_LEVELS", "COLLECTION_ACCESS"):
+            levels = getattr(self, name)
+            object.__setattr__(self, name, {level: frozenset(values) for level, values in levels.items()})
 
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Devuelve la instancia de configuración, construida una sola vez"""
+    return Settings()
 
 # Crear instancia global de configuración
-settings = Settings()
\ No newline at end of file
+settings = get_settings()
\ No newline at end of file
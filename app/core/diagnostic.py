@@ -1,22 +1,110 @@
-from typing import Dict, Any, List
-import json
+from typing import Dict, Any, List, Optional, Tuple
+from functools import partial
+from pydantic import BaseModel
+from pymongo.errors import ConnectionFailure, OperationFailure
+import asyncio
+import logging
+import time
+
+from app.core.logging import logger, to_json
+
+# Operaciones admitidas por execute_mongodb_query
+_VALID_OPERATIONS = frozenset(("find", "aggregate"))
+
+# Atributos de una consulta que se registran en log_mongodb_query_details
+_QUERY_ATTRS = ("operation", "query", "pipeline", "projection", "sort", "limit", "skip")
+
+# Código de error de MongoDB para colecciones inexistentes
+_NAMESPACE_NOT_FOUND = 26
+
+# Caché de nombres de colecciones por base de datos: clave -> (expira_en, colecciones)
+_COLLECTIONS_TTL = 30
+_collections_cache: Dict[Tuple[Any, str], Tuple[float, List[str]]] = {}
+
+# Caché de diagnósticos recientes: (base de datos, colección) -> (expira_en, diagnóstico)
+_DIAG_TTL = 5
+_DIAG_CACHE_MAX = 256
+_diag_cache: Dict[Tuple[Any, Optional[str]], Tuple[float, Dict[str, Any]]] = {}
+
+
+def _db_cache_key(db_connection) -> Tuple[Any, str]:
+    """Identifica una base de datos por los nodos de su cliente y su nombre"""
+    client = getattr(db_connection, "client", None)
+    nodes = getattr(client, "nodes", None) if client is not None else None
+    return (nodes or id(client), getattr(db_connection, "name", ""))
+
+
+def _known_collections(db_connection) -> Optional[List[str]]:
+    """Devuelve los nombres de colecciones en caché si siguen vigentes, sin consultar la BD"""
+    cached = _collections_cache.get(_db_cache_key(db_connection))
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
+
+async def _cached_collections(db_connection, refresh: bool = False) -> List[str]:
+    """
+    Devuelve los nombres de las colecciones de una base de datos, reutilizando
+    el resultado durante _COLLECTIONS_TTL segundos.
+    
+    Args:
+        db_connection: Conexión a la base de datos MongoDB
+        refresh: Si es True, consulta la base de datos aunque haya un listado en caché
+        
+    Returns:
+        Lista de nombres de colecciones
+    """
+    key = _db_cache_key(db_connection)
+    now = time.monotonic()
+    
+    cached = _collections_cache.get(key)
+    if not refresh and cached is not None and cached[0] > now:
+        return cached[1]
+    
+    collections = await db_connection.list_collection_names()
+    _collections_cache[key] = (now + _COLLECTIONS_TTL, collections)
+    return collections
+
+
+# Etapas que transforman cada documento sin alterar cuántos hay ni su orden:
+# un $limit puede adelantarse por delante de ellas sin cambiar el resultado
+_ONE_TO_ONE_STAGES = frozenset({
+    "$project", "$addFields", "$set", "$unset", "$replaceRoot", "$replaceWith"
+})
+
+# Etapas que find() puede expresar, en el orden en que find() las aplica
+_FIND_STAGE_ORDER = {"$match": 0, "$sort": 1, "$skip": 2, "$limit": 3, "$project": 4}
 
-from app.core.logging import logger
 
 class Diagnostic:
 
     @staticmethod
-    def debug_mongodb_connection(db_connection, collection_name: str = None) -> Dict[str, Any]:
+    async def debug_mongodb_connection(
+        db_connection,
+        collection_name: str = None,
+        require_connected: bool = False
+    ) -> Dict[str, Any]:
         """
         Función para diagnosticar problemas de conexión con MongoDB.
         
         Args:
             db_connection: Conexión a MongoDB
             collection_name: Nombre de una colección específica a probar
+            require_connected: Si es True, solo se reutiliza un diagnóstico
+                reciente cuando la conexión estaba activa; si no, se repite
             
         Returns:
             Diccionario con información de diagnóstico
         """
+        # Reutilizar un diagnóstico reciente para no multiplicar la carga en ráfagas de errores
+        cache_key = (_db_cache_key(db_connection), collection_name)
+        now = time.monotonic()
+        cached = _diag_cache.get(cache_key)
+        if cached is not None and cached[0] > now and (
+            not require_connected or cached[1].get("connection_status") == "connected"
+        ):
+            return cached[1]
+        
         debug_info = {
             "connection_status": "unknown",
             "available_collections": [],
@@ -24,57 +112,92 @@ class Diagnostic:
             "errors": []
         }
         
-        try:
-            # Verificar si la conexión está activa
-            server_info = db_connection.command("serverStatus")
+        # Lanzar todas las comprobaciones a la vez: un único round-trip en lugar de varios
+        checks = [
+            db_connection.command("serverStatus"),
+            _cached_collections(db_connection)
+        ]
+        # Estadísticas y muestra en la misma ronda, salvo que ya se sepa que la
+        # colección no existe (caso habitual al diagnosticar un nombre erróneo)
+        known = _known_collections(db_connection)
+        with_details = bool(collection_name) and (known is None or collection_name in known)
+        if with_details:
+            checks.append(db_connection.command("collStats", collection_name))
+            checks.append(db_connection[collection_name].find_one())
+        
+        results = await asyncio.gather(*checks, return_exceptions=True)
+        server_info, collections = results[0], results[1]
+        
+        if isinstance(server_info, Exception):
+            debug_info["connection_status"] = "error"
+            debug_info["errors"].append(f"Error de conexión: {str(server_info)}")
+        else:
             debug_info["connection_status"] = "connected"
             debug_info["server_version"] = server_info.get("version", "unknown")
             
-            # Obtener listado de colecciones
-            try:
-                collections = db_connection.list_collection_names()
+            if isinstance(collections, Exception):
+                debug_info["errors"].append(f"Error al obtener colecciones: {str(collections)}")
+            else:
                 debug_info["available_collections"] = collections
                 
                 # Si se especificó una colección, verificar que exista
                 if collection_name:
+                    if collection_name in collections and not with_details:
+                        # La caché estaba desfasada: obtener los detalles ahora
+                        results[2:] = await asyncio.gather(
+                            db_connection.command("collStats", collection_name),
+                            db_connection[collection_name].find_one(),
+                            return_exceptions=True
+                        )
+                    
                     if collection_name in collections:
+                        stats, sample = results[2], results[3]
                         debug_info["collection_found"] = True
                         
-                        # Obtener estadísticas de la colección
-                        stats = db_connection.command("collStats", collection_name)
-                        debug_info["collection_stats"] = {
-                            "document_count": stats.get("count", 0),
-                            "size_bytes": stats.get("size", 0),
-                            "avg_document_size": stats.get("avgObjSize", 0)
-                        }
+                        # Estadísticas de la colección
+                        if isinstance(stats, Exception):
+                            debug_info["errors"].append(f"Error al obtener estadísticas: {str(stats)}")
+                        else:
+                            debug_info["collection_stats"] = {
+                                "document_count": stats.get("count", 0),
+                                "size_bytes": stats.get("size", 0),
+                                "avg_document_size": stats.get("avgObjSize", 0)
+                            }
                         
-                        # Obtener documento de muestra
-                        try:
-                            sample = db_connection[collection_name].find_one()
-                            if sample:
-                                # Convertir ObjectId a string para serialización
-                                sample_serializable = {}
-                                for key, value in sample.items():
-                                    if key == "_id" and hasattr(value, "__str__"):
-                                        sample_serializable[key] = str(value)
-                                    else:
-                                        sample_serializable[key] = value
-                                
-                                debug_info["sample_document"] = sample_serializable
-                        except Exception as e:
-                            debug_info["errors"].append(f"Error al obtener documento de muestra: {str(e)}")
+                        # Documento de muestra
+                        if isinstance(sample, Exception):
+                            debug_info["errors"].append(f"Error al obtener documento de muestra: {str(sample)}")
+                        elif sample:
+                            # Convertir ObjectId a string para serialización (el
+                            # documento es una copia local y se modifica in situ)
+                            if "_id" in sample:
+                                sample["_id"] = str(sample["_id"])
+                            
+                            debug_info["sample_document"] = sample
                     else:
                         debug_info["collection_found"] = False
                         debug_info["errors"].append(f"La colección '{collection_name}' no existe en la base de datos")
-            except Exception as e:
-                debug_info["errors"].append(f"Error al obtener colecciones: {str(e)}")
         
-        except Exception as e:
-            debug_info["connection_status"] = "error"
-            debug_info["errors"].append(f"Error de conexión: {str(e)}")
+        if len(_diag_cache) >= _DIAG_CACHE_MAX:
+            _diag_cache.clear()
+        _diag_cache[cache_key] = (now + _DIAG_TTL, debug_info)
         
         return debug_info
 
+    @staticmethod
+    def invalidate_mongodb_connection(db_connection) -> None:
+        """
+        Descarta los diagnósticos y nombres de colecciones en caché de una base
+        de datos, para que la siguiente comprobación consulte el servidor.
+        
+        Args:
+            db_connection: Conexión a MongoDB
+        """
+        db_key = _db_cache_key(db_connection)
+        _collections_cache.pop(db_key, None)
+        for key in [key for key in _diag_cache if key[0] == db_key]:
+            del _diag_cache[key]
+
     def log_mongodb_query_details(query: Dict[str, Any], collection_name: str) -> None:
         """
         Registra detalles de una consulta MongoDB para depuración.
@@ -83,44 +206,155 @@ class Diagnostic:
             query: Consulta MongoDB (diccionario o modelo)
             collection_name: Nombre de la colección
         """
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        
         # Convertir query a diccionario si no lo es
         query_dict = {}
         if isinstance(query, dict):
             query_dict = query
         else:
-            # Intentar convertir a diccionario si es modelo Pydantic
             try:
-                if hasattr(query, "model_dump"):
+                if isinstance(query, BaseModel):
+                    # Modelos Pydantic (MongoDBQuery incluido): un único volcado
                     query_dict = query.model_dump()
-                elif hasattr(query, "dict"):
-                    query_dict = query.dict()
                 else:
                     # Intentar extraer atributos manualmente
-                    for attr in ["operation", "query", "pipeline", "projection", "sort", "limit", "skip"]:
-                        if hasattr(query, attr):
-                            query_dict[attr] = getattr(query, attr)
+                    query_dict = {
+                        attr: value for attr in _QUERY_ATTRS
+                        if (value := getattr(query, attr, None)) is not None
+                    }
             except Exception as e:
                 logger.error(f"Error al convertir query a diccionario: {str(e)}")
                 query_dict = {"error": "No se pudo convertir la consulta a formato imprimible"}
         
-        # Registrar detalles de la consulta
-        logger.info(f"Ejecutando consulta MongoDB en colección: {collection_name}")
-        logger.info(f"Tipo de operación: {query_dict.get('operation', 'desconocido')}")
+        # Registrar todos los detalles de la consulta en un único mensaje
+        details = {
+            "collection": collection_name,
+            "operation": query_dict.get("operation", "desconocido")
+        }
+        
+        # Filtros o, en su defecto, pipeline
+        if query_dict.get("query"):
+            details["query"] = query_dict["query"]
+        elif query_dict.get("pipeline"):
+            details["pipeline"] = query_dict["pipeline"]
+        
+        for field in ("projection", "sort"):
+            if query_dict.get(field):
+                details[field] = query_dict[field]
+        
+        details["limit"] = query_dict.get("limit", "no especificado")
+        details["skip"] = query_dict.get("skip", "no especificado")
+        
+        logger.info("Ejecutando consulta MongoDB: %s", to_json(details))
+
+
+    @staticmethod
+    def _optimize_pipeline(pipeline: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+        """
+        Reescribe un pipeline de agregación para que MongoDB pueda usar índices:
+        fusiona los $match iniciales en uno solo y, si el pipeline no tiene
+        $limit, lo coloca justo después del bloque inicial $match/$sort cuando
+        el resto de etapas no cambia el número de documentos (o al final si no).
+        
+        Args:
+            pipeline: Pipeline original (no se modifica)
+            limit: Límite de resultados a aplicar
+            
+        Returns:
+            Nuevo pipeline optimizado
+        """
+        stages = list(pipeline)
+        
+        # 1. Fusionar los $match consecutivos del principio con $and
+        filters = []
+        head = 0
+        while head < len(stages) and len(stages[head]) == 1 and "$match" in stages[head]:
+            if stages[head]["$match"]:
+                filters.append(stages[head]["$match"])
+            head += 1
+        
+        optimized = []
+        if len(filters) == 1:
+            optimized.append({"$match": filters[0]})
+        elif filters:
+            optimized.append({"$match": {"$and": filters}})
         
-        if "query" in query_dict and query_dict["query"]:
-            logger.info(f"Filtros: {json.dumps(query_dict['query'], default=str)}")
-        elif "pipeline" in query_dict and query_dict["pipeline"]:
-            logger.info(f"Pipeline: {json.dumps(query_dict['pipeline'], default=str)}")
+        # 2. Mantener un $sort inmediatamente posterior en la cabecera
+        if head < len(stages) and len(stages[head]) == 1 and "$sort" in stages[head]:
+            optimized.append(stages[head])
+            head += 1
         
-        if "projection" in query_dict and query_dict["projection"]:
-            logger.info(f"Proyección: {json.dumps(query_dict['projection'], default=str)}")
+        # 3. Recorrer el resto una sola vez: cada etapa tiene un único operador
+        rest = stages[head:]
+        has_limit = False
+        one_to_one = True
+        for stage in rest:
+            op = next(iter(stage), None)
+            if op == "$limit":
+                has_limit = True
+                break
+            if op not in _ONE_TO_ONE_STAGES or len(stage) != 1:
+                one_to_one = False
         
-        if "sort" in query_dict and query_dict["sort"]:
-            logger.info(f"Ordenamiento: {json.dumps(query_dict['sort'], default=str)}")
+        # 4. Insertar el $limit lo antes posible sin alterar el resultado
+        if has_limit:
+            optimized.extend(rest)
+        elif one_to_one:
+            optimized.append({"$limit": limit})
+            optimized.extend(rest)
+        else:
+            optimized.extend(rest)
+            optimized.append({"$limit": limit})
         
-        logger.info(f"Límite: {query_dict.get('limit', 'no especificado')}")
-        logger.info(f"Salto: {query_dict.get('skip', 'no especificado')}")
+        return optimized
 
+    @staticmethod
+    def _pipeline_as_find(pipeline: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Convierte un pipeline simple ($match, $sort, $skip, $limit, $project en
+        ese orden) en los argumentos equivalentes de find().
+        
+        Args:
+            pipeline: Pipeline de agregación
+            
+        Returns:
+            Diccionario con filter, sort, skip, limit y projection, o None si el
+            pipeline no puede expresarse como find()
+        """
+        filters = []
+        find_args = {"filter": {}, "sort": None, "skip": 0, "limit": None, "projection": None}
+        last_rank = 0
+        
+        for stage in pipeline:
+            if len(stage) != 1:
+                return None
+            name, value = next(iter(stage.items()))
+            rank = _FIND_STAGE_ORDER.get(name)
+            # El orden de las etapas debe coincidir con el que aplica find()
+            if rank is None or rank < last_rank or (rank == last_rank and name != "$match"):
+                return None
+            last_rank = rank
+            
+            if name == "$match":
+                if value:
+                    filters.append(value)
+            elif name == "$sort":
+                find_args["sort"] = value
+            elif name == "$skip":
+                find_args["skip"] = value
+            elif name == "$limit":
+                find_args["limit"] = value
+            else:
+                find_args["projection"] = value
+        
+        if len(filters) == 1:
+            find_args["filter"] = filters[0]
+        elif filters:
+            find_args["filter"] = {"$and": filters}
+        
+        return find_args
 
     async def execute_mongodb_query(
         db_connection, 
@@ -138,32 +372,22 @@ class Diagnostic:
         Returns:
             Lista de resultados
         """
-        # Extraer parámetros de la consulta de manera segura
-        collection_name = getattr(mongo_query, "collection", None)
-        operation = getattr(mongo_query, "operation", None)
-        query_filter = getattr(mongo_query, "query", {})
-        projection = getattr(mongo_query, "projection", None)
-        sort = getattr(mongo_query, "sort", None)
-        limit = getattr(mongo_query, "limit", 10)
-        skip = getattr(mongo_query, "skip", 0)
-        pipeline = getattr(mongo_query, "pipeline", [])
-        
-        # Si mongo_query es un diccionario, obtener valores directamente
-        if isinstance(mongo_query, dict):
-            collection_name = mongo_query.get("collection", collection_name)
-            operation = mongo_query.get("operation", operation)
-            query_filter = mongo_query.get("query", query_filter)
-            projection = mongo_query.get("projection", projection)
-            sort = mongo_query.get("sort", sort)
-            limit = mongo_query.get("limit", limit or 10)
-            skip = mongo_query.get("skip", skip or 0)
-            pipeline = mongo_query.get("pipeline", pipeline)
+        # Extraer parámetros de la consulta de manera segura (diccionario u objeto)
+        get = mongo_query.get if isinstance(mongo_query, dict) else partial(getattr, mongo_query)
+        collection_name = get("collection", None)
+        operation = get("operation", None)
+        query_filter = get("query", {})
+        projection = get("projection", None)
+        sort = get("sort", None)
+        limit = get("limit", 10)
+        skip = get("skip", 0)
+        pipeline = get("pipeline", [])
         
         # Validar parámetros
         if not collection_name:
             raise ValueError("Nombre de colección no especificado")
         
-        if not operation or operation not in ["find", "aggregate"]:
+        if operation not in _VALID_OPERATIONS:
             logger.warning(f"Operación '{operation}' no válida, usando 'find' como predeterminado")
             operation = "find"
         
@@ -171,28 +395,30 @@ class Diagnostic:
         if not limit or limit > max_results:
             limit = max_results
         
-        # Registrar detalles para depuración
-        Diagnostic.log_mongodb_query_details(mongo_query, collection_name)
+        # Registrar detalles para depuración (solo si el nivel INFO está activo)
+        if logger.isEnabledFor(logging.INFO):
+            Diagnostic.log_mongodb_query_details(mongo_query, collection_name)
         
-        # Ejecutar la consulta
-        try:
-            # Obtener referencia a la colección
-            collection = db_connection[collection_name]
-            
-            # Verificar que la colección existe
-            if collection_name not in await db_connection.list_collection_names():
-                logger.warning(f"La colección '{collection_name}' no existe en la base de datos")
-                # Intentar encontrar una colección alternativa
-                collections = await db_connection.list_collection_names()
-                if collections:
-                    alternative = collections[0]
-                    logger.info(f"Usando colección alternativa: {alternative}")
-                    collection = db_connection[alternative]
-                else:
-                    return []
-            
-            results = []
+        if operation == "aggregate":
+            # Optimizar el pipeline y asegurar que tiene un límite
+            pipeline = Diagnostic._optimize_pipeline(pipeline or [], limit)
             
+            # Los pipelines simples se ejecutan como find(), que usa índices
+            # con menos coste de planificación
+            find_args = Diagnostic._pipeline_as_find(pipeline)
+            if find_args is not None:
+                operation = "find"
+                query_filter = find_args["filter"]
+                sort = find_args["sort"]
+                skip = find_args["skip"]
+                projection = find_args["projection"]
+                if find_args["limit"] is not None:
+                    limit = min(limit, find_args["limit"])
+        
+        # Tamaño de lote: todos los resultados en un único round-trip
+        batch_size = min(limit, 1000)
+        
+        async def run_query(collection) -> List[Dict[str, Any]]:
             if operation == "find":
                 # Preparar cursor para find
                 cursor = collection.find(
@@ -209,41 +435,72 @@ class Diagnostic:
                     else:
                         cursor = cursor.sort(sort)
                 
-                # Aplicar skip y limit
-                cursor = cursor.skip(skip).limit(limit)
-                
-                # Convertir cursor a lista
-                async for document in cursor:
-                    results.append(document)
-                    
-            elif operation == "aggregate":
-                # Verificar y completar pipeline
-                if not pipeline:
-                    pipeline = [{"$match": {}}, {"$limit": limit}]
-                else:
-                    # Asegurar que hay un límite en el pipeline
-                    has_limit = any("$limit" in stage for stage in pipeline)
-                    if not has_limit:
-                        pipeline.append({"$limit": limit})
+                # Aplicar skip, limit y tamaño de lote
+                cursor = cursor.skip(skip).limit(limit).batch_size(batch_size)
                 
+            else:
                 # Ejecutar agregación
-                cursor = collection.aggregate(pipeline)
+                cursor = collection.aggregate(pipeline, batchSize=batch_size)
+            
+            # Convertir cursor a lista
+            return await cursor.to_list(length=limit)
+        
+        # Ejecutar la consulta
+        try:
+            # Ejecutar directamente: la existencia de la colección solo se
+            # comprueba si la consulta no devuelve nada o MongoDB la rechaza
+            try:
+                results = await run_query(db_connection[collection_name])
+                namespace_missing = False
+            except OperationFailure as e:
+                if e.code != _NAMESPACE_NOT_FOUND:
+                    raise
+                results = []
+                namespace_missing = True
+            
+            if not results:
+                # Obtener el listado una sola vez para la comprobación y la alternativa
+                collections = await _cached_collections(db_connection)
                 
-                # Convertir cursor a lista
-                async for document in cursor:
-                    results.append(document)
+                # find() sobre una colección inexistente no falla: si el listado en
+                # caché no la incluye, puede estar desfasado (colección creada
+                # después), así que se confirma con un listado nuevo antes de
+                # sustituirla por otra
+                if not namespace_missing and collection_name not in collections:
+                    collections = await _cached_collections(db_connection, refresh=True)
+                
+                if namespace_missing or collection_name not in collections:
+                    logger.warning(f"La colección '{collection_name}' no existe en la base de datos")
+                    # Intentar encontrar una colección alternativa
+                    if not collections:
+                        return []
+                    
+                    alternative = collections[0]
+                    logger.info(f"Usando colección alternativa: {alternative}")
+                    results = await run_query(db_connection[alternative])
             
             # Registrar número de resultados encontrados
             logger.info(f"Consulta MongoDB completada. Encontrados {len(results)} resultados")
             
             return results
             
-        except Exception as e:
+        except OperationFailure as e:
+            # Errores de la propia consulta (sintaxis, timeout, cursor...): la
+            # conexión funciona, así que no se lanza el diagnóstico completo
+            logger.warning(f"Consulta MongoDB rechazada (código {e.code}): {str(e)}")
+            raise
+            
+        except ConnectionFailure as e:
             logger.error(f"Error al ejecutar consulta MongoDB: {str(e)}")
             # Realizar diagnóstico de la conexión
             debug_info = await Diagnostic.debug_mongodb_connection(db_connection, collection_name)
-            logger.error(f"Diagnóstico MongoDB: {json.dumps(debug_info, default=str)}")
+            if logger.isEnabledFor(logging.ERROR):
+                logger.error("Diagnóstico MongoDB: %s", to_json(debug_info))
             
             # Re-lanzar la excepción
             raise
+            
+        except Exception as e:
+            logger.error(f"Error al ejecutar consulta MongoDB: {str(e)}")
+            raise
 
@@ -1,39 +1,126 @@
 
 import logging
 import json
+import orjson
 from datetime import datetime
 from typing import Dict, Any, Optional
-import uuid
+import secrets
+import time
 import os
+import traceback
+
+class CachedFormatter(logging.Formatter):
+    """
+    Formatter que reutiliza la parte de fecha y hora (hasta los segundos) de
+    %(asctime)s mientras no cambie el segundo, evitando localtime/strftime por
+    cada registro. La salida es idéntica a la del Formatter estándar.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._last_sec = None
+        self._last_str = ""
+    
+    def formatTime(self, record: logging.LogRecord, datefmt: Optional[str] = None) -> str:
+        sec = int(record.created)
+        if sec != self._last_sec:
+            self._last_str = time.strftime(datefmt or self.default_time_format, self.converter(sec))
+            self._last_sec = sec
+        if datefmt:
+            return self._last_str
+        return self.default_msec_format % (self._last_str, record.msecs)
 
 # Configuración básica
+_handler = logging.StreamHandler()
+_handler.setFormatter(CachedFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[_handler],
 )
 
 # Crear logger
 logger = logging.getLogger("corebrain")
 
+# Opciones de orjson para los logs: admite claves no str (int, fechas, UUID...)
+_JSON_OPTS = orjson.OPT_NON_STR_KEYS
+
+def to_json(obj: Any) -> str:
+    """
+    Serializa un objeto a JSON para los logs usando orjson. Los tipos no
+    soportados (ObjectId, Decimal...) se convierten con str().
+    """
+    try:
+        return orjson.dumps(obj, default=str, option=_JSON_OPTS).decode()
+    except TypeError:
+        # p. ej. enteros de más de 64 bits, que orjson no admite
+        return json.dumps(obj, default=str)
+
 def get_request_id() -> str:
-    """Genera un ID único para la solicitud"""
-    return str(uuid.uuid4())
+    """Genera un ID único para la solicitud (32 caracteres hexadecimales)"""
+    return secrets.token_hex(16)
+
+# Niveles de LogEntry a niveles de logging
+_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "critical": logging.CRITICAL,
+}
+
+class _LazyJson:
+    """Difiere la serialización JSON hasta que un handler formatea el mensaje"""
+    __slots__ = ("obj",)
+    
+    def __init__(self, obj: Any):
+        self.obj = obj
+    
+    def __str__(self) -> str:
+        return to_json(self.obj)
+
+class _LazyTraceback:
+    """Difiere el formateo de la traza de una excepción hasta que el log se emite"""
+    __slots__ = ("exc",)
+    
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+    
+    def __str__(self) -> str:
+        return "".join(traceback.format_exception(type(self.exc), self.exc, self.exc.__traceback__))
 
 class LogEntry:
     def __init__(self, event: str, level: str = "info"):
         self.event = event
         self.level = level
-        self.timestamp = datetime.now().isoformat()
         self.data = {}
-        self.request_id = get_request_id()
         self.user_id = None
         self.api_key_id = None
+        # El instante se captura ya; su formato y el request_id se generan al usarse
+        self._created = time.time()
+        self._request_id = None
+    
+    @property
+    def timestamp(self) -> str:
+        """Fecha de creación del log en formato ISO"""
+        return datetime.fromtimestamp(self._created).isoformat()
+    
+    @property
+    def request_id(self) -> str:
+        """ID de la solicitud, generado en el primer acceso"""
+        if self._request_id is None:
+            self._request_id = get_request_id()
+        return self._request_id
     
     def add_data(self, key: str, value: Any) -> 'LogEntry':
         """Añade datos al log"""
         self.data[key] = value
         return self
     
+    def add_traceback(self, exc: BaseException) -> 'LogEntry':
+        """Añade la traza de la excepción; solo se formatea si el log se emite"""
+        self.data["traceback"] = _LazyTraceback(exc)
+        return self
+    
     def set_user_id(self, user_id: str) -> 'LogEntry':
         """Establece el ID de usuario"""
         self.user_id = user_id
@@ -64,16 +151,8 @@ class LogEntry:
     
     def log(self) -> None:
         """Registra el log"""
-        log_dict = self.to_dict()
-        log_json = json.dumps(log_dict)
+        level = _LEVELS.get(self.level)
+        if level is None or not logger.isEnabledFor(level):
+            return
         
-        if self.level == "debug":
-            logger.debug(log_json)
-        elif self.level == "info":
-            logger.info(log_json)
-        elif self.level == "warning":
-            logger.warning(log_json)
-        elif self.level == "error":
-            logger.error(log_json)
-        elif self.level == "critical":
-            logger.critical(log_json)
\ No newline at end of file
+        logger.log(level, "%s", _LazyJson(self.to_dict()))
\ No newline at end of file
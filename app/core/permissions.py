@@ -1,14 +1,48 @@
 
-from typing import List, Optional, Set
+import logging
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Set
 from app.core.config import settings
+from app.core.logging import logger
 from fastapi import HTTPException, status
 
-class PermissionError(Exception):
-    """Excepción para errores de permisos"""
+class PermissionError(HTTPException):
+    """
+    Excepción para errores de permisos. Es una HTTPException 403, de modo que
+    FastAPI la responde directamente si ningún llamador la captura.
+    """
     def __init__(self, detail: str):
-        self.detail = detail
-        super().__init__(detail)
+        super().__init__(status_code=status.HTTP_403_FORBIDDEN, detail=detail)
+    
+    def __str__(self) -> str:
+        return self.detail
+
+_EMPTY: FrozenSet[str] = frozenset()
+
+# Permisos y colecciones por nivel, precalculados a partir de la configuración
+_PERM_SETS: Dict[str, FrozenSet[str]] = {}
+_COLL_SETS: Dict[str, FrozenSet[str]] = {}
+# Niveles con acceso a todas las colecciones ("*")
+_COLL_WILDCARD: FrozenSet[str] = _EMPTY
+
+def _build_permission_sets() -> None:
+    """Construye los conjuntos de permisos y colecciones desde settings"""
+    global _PERM_SETS, _COLL_SETS, _COLL_WILDCARD
+    _PERM_SETS = {level: frozenset(perms) for level, perms in settings.API_KEY_PERMISSION_LEVELS.items()}
+    _COLL_SETS = {level: frozenset(colls) for level, colls in settings.COLLECTION_ACCESS.items()}
+    _COLL_WILDCARD = frozenset(level for level, colls in _COLL_SETS.items() if "*" in colls)
 
+_build_permission_sets()
+
+def invalidate() -> None:
+    """
+    Recalcula los conjuntos de permisos y vacía la caché de comprobaciones.
+    Debe llamarse si se recarga la configuración.
+    """
+    _build_permission_sets()
+    check_api_key_permissions.cache_clear()
+
+@lru_cache(maxsize=1024)
 def check_api_key_permissions(
     api_key_level: str,
     required_permission: str
@@ -16,20 +50,23 @@ def check_api_key_permissions(
     """
     Verifica si una API key tiene el permiso requerido basado en su nivel
     """
-    allowed_permissions = settings.API_KEY_PERMISSION_LEVELS.get(api_key_level, [])
-    return required_permission in allowed_permissions
+    return required_permission in _PERM_SETS.get(api_key_level, _EMPTY)
 
-async def check_collection_access(
+def check_collection_access(
     api_key_level: str,
     collection_name: str
 ) -> bool:
     """
     Verifica si una API key tiene acceso a una colección específica
     """
-    print("Entra en el check collection con acceso: ", api_key_level)
-    allowed_collections = settings.COLLECTION_ACCESS.get(api_key_level, [])
-    print("Allowed collections: ", allowed_collections)
-    return "*" in allowed_collections or collection_name in allowed_collections
+    # Niveles con comodín: una única búsqueda en un conjunto
+    if api_key_level in _COLL_WILDCARD:
+        return True
+    
+    allowed_collections = _COLL_SETS.get(api_key_level, _EMPTY)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("check_collection_access level=%s allowed=%s", api_key_level, allowed_collections)
+    return collection_name in allowed_collections
 
 def verify_permissions(
     api_key_level: str,
@@ -39,7 +76,8 @@ def verify_permissions(
     """
     Verifica permisos y lanza una excepción si no son suficientes
     """
-    print("Entra al permisos: ", api_key_level, required_permission, collection_name)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("verify_permissions level=%s permission=%s collection=%s", api_key_level, required_permission, collection_name)
     # Verificar permisos generales
     if not check_api_key_permissions(api_key_level, required_permission):
         raise PermissionError(
@@ -1,17 +1,1178 @@
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Any, Optional, List, Tuple, Callable, FrozenSet, AsyncIterator
+from collections import OrderedDict
+from functools import lru_cache
+from copy import copy
+from itertools import islice
+from datetime import date, datetime
+from decimal import Decimal
+from urllib.parse import quote_plus
+from uuid import UUID
+from bson import Decimal128, ObjectId
 from langdetect import detect
+from motor.motor_asyncio import AsyncIOMotorClient
+from pydantic import BaseModel
+from pymongo import DeleteOne, InsertOne, UpdateOne
 
+import asyncio
+import hashlib
 import json
+import logging
 import re
 import time
+import httpx
 import openai
+import orjson
 
 from app.core.config import settings
-from app.core.logging import logger
+from app.core.cache import Cache, SemanticCache
+from app.core.logging import logger, to_json
 from app.core.utils import Utils
 from app.core.diagnostic import Diagnostic
 from app.models.database_query import MongoDBQuery, QueryResult
 
+# Precompiled patterns for cleaning and analyzing AI-generated queries
+_MD_FENCE_RE = re.compile(r'```(?:sql)?(.*?)```', re.DOTALL)
+_JSON_FENCE_RE = re.compile(r'```(?:json)?(.*?)```', re.DOTALL)
+_SQL_COMMENT_RE = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+_FROM_TABLE_RE = re.compile(r'from\s+([a-zA-Z0-9_\.]+)', re.IGNORECASE)
+_JOIN_TABLE_RE = re.compile(r'join\s+([a-zA-Z0-9_\.]+)', re.IGNORECASE)
+# SQL clauses and aggregate functions the result explanation looks for, found
+# in a single pass (count( is tried before a bare count)
+_SQL_FEATURE_RE = re.compile(r'\b(group\s+by|order\s+by|where|join|sum\s*\(|avg\s*\(|count\s*\(|count)', re.IGNORECASE)
+_SQL_AGGREGATION_FEATURES = frozenset({"groupby", "sum(", "avg(", "count("})
+
+# Shared OpenAI client: one connection pool reused by every request
+_client: Optional[openai.AsyncOpenAI] = None
+
+def get_openai_client() -> openai.AsyncOpenAI:
+    """Returns the shared OpenAI client, creating it on first use"""
+    global _client
+    if _client is None:
+        _client = openai.AsyncOpenAI(
+            api_key=settings.OPENAI.OPENAI_API_KEY,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30)
+            )
+        )
+    return _client
+
+async def close_openai_client() -> None:
+    """Closes the shared OpenAI client (called on application shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+def _dumps(obj: Any, indent: bool = False) -> str:
+    """
+    Serializes an object to JSON with orjson for the AI prompts. Unsupported
+    types (ObjectId, Decimal...) are converted with str().
+
+    Args:
+        obj: Object to serialize
+        indent: Whether to indent the output with 2 spaces
+
+    Returns:
+        JSON string
+    """
+    option = (orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2) if indent else orjson.OPT_NON_STR_KEYS
+    try:
+        return orjson.dumps(obj, default=str, option=option).decode()
+    except TypeError:
+        # e.g. integers larger than 64 bits, which orjson does not support
+        if indent:
+            return json.dumps(obj, indent=2, default=str)
+        return json.dumps(obj, separators=(",", ":"), default=str)
+
+# Generated explanations are cached by prompt, so repeating a query with the
+# same results reuses the previous answer instead of calling OpenAI again
+_EXPLANATION_CACHE_TTL = 3600
+
+# Explanations are kept to 100-150 words, so they never need more tokens than this
+_EXPLANATION_MAX_TOKENS = min(settings.OPENAI.MAX_TOKENS, 400)
+
+# Value types summarized by _numeric_column_stats (bool is excluded on purpose)
+_NUMERIC_TYPES = frozenset({int, float, Decimal})
+
+def _numeric_column_stats(rows: List[Any]) -> Dict[str, Dict[str, float]]:
+    """
+    Computes min/max/avg of the numeric columns of a result in a single
+    pass, so the prompt can describe the whole result while only a few
+    rows are sent as sample.
+
+    Args:
+        rows: Result rows
+
+    Returns:
+        Statistics by column (only columns with numeric values)
+    """
+    acc: Dict[str, List[float]] = {}
+    for row in rows:
+        if not isinstance(row, dict):
+            continue
+        for column, value in row.items():
+            if type(value) not in _NUMERIC_TYPES:
+                continue
+            value = float(value)
+            entry = acc.get(column)
+            if entry is None:
+                acc[column] = [value, value, value, 1]
+            else:
+                if value < entry[0]:
+                    entry[0] = value
+                elif value > entry[1]:
+                    entry[1] = value
+                entry[2] += value
+                entry[3] += 1
+    
+    return {
+        column: {"min": low, "max": high, "avg": round(total / count, 4)}
+        for column, (low, high, total, count) in acc.items()
+    }
+
+# Tags of the semantic cache entries (bump the version when the prompts change)
+_SEMANTIC_EXPLANATION_TAG = "sql-explain-v1"
+_SEMANTIC_COLLECTIONS_TAG = "collections-v2"
+
+# Size of the embeddings used by the semantic cache (text-embedding-3 models
+# can be shortened; 256 dimensions keep the similarity scan cheap)
+_EMBEDDING_DIMENSIONS = 256
+
+async def _embed(text: str) -> List[float]:
+    """
+    Computes the embedding of a text for the semantic cache.
+
+    Args:
+        text: Text to embed
+
+    Returns:
+        Embedding vector
+    """
+    response = await get_openai_client().embeddings.create(
+        model=settings.OPENAI.EMBEDDING_MODEL,
+        input=text,
+        dimensions=_EMBEDDING_DIMENSIONS
+    )
+    return response.data[0].embedding
+
+def _stable_explanation_context(context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns the results context without the execution times (they change on
+    every run of the same query).
+
+    Args:
+        context: Results context sent to the model
+
+    Returns:
+        Context without the execution times
+    """
+    stable = {k: v for k, v in context.items() if k != "query_time_ms"}
+    summary = stable.get("summary")
+    if isinstance(summary, dict):
+        stable["summary"] = {k: v for k, v in summary.items() if k != "execution_time_ms"}
+    return stable
+
+def _explanation_cache_key(system_prompt: str, instruction: str, context: Dict[str, Any]) -> str:
+    """
+    Builds the cache key of an explanation, leaving out the execution times.
+
+    Args:
+        system_prompt: System prompt of the request
+        instruction: Text that precedes the context in the user message
+        context: Results context sent to the model
+
+    Returns:
+        Cache key
+    """
+    stable = _stable_explanation_context(context)
+    return Cache.generate_key("ai_explanation", settings.OPENAI.OPENAI_MODEL, system_prompt, instruction, stable)
+
+def _explanation_scope(instruction: str, context: Dict[str, Any]) -> Tuple[Any, str]:
+    """
+    Splits an explanation request into its semantic cache scope (everything
+    but the question itself; the instruction carries the answer language)
+    and the question.
+
+    Args:
+        instruction: Text that precedes the context in the user message
+        context: Results context sent to the model
+
+    Returns:
+        Tuple (scope, question)
+    """
+    stable = _stable_explanation_context(context)
+    question = stable.pop("original_query", "") or ""
+    return (settings.OPENAI.OPENAI_MODEL, instruction, stable), question
+
+async def _create_explanation(system_prompt: str, instruction: str, context: Dict[str, Any]) -> str:
+    """
+    Asks OpenAI for the explanation of a query result, reusing a cached answer
+    for an identical prompt, or for a near-identical question about the same
+    query and results. Concurrent identical requests share one call.
+
+    Args:
+        system_prompt: System prompt of the request
+        instruction: Text that precedes the context in the user message
+        context: Results context sent to the model
+
+    Returns:
+        Explanation generated by the model
+    """
+    async def create() -> str:
+        scope, question = _explanation_scope(instruction, context)
+        explanation, vector = await SemanticCache.lookup(_SEMANTIC_EXPLANATION_TAG, scope, question, _embed)
+        if explanation is not None:
+            return explanation
+        
+        response = await get_openai_client().chat.completions.create(
+            model=settings.OPENAI.OPENAI_MODEL,
+            max_tokens=_EXPLANATION_MAX_TOKENS,
+            temperature=0.7,  # A little more creativity for the explanation
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"{instruction}:\n{_dumps(context)}"}
+            ]
+        )
+        explanation = response.choices[0].message.content
+        
+        await SemanticCache.store(_SEMANTIC_EXPLANATION_TAG, scope, question, vector, explanation)
+        return explanation
+    
+    return await Cache.get_or_set(
+        _explanation_cache_key(system_prompt, instruction, context),
+        create,
+        ttl=_EXPLANATION_CACHE_TTL
+    )
+
+async def _stream_explanation(system_prompt: str, instruction: str, context: Dict[str, Any]) -> AsyncIterator[str]:
+    """
+    Streams the explanation of a query result as the model generates it.
+    Cached explanations are yielded whole, and a streamed one is cached once
+    complete, sharing the entries of _create_explanation.
+
+    Args:
+        system_prompt: System prompt of the request
+        instruction: Text that precedes the context in the user message
+        context: Results context sent to the model
+
+    Yields:
+        Fragments of the explanation
+    """
+    key = _explanation_cache_key(system_prompt, instruction, context)
+    explanation = await Cache.get(key)
+    if explanation is not None:
+        yield explanation
+        return
+    
+    scope, question = _explanation_scope(instruction, context)
+    explanation, vector = await SemanticCache.lookup(_SEMANTIC_EXPLANATION_TAG, scope, question, _embed)
+    if explanation is not None:
+        yield explanation
+        return
+    
+    stream = await get_openai_client().chat.completions.create(
+        model=settings.OPENAI.OPENAI_MODEL,
+        max_tokens=_EXPLANATION_MAX_TOKENS,
+        temperature=0.7,
+        stream=True,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"{instruction}:\n{_dumps(context)}"}
+        ]
+    )
+    parts = []
+    async for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            parts.append(delta)
+            yield delta
+    
+    explanation = "".join(parts)
+    await Cache.set(key, explanation, ttl=_EXPLANATION_CACHE_TTL)
+    await SemanticCache.store(_SEMANTIC_EXPLANATION_TAG, scope, question, vector, explanation)
+
+# Rendered schema contexts, keyed by a digest of the schema: the same db_info
+# arrives on every request, so the indented serialization is done only once
+_DB_CONTEXT_CACHE_SIZE = 32
+_db_context_cache: "OrderedDict[bytes, str]" = OrderedDict()
+
+# Size above which large schemas are reduced to their first tables
+_DB_CONTEXT_MAX_CHARS = 10000
+_DB_CONTEXT_MAX_TABLES = 5
+
+def _tables_exceed_budget(tables: Dict[str, Any]) -> bool:
+    """
+    Checks whether the indented tables would exceed _DB_CONTEXT_MAX_CHARS,
+    serializing them one by one and stopping as soon as the limit is reached.
+
+    Args:
+        tables: Schema tables (name -> definition)
+
+    Returns:
+        True if the schema must be truncated
+    """
+    size = 0
+    for name, table in tables.items():
+        rendered = _dumps(table, indent=True)
+        # Nested under "tables", every line gets 4 more spaces of indentation
+        size += len(rendered) + 4 * rendered.count("\n") + len(str(name)) + 10
+        if size > _DB_CONTEXT_MAX_CHARS:
+            return True
+    return False
+
+def _render_db_context(db_info: Dict[str, Any], engine: Optional[str] = None, truncate: bool = False) -> str:
+    """
+    Serializes the database schema for the AI prompts, reusing the result for
+    schemas already seen.
+
+    Args:
+        db_info: Database schema information
+        engine: Database engine, used for the truncated context
+        truncate: Whether to keep only the first tables of large schemas
+
+    Returns:
+        Schema as indented JSON
+    """
+    try:
+        key = hashlib.blake2b(
+            orjson.dumps((engine, truncate, db_info), default=str, option=orjson.OPT_NON_STR_KEYS),
+            digest_size=16
+        ).digest()
+    except TypeError:
+        key = None
+    
+    if key is not None:
+        cached = _db_context_cache.get(key)
+        if cached is not None:
+            _db_context_cache.move_to_end(key)
+            return cached
+    
+    tables = db_info.get("tables", {})
+    
+    # Limit the context if it is too large: decide from the tables themselves
+    # instead of serializing the whole schema only to discard most of it
+    if truncate and len(tables) > _DB_CONTEXT_MAX_TABLES and _tables_exceed_budget(tables):
+        truncated_db_info = {
+            "engine": db_info.get("engine", engine),
+            "tables": dict(islice(tables.items(), _DB_CONTEXT_MAX_TABLES))
+        }
+        
+        db_context = _dumps(truncated_db_info, indent=True)
+        db_context += f"\n\n... y {len(tables) - _DB_CONTEXT_MAX_TABLES} tablas más."
+    else:
+        db_context = _dumps(db_info, indent=True)
+    
+    if key is not None:
+        _db_context_cache[key] = db_context
+        if len(_db_context_cache) > _DB_CONTEXT_CACHE_SIZE:
+            _db_context_cache.popitem(last=False)
+    
+    return db_context
+
+# Collections system prompts, by schema digest (LRU)
+_COLLECTIONS_PROMPT_CACHE_SIZE = 128
+_collections_prompt_cache: "OrderedDict[bytes, str]" = OrderedDict()
+
+# System prompt templates, filled in with str.format_map
+_COLLECTIONS_SYSTEM_TMPL = """
+        Eres un asistente especializado en identificar las colecciones necesarias y relativas a la consulta del usuario.
+        
+        ESTRUCTURA DE LA BASE DE DATOS:
+        {db_schema}
+    
+        Tu tarea es:
+        1. Analizar cuidadosamente la consulta del usuario
+        2. Entender el esquema de la base de datos
+        3. Determinar cual o cuales son las colecciones que se deben consultar
+        
+        Responde ÚNICAMENTE con un objeto JSON de la forma {{"collections": ["coleccion1", "coleccion2"]}}
+        con las colecciones que se deben consultar.
+        """
+
+_SQL_EXPLANATION_SYSTEM_TMPL = """
+            You are a specialized assistant for explaining SQL query results.
+            YOUR ENTIRE RESPONSE MUST BE IN {language_name} ONLY.
+
+            Current detected language: {query_language} ({language_name})
+
+            CRITICAL: The user's query was detected to be in {language_name}. 
+            YOU MUST RESPOND ONLY IN {language_name}.
+
+            Guidelines:
+            1. Begin with a concise summary of the results (how many records were found)
+            2. Describe the type of query performed (search, filtering, relation, count, etc.) without using SQL terminology
+            3. Comment on the most important findings or patterns identified
+            4. Highlight relevant information about the displayed data
+            5. When appropriate, mention specific values (maximums, minimums, averages, etc.)
+            6. The explanation should be understandable for people without technical knowledge
+            7. Use accessible but precise language
+            8. DO NOT mention SQL syntax or technical terms like JOIN, GROUP BY, etc.
+            9. Prioritize relevance to the user over technical details
+
+            Desired format:
+            - Start with a direct and clear summary
+            - Continue with 1-3 important observations about the data
+            - If relevant, end with a brief conclusion
+            - Keep the explanation to 100-150 words maximum
+            - YOUR RESPONSE MUST BE ENTIRELY IN {language_name}
+        """
+
+# Names of the languages the explanations are written in
+_LANGUAGE_NAMES = {
+    "en": "English",
+    "es": "Spanish",
+    "fr": "French",
+    "de": "German",
+    "it": "Italian",
+    "pt": "Portuguese"
+}
+
+@lru_cache(maxsize=64)
+def _sql_explanation_system_prompt(query_language: str) -> str:
+    """
+    Returns the system prompt of the SQL result explanations, which only
+    depends on the language of the query.
+
+    Args:
+        query_language: Detected language code
+
+    Returns:
+        System prompt
+    """
+    language_name = _LANGUAGE_NAMES.get(query_language, "English")
+    return _SQL_EXPLANATION_SYSTEM_TMPL.format_map({"language_name": language_name, "query_language": query_language})
+
+def _primary_keys(table: Any) -> List[str]:
+    """
+    Returns the primary key columns of a table definition, whether its
+    columns are a mapping (name -> definition) or a list of definitions.
+
+    Args:
+        table: Table definition of the schema
+
+    Returns:
+        Names of the primary key columns
+    """
+    if not isinstance(table, dict):
+        return []
+    columns = table.get("schema", table.get("columns", table.get("fields")))
+    if isinstance(columns, dict):
+        return [name for name, column in columns.items() if isinstance(column, dict) and column.get("primary_key")]
+    if isinstance(columns, list):
+        return [column.get("name") for column in columns if isinstance(column, dict) and column.get("primary_key")]
+    return []
+
+def _collections_outline(db_schema: Any) -> Any:
+    """
+    Reduces a schema to what is needed to choose collections: the table or
+    collection names and their primary keys. Lists of names are kept as is.
+
+    Args:
+        db_schema: Database schema or list of collection names
+
+    Returns:
+        Reduced schema
+    """
+    if not isinstance(db_schema, dict):
+        return db_schema
+    for container in ("tables", "collections"):
+        tables = db_schema.get(container)
+        if isinstance(tables, dict):
+            return {container: {name: _primary_keys(table) for name, table in tables.items()}}
+    return db_schema
+
+def _collections_system_prompt(db_schema: Any) -> str:
+    """
+    Builds the collections system prompt, with the schema serialized as
+    compact canonical JSON, reusing the result for schemas already seen.
+
+    Args:
+        db_schema: Database schema or list of collection names
+
+    Returns:
+        System prompt
+    """
+    try:
+        key = hashlib.blake2b(
+            orjson.dumps(db_schema, default=str, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS),
+            digest_size=16
+        ).digest()
+    except TypeError:
+        key = None
+    
+    if key is not None:
+        cached = _collections_prompt_cache.get(key)
+        if cached is not None:
+            _collections_prompt_cache.move_to_end(key)
+            return cached
+    
+    outline = _collections_outline(db_schema)
+    try:
+        rendered = orjson.dumps(outline, default=str, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS).decode()
+    except TypeError:
+        rendered = json.dumps(outline, separators=(",", ":"), sort_keys=True, default=str)
+    system_prompt = _COLLECTIONS_SYSTEM_TMPL.format_map({"db_schema": rendered})
+    
+    if key is not None:
+        _collections_prompt_cache[key] = system_prompt
+        if len(_collections_prompt_cache) > _COLLECTIONS_PROMPT_CACHE_SIZE:
+            _collections_prompt_cache.popitem(last=False)
+    
+    return system_prompt
+
+# Types that are already JSON-compatible
+_JSON_NATIVE_TYPES = frozenset({str, int, float, bool, type(None)})
+
+# Direct conversions by exact type for BSON/Python values
+_JSONABLE_CONVERTERS: Dict[type, Callable[[Any], Any]] = {
+    ObjectId: str,
+    datetime: datetime.isoformat,
+    date: date.isoformat,
+    Decimal: str,
+    Decimal128: lambda value: str(value.to_decimal()),
+    UUID: str,
+    bytes: bytes.hex
+}
+
+def _to_jsonable(value: Any) -> Any:
+    """
+    Converts a value into JSON-compatible types in a single recursive pass
+    (ObjectId, Decimal, Decimal128 and UUID as strings, dates in ISO format,
+    binary data as hex).
+
+    Args:
+        value: Value to convert (documents, lists, scalars)
+
+    Returns:
+        Equivalent value made only of JSON-compatible types
+    """
+    value_type = type(value)
+    if value_type in _JSON_NATIVE_TYPES:
+        return value
+    if value_type is dict:
+        return {k: _to_jsonable(v) for k, v in value.items()}
+    if value_type is list or value_type is tuple:
+        return [_to_jsonable(v) for v in value]
+    
+    converter = _JSONABLE_CONVERTERS.get(value_type)
+    if converter is not None:
+        return converter(value)
+    
+    # Subclasses (e.g. SON, custom dicts) and less common types
+    if isinstance(value, dict):
+        return {k: _to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_jsonable(v) for v in value]
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (ObjectId, Decimal, UUID)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):  # bson Binary
+        return value.hex()
+    return value
+
+# Defaults for the MongoDBQuery fields missing from the AI response
+_MONGO_QUERY_DEFAULTS = {
+    "collection": None,
+    "operation": "find",
+    "query": {},
+    "pipeline": [],
+    "projection": None,
+    "sort": None,
+    "limit": 10,
+    "skip": 0
+}
+
+# Expected types of the MongoDBQuery fields generated by the AI
+_MONGO_QUERY_TYPES = {
+    "collection": str,
+    "operation": str,
+    "query": dict,
+    "pipeline": list,
+    "projection": dict,
+    "sort": dict,
+    "limit": int,
+    "skip": int
+}
+
+def _is_well_formed_mongo_query(data: Dict[str, Any]) -> bool:
+    """
+    Checks that the fields of an AI-generated MongoDB query already have the
+    types MongoDBQuery expects (None is accepted for optional fields).
+
+    Args:
+        data: Query fields
+
+    Returns:
+        True if the query can be built without validation
+    """
+    for name, expected in _MONGO_QUERY_TYPES.items():
+        value = data.get(name)
+        if value is None:
+            if name in ("collection", "operation", "query"):
+                return False
+        elif not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+            return False
+    return True
+
+def _sql_features(sql_query: str) -> FrozenSet[str]:
+    """
+    Finds the SQL clauses and aggregate functions used by a query.
+
+    Args:
+        sql_query: SQL query
+
+    Returns:
+        Lowercased features without whitespace ("groupby", "orderby", "where",
+        "join", "sum(", "avg(", "count(", "count")
+    """
+    return frozenset("".join(match.split()).lower() for match in _SQL_FEATURE_RE.findall(sql_query))
+
+def _to_dict(query: Any) -> Dict[str, Any]:
+    """
+    Returns the fields of a query given as a Pydantic model, a dictionary
+    or a plain object, so callers read them with a single `.get()`.
+
+    Args:
+        query: MongoDBQuery, dictionary or object with query attributes
+
+    Returns:
+        Dictionary with the query fields
+    """
+    if isinstance(query, dict):
+        return query
+    # Pydantic models (MongoDBQuery keeps filter/query in sync in model_dump)
+    if isinstance(query, BaseModel):
+        return query.model_dump()
+    return vars(query)
+
+@lru_cache(maxsize=1024)
+def _detect_language(text: str) -> str:
+    """
+    Detects the language of a natural language query, falling back to
+    Spanish when it cannot be determined.
+
+    Args:
+        text: Natural language query
+
+    Returns:
+        ISO 639-1 language code
+    """
+    try:
+        return detect(text)
+    except Exception:
+        return "es"
+
+def _isoformat(value: Any) -> Any:
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+def _hex(value: Any) -> Any:
+    return value.hex() if isinstance(value, (bytes, bytearray)) else value
+
+def _decode_utf8(value: Any) -> Any:
+    return value.decode('utf-8', errors='replace') if isinstance(value, (bytes, bytearray)) else value
+
+def _coerce_rows(rows: List[Dict[str, Any]], bytes_coercer) -> List[Dict[str, Any]]:
+    """
+    Converts the non-serializable values of SQL result rows in place. The
+    conversion of each column (isoformat for dates, bytes_coercer for binary
+    data) is chosen once from the set of types found among its values, so
+    dynamically typed columns (SQLite) are covered as well.
+
+    Args:
+        rows: Result rows as dictionaries (all with the same columns)
+        bytes_coercer: Conversion for binary values (must pass other values through)
+
+    Returns:
+        The same rows, with converted values
+    """
+    if not rows:
+        return rows
+    
+    coercers = []
+    for key in rows[0]:
+        types = {type(row[key]) for row in rows}
+        has_bytes = any(issubclass(t, (bytes, bytearray)) for t in types)
+        has_dates = any(hasattr(t, 'isoformat') for t in types)  # datetime, date, time
+        if has_bytes and has_dates:
+            # Both conversions are guarded per value, so they can be chained
+            coercers.append((key, lambda value: _isoformat(bytes_coercer(value))))
+        elif has_bytes:
+            coercers.append((key, bytes_coercer))
+        elif has_dates:
+            coercers.append((key, _isoformat))
+    
+    if coercers:
+        for row in rows:
+            for key, coerce in coercers:
+                value = row[key]
+                if value is not None:
+                    row[key] = coerce(value)
+    
+    return rows
+
+# Connection pools for client SQL databases, one per set of connection parameters
+_SQL_POOL_MAX_SIZE = 20
+_SQL_POOL_RECYCLE = 300
+_sql_pools: Dict[Tuple[Any, ...], Any] = {}
+# One lock per pool key: a slow or unreachable server only delays its own callers
+_sql_pool_locks: Dict[Tuple[Any, ...], asyncio.Lock] = {}
+
+async def _get_sql_pool(engine: str, db_config: Dict[str, Any], default_port: int, create) -> Any:
+    """
+    Returns the shared pool for some connection parameters, creating it on first use.
+
+    Args:
+        engine: Database engine (part of the pool key)
+        db_config: Connection configuration
+        default_port: Port used when the configuration does not specify one
+        create: Coroutine function (host, port, user, password, database) -> pool
+
+    Returns:
+        Connection pool
+    """
+    params = (
+        db_config.get("host", "localhost"),
+        db_config.get("port", default_port),
+        db_config.get("user", ""),
+        db_config.get("password", ""),
+        db_config.get("database", "")
+    )
+    key = (engine, *params)
+    
+    pool = _sql_pools.get(key)
+    if pool is None:
+        async with _sql_pool_locks.setdefault(key, asyncio.Lock()):
+            pool = _sql_pools.get(key)
+            if pool is None:
+                pool = await create(*params)
+                _sql_pools[key] = pool
+    return pool
+
+async def _get_mysql_pool(db_config: Dict[str, Any]) -> Any:
+    """Returns the shared aiomysql pool for a MySQL configuration"""
+    import aiomysql
+    
+    async def create(host, port, user, password, database):
+        return await aiomysql.create_pool(
+            host=host,
+            port=port,
+            user=user,
+            password=password,
+            db=database,
+            autocommit=True,
+            minsize=1,
+            maxsize=_SQL_POOL_MAX_SIZE,
+            pool_recycle=_SQL_POOL_RECYCLE
+        )
+    
+    return await _get_sql_pool("mysql", db_config, 3306, create)
+
+async def _get_postgresql_pool(db_config: Dict[str, Any]) -> Any:
+    """Returns the shared asyncpg pool for a PostgreSQL configuration"""
+    import asyncpg
+    
+    async def create(host, port, user, password, database):
+        return await asyncpg.create_pool(
+            host=host,
+            port=port,
+            user=user,
+            password=password,
+            database=database,
+            min_size=1,
+            max_size=_SQL_POOL_MAX_SIZE,
+            max_inactive_connection_lifetime=_SQL_POOL_RECYCLE
+        )
+    
+    return await _get_sql_pool("postgresql", db_config, 5432, create)
+
+# MongoDB clients for client databases, one per connection string
+_mongo_clients: Dict[str, Any] = {}
+
+# Collection handles per (connection string, database, collection), so the
+# database/collection wrappers and their codec options are built only once
+_MONGO_COLLECTION_CACHE_SIZE = 256
+_mongo_collections: "OrderedDict[Tuple[str, str, str], Any]" = OrderedDict()
+
+def _get_mongo_collection(connection_string: str, database: str, name: str) -> Any:
+    """
+    Returns the cached Motor collection handle, creating the client on first use.
+
+    Args:
+        connection_string: MongoDB connection URL
+        database: Database name
+        name: Collection name
+
+    Returns:
+        Motor collection
+    """
+    key = (connection_string, database, name)
+    collection = _mongo_collections.get(key)
+    if collection is not None:
+        _mongo_collections.move_to_end(key)
+        return collection
+    
+    client = _mongo_clients.get(connection_string)
+    if client is None:
+        client = AsyncIOMotorClient(connection_string, maxPoolSize=50)
+        _mongo_clients[connection_string] = client
+    
+    collection = client[database][name]
+    _mongo_collections[key] = collection
+    if len(_mongo_collections) > _MONGO_COLLECTION_CACHE_SIZE:
+        _mongo_collections.popitem(last=False)
+    return collection
+
+def close_mongodb_clients() -> None:
+    """Closes the cached MongoDB clients (called on application shutdown)"""
+    clients = list(_mongo_clients.values())
+    _mongo_clients.clear()
+    _mongo_collections.clear()
+    for client in clients:
+        client.close()
+
+async def close_sql_pools() -> None:
+    """Closes the shared SQL connection pools (called on application shutdown)"""
+    pools = list(_sql_pools.values())
+    _sql_pools.clear()
+    _sql_pool_locks.clear()
+    for pool in pools:
+        try:
+            if hasattr(pool, "wait_closed"):
+                # aiomysql
+                pool.close()
+                await pool.wait_closed()
+            else:
+                # asyncpg
+                await pool.close()
+        except Exception as e:
+            logger.warning(f"Error closing SQL connection pool: {str(e)}")
+
+# Maximum number of rows returned by SQL queries
+_MAX_SQL_ROWS = 100
+
+_SELECT_RE = re.compile(r'^\s*(?:select|with)\b', re.IGNORECASE)
+_TRAILING_LIMIT_RE = re.compile(r'\blimit\s+\d+(?:\s+offset\s+\d+)?\s*;?\s*$', re.IGNORECASE)
+
+def _limit_select(sql_query: str, limit: int) -> str:
+    """
+    Caps a SELECT without a final LIMIT so the database only sends the rows
+    that will be returned. Other statements are left unchanged.
+
+    Args:
+        sql_query: SQL query
+        limit: Maximum number of rows
+
+    Returns:
+        Query with the limit applied
+    """
+    if not _SELECT_RE.match(sql_query) or _TRAILING_LIMIT_RE.search(sql_query):
+        return sql_query
+    body = sql_query.strip().rstrip(';')
+    return f"SELECT * FROM ({body}) AS _corebrain_query LIMIT {limit}"
+
+def _value_to_str(value: Any) -> Any:
+    return str(value)
+
+# Conversions of non-serializable PostgreSQL types, by type name. Dates and
+# timestamps are left as datetime objects: orjson and FastAPI serialize them
+# natively, so most result sets need no per-row conversion at all. Only
+# timetz is converted, since orjson rejects times with a timezone
+_PG_CONVERTERS = {
+    "timetz": _isoformat,
+    "bytea": _hex,
+    "bit": _value_to_str,
+    "varbit": _value_to_str
+}
+
+def _pg_value(value: Any) -> Any:
+    """Value-based conversion for PostgreSQL types not known in advance (domains, extensions...)"""
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    if type(value).__name__ == "BitString":
+        return str(value)
+    return value
+
+def _pg_converter(pg_type) -> Optional[Callable[[Any], Any]]:
+    """
+    Chooses the conversion for a PostgreSQL column from its type.
+
+    Args:
+        pg_type: Column type (asyncpg Type: name, kind, schema)
+
+    Returns:
+        Conversion function, or None if the JSON encoders handle the values natively
+    """
+    converter = _PG_CONVERTERS.get(pg_type.name)
+    if converter is not None:
+        return converter
+    if pg_type.kind == "scalar" and pg_type.schema == "pg_catalog":
+        return None
+    return _pg_value
+
+# Operation names (lowercased) that get find or single-write details in the
+# explanation summary, and the fallback wording of single writes
+_FIND_OPERATIONS = frozenset({"find", "findone"})
+_WRITE_ONE_OPERATIONS = frozenset({"insertone", "updateone", "deleteone"})
+_WRITE_ONE_EXPLANATIONS = {
+    "insertone": "A new document has been successfully inserted into the {collection} collection.",
+    "updateone": "A document in the {collection} collection has been successfully updated.",
+    "deleteone": "A document has been successfully deleted from the {collection} collection.",
+}
+
+# Hints appended to MongoDB error messages, checked in order
+_MONGO_ERROR_HINTS = {
+    "Authentication failed": " The login credentials are incorrect.",
+    "not authorized": " The user does not have sufficient permissions for this operation.",
+    "No such collection": " The specified collection does not exist in the database.",
+}
+
+# bulkWrite operations ({"op": ..., "filter", "update" or "document"}) by
+# lowercased name, mapped to their pymongo request
+_BULK_WRITE_REQUESTS = {
+    "insertone": lambda op: InsertOne(op["document"]),
+    "updateone": lambda op: UpdateOne(op.get("filter") or {}, op["update"]),
+    "deleteone": lambda op: DeleteOne(op.get("filter") or {}),
+}
+
+# Maximum number of documents returned by MongoDB queries and cursor batch size
+_MAX_MONGO_DOCS = 100
+_MONGO_BATCH_SIZE = min(_MAX_MONGO_DOCS, 500)
+
+async def _collect_documents(cursor, limit: int) -> List[Any]:
+    """
+    Reads up to `limit` documents from a Motor cursor, converting each one to
+    JSON-compatible values as it arrives, and closes the cursor. Documents
+    that share a schema share their top-level key strings instead of keeping
+    one copy per document.
+
+    Args:
+        cursor: Motor cursor (find or aggregate)
+        limit: Maximum number of documents
+
+    Returns:
+        List of converted documents
+    """
+    documents = []
+    keys: Dict[str, str] = {}
+    try:
+        async for document in cursor:
+            if type(document) is dict:
+                documents.append({keys.setdefault(k, k): _to_jsonable(v) for k, v in document.items()})
+            else:
+                documents.append(_to_jsonable(document))
+            if len(documents) >= limit:
+                break
+    finally:
+        await cursor.close()
+    return documents
+
+# Instructions appended to the collections system prompt when several
+# concurrent questions are sent in a single request
+_COLLECTIONS_BATCH_INSTRUCTIONS = """
+        Recibirás {count} consultas numeradas del 1 al {count}. Responde ÚNICAMENTE con un objeto JSON
+        de la forma {{"answers": [...]}}, donde "answers" tiene {count} elementos, en el mismo orden,
+        y cada elemento es la lista de colecciones que se deben consultar para la consulta con ese número.
+        """
+
+def _json_schema_format(name: str, properties: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Builds a strict structured outputs response format: the model can only
+    answer with an object that has exactly the given properties.
+
+    Args:
+        name: Name of the schema
+        properties: JSON schema of each property
+
+    Returns:
+        response_format for chat.completions
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": list(properties),
+                "additionalProperties": False
+            }
+        }
+    }
+
+# Structured outputs of the collections requests, so the responses are always
+# valid JSON and need no cleaning
+_COLLECTION_NAMES_SCHEMA = {"type": "array", "items": {"type": "string"}}
+_COLLECTIONS_FORMAT = _json_schema_format("collections", {"collections": _COLLECTION_NAMES_SCHEMA})
+_COLLECTIONS_BATCH_FORMAT = _json_schema_format(
+    "collections_batch",
+    {"answers": {"type": "array", "items": _COLLECTION_NAMES_SCHEMA}}
+)
+
+def _parse_collections(content: str) -> List[str]:
+    """
+    Extracts the collection names from a structured outputs response.
+
+    Args:
+        content: Model response ({"collections": [...]})
+
+    Returns:
+        Collection names
+    """
+    return orjson.loads(content)["collections"]
+
+async def _request_collections(system_prompt: str, question: str) -> List[str]:
+    """
+    Asks OpenAI which collections a single question needs.
+
+    Args:
+        system_prompt: Collections system prompt of the schema
+        question: Natural language question
+
+    Returns:
+        Collection names
+    """
+    response = await get_openai_client().chat.completions.create(
+        model=settings.OPENAI.OPENAI_MODEL_CLASSIFIER,
+        max_tokens=settings.OPENAI.MAX_TOKENS,
+        temperature=0.2,  # Low temperature for more deterministic answers
+        response_format=_COLLECTIONS_FORMAT,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": question}
+        ]
+    )
+    return _parse_collections(response.choices[0].message.content)
+
+# Output budget of a micro-batch: a short list of names per question, never
+# above the completion limit of the classifier models (gpt-4o-mini: 16384)
+_COLLECTIONS_TOKENS_PER_QUESTION = 64
+_COMPLETION_TOKEN_LIMIT = 16384
+
+async def _request_collections_many(system_prompt: str, questions: List[str]) -> List[Any]:
+    """
+    Asks OpenAI which collections several questions on the same schema need,
+    in a single request. Falls back to one request per question if the
+    request fails or the model does not return one answer per question.
+
+    Args:
+        system_prompt: Collections system prompt of the schema
+        questions: Natural language questions
+
+    Returns:
+        Collection names of each question, in the order of the questions (or
+        the exception of a question whose own request failed)
+    """
+    count = len(questions)
+    numbered = "\n".join(f"{i}. {question}" for i, question in enumerate(questions, 1))
+    max_tokens = min(
+        min(settings.OPENAI.MAX_TOKENS, _COLLECTIONS_TOKENS_PER_QUESTION) * count + _COLLECTIONS_TOKENS_PER_QUESTION,
+        _COMPLETION_TOKEN_LIMIT
+    )
+    try:
+        response = await get_openai_client().chat.completions.create(
+            model=settings.OPENAI.OPENAI_MODEL_CLASSIFIER,
+            max_tokens=max_tokens,
+            temperature=0.2,
+            response_format=_COLLECTIONS_BATCH_FORMAT,
+            messages=[
+                {"role": "system", "content": system_prompt + _COLLECTIONS_BATCH_INSTRUCTIONS.format(count=count)},
+                {"role": "user", "content": numbered}
+            ]
+        )
+        answers = orjson.loads(response.choices[0].message.content)["answers"]
+        if len(answers) == count:
+            return answers
+        logger.warning(f"Batched collections request did not return {count} answers, retrying one by one")
+    except Exception as e:
+        logger.warning(f"Batched collections request failed ({e}), retrying one by one")
+    
+    # Each question fails on its own, not with the whole batch
+    return list(await asyncio.gather(
+        *(_request_collections(system_prompt, q) for q in questions),
+        return_exceptions=True
+    ))
+
+class _CollectionsBatcher:
+    """
+    Groups the collection questions that arrive within a short window for the
+    same schema and resolves them with a single OpenAI request.
+    """
+    def __init__(self, max_batch: int, max_latency: float):
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        # Pending questions and flush timer, per system prompt
+        self._pending: Dict[str, List[Tuple[str, asyncio.Future]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        # Running flushes (referenced so they are not garbage collected)
+        self._tasks: set = set()
+    
+    async def submit(self, system_prompt: str, question: str) -> Any:
+        """
+        Queues a question and waits for its answer.
+
+        Args:
+            system_prompt: Collections system prompt of the schema
+            question: Natural language question
+
+        Returns:
+            Parsed model response
+        """
+        if self.max_batch <= 1:
+            return await _request_collections(system_prompt, question)
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(system_prompt, [])
+        pending.append((question, future))
+        
+        if len(pending) >= self.max_batch:
+            self._flush(system_prompt)
+        elif len(pending) == 1:
+            self._timers[system_prompt] = loop.call_later(self.max_latency, self._flush, system_prompt)
+        
+        return await future
+    
+    def _flush(self, system_prompt: str) -> None:
+        """Starts the request for the pending questions of a schema"""
+        timer = self._timers.pop(system_prompt, None)
+        if timer is not None:
+            timer.cancel()
+        items = self._pending.pop(system_prompt, None)
+        if not items:
+            return
+        
+        task = asyncio.create_task(self._run(system_prompt, items))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _run(self, system_prompt: str, items: List[Tuple[str, asyncio.Future]]) -> None:
+        """Sends the grouped questions and hands each answer to its caller"""
+        try:
+            if len(items) == 1:
+                answers = [await _request_collections(system_prompt, items[0][0])]
+            else:
+                answers = await _request_collections_many(system_prompt, [question for question, _ in items])
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), answer in zip(items, answers):
+            if future.done():
+                continue
+            if isinstance(answer, Exception):
+                future.set_exception(answer)
+            else:
+                future.set_result(answer)
+
+_collections_batcher = _CollectionsBatcher(
+    settings.OPENAI.COLLECTIONS_BATCH_SIZE,
+    settings.OPENAI.COLLECTIONS_BATCH_LATENCY_MS / 1000
+)
+
 class AIQuery:
     def __init__(self, query: str, collection_name: str = None, limit: int = 50, 
                  config_id: Optional[str] = None, db_schema: Optional[Dict[str, Any]] = None):
@@ -32,41 +1193,19 @@ class AIQuery:
         self.db_schema = db_schema
 
     @staticmethod
-    async def generate_sql_query(
-        query: str, 
-        db_info: Dict[str, Any],
-        engine: str
-    ) -> str:
+    def _build_sql_system_prompt(db_info: Dict[str, Any], engine: str) -> str:
         """
-        Generates an SQL query from a natural language query and database information.
+        Builds the system prompt used to translate natural language into SQL.
 
         Args:
-            query: Natural language query
             db_info: Database schema information
             engine: Database engine (sqlite, mysql, postgresql)
 
         Returns:
-            Generated SQL query
+            System prompt for the model
         """
         # Prepare the context with the information from the database
-        db_context = json.dumps(db_info, indent=2, default=str)  # Use default=str to handle special types
-        
-        # Limit the context if it is too large
-        if len(db_context) > 10000:
-            # Extract only the first tables
-            tables = list(db_info.get("tables", {}).keys())
-            truncated_tables = tables[:5]
-            
-            truncated_db_info = {
-                "engine": db_info.get("engine", engine),
-                "tables": {
-                    name: db_info["tables"][name]
-                    for name in truncated_tables if name in db_info.get("tables", {})
-                }
-            }
-            
-            db_context = json.dumps(truncated_db_info, indent=2, default=str)
-            db_context += f"\n\n... y {len(tables) - 5} tablas más."
+        db_context = _render_db_context(db_info, engine, truncate=True)
         
         # Create specific system prompt for SQL
         system_prompt = f"""
@@ -92,16 +1231,38 @@ class AIQuery:
         - If the query is unclear, generate a simple query that retrieves relevant information
         - Add the right capitalization to the names of columns
 
-        Respond ONLY with the SQL query, without any other text or explanation.
+        Respond ONLY with the SQL query, without any other text or explanation.
+        """
+        return system_prompt
+
+    @staticmethod
+    async def generate_sql_query(
+        query: str, 
+        db_info: Dict[str, Any],
+        engine: str
+    ) -> str:
+        """
+        Generates an SQL query from a natural language query and database information.
+
+        Args:
+            query: Natural language query
+            db_info: Database schema information
+            engine: Database engine (sqlite, mysql, postgresql)
+
+        Returns:
+            Generated SQL query
         """
-        print("Prompt sent to AI: ", system_prompt)
+        system_prompt = AIQuery._build_sql_system_prompt(db_info, engine)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Prompt sent to AI: %s", system_prompt)
         
         try:
-            # Initialize OpenAI client
-            client = openai.AsyncOpenAI(api_key=settings.OPENAI.OPENAI_API_KEY)
+            # Shared OpenAI client
+            client = get_openai_client()
             
-            # Submit application to OpenAI
-            response = await client.chat.completions.create(
+            # Submit application to OpenAI (retrying on rate limits and timeouts)
+            response = await AIQuery._create_completion_with_retry(
+                client,
                 model=settings.OPENAI.OPENAI_MODEL,
                 max_tokens=settings.OPENAI.MAX_TOKENS,
                 temperature=0.2,  # Low temperature for more deterministic responses
@@ -125,6 +1286,31 @@ class AIQuery:
             safe_table = next(iter(db_info.get("tables", {}).keys()), "users")
             return f"SELECT * FROM {safe_table} LIMIT 10"
 
+
+    @staticmethod
+    async def _create_completion_with_retry(client, attempts: int = 3, **kwargs):
+        """
+        Calls chat.completions.create, retrying with exponential backoff
+        (1s, 2s, 4s... up to 32s) when OpenAI answers with a rate limit or times out.
+
+        Args:
+            client: OpenAI async client
+            attempts: Maximum number of attempts
+            **kwargs: Arguments for chat.completions.create
+
+        Returns:
+            OpenAI completion response
+        """
+        delay = 1
+        for attempt in range(1, attempts + 1):
+            try:
+                return await client.chat.completions.create(**kwargs)
+            except (openai.RateLimitError, openai.APITimeoutError) as e:
+                if attempt == attempts:
+                    raise
+                logger.warning(f"OpenAI request throttled ({type(e).__name__}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 32)
     
     @staticmethod
     def clean_sql_query(sql_query: str) -> str:
@@ -137,27 +1323,26 @@ class AIQuery:
         Returns:
             Cleaned SQL query
         """
+        sql_query = sql_query.strip()
+        
         # Remove markdown code blocks
         if sql_query.startswith('```') and sql_query.endswith('```'):
             sql_query = sql_query[3:-3].strip()
         elif '```' in sql_query:
             # Extract content between the first triple quotes of code
-            match = re.search(r'```(?:sql)?(.*?)```', sql_query, re.DOTALL)
+            match = _MD_FENCE_RE.search(sql_query)
             if match:
                 sql_query = match.group(1).strip()
         
-        # Remove language specifiers at the beginning
-        if sql_query.lower().startswith('sql'):
+        # Remove language specifiers at the beginning (only the prefix is lowercased)
+        if sql_query[:3].lower() == 'sql':
             sql_query = sql_query[3:].strip()
         
-        # Delete comments from a line
-        sql_query = re.sub(r'--.*$', '', sql_query, flags=re.MULTILINE)
-        
-        # Delete multi-line comments
-        sql_query = re.sub(r'/\*.*?\*/', '', sql_query, flags=re.DOTALL)
+        # Delete line and multi-line comments in a single pass
+        sql_query = _SQL_COMMENT_RE.sub('', sql_query)
         
         # Remove empty lines and extra spaces
-        sql_query = '\n'.join(line.strip() for line in sql_query.split('\n') if line.strip())
+        sql_query = '\n'.join(stripped for line in sql_query.split('\n') if (stripped := line.strip()))
         
         return sql_query
 
@@ -194,8 +1379,8 @@ class AIQuery:
             execution_time = time.time() - start_time
             
             # Limit results if there are too many
-            if len(result_data) > 100:
-                result_data = result_data[:100]
+            if len(result_data) > _MAX_SQL_ROWS:
+                result_data = result_data[:_MAX_SQL_ROWS]
             
             return result_data, execution_time
             
@@ -208,7 +1393,6 @@ class AIQuery:
     @staticmethod
     async def execute_sqlite_query(sql_query: str, db_config: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Executes a query in SQLite."""
-        import sqlite3
         import aiosqlite
         
         database_path = db_config.get("database", "")
@@ -216,50 +1400,22 @@ class AIQuery:
             raise ValueError("SQLite database path not specified")
         
         async with aiosqlite.connect(database_path) as db:
-            # Configure to get results as dictionaries
-            db.row_factory = aiosqlite.Row
-            
             # Run the query
             cursor = await db.execute(sql_query)
             rows = await cursor.fetchall()
             
-            # Convert to dictionary list
-            result = []
-            for row in rows:
-                # Convert Row to dict
-                row_dict = {key: row[key] for key in row.keys()}
-                # Serialize special values
-                for key, value in row_dict.items():
-                    if hasattr(value, 'isoformat') and callable(getattr(value, 'isoformat')):
-                        row_dict[key] = value.isoformat()
-                    elif isinstance(value, (bytes, bytearray)):
-                        row_dict[key] = value.hex()
-                
-                result.append(row_dict)
-            
-            return result
+            # Convert to dictionary list and serialize special values
+            columns = [column[0] for column in cursor.description or ()]
+            result = [dict(zip(columns, row)) for row in rows]
+            return _coerce_rows(result, _hex)
 
     @staticmethod
     async def execute_mysql_query(sql_query: str, db_config: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Execute a query in MySQL."""
         import aiomysql
         
-        # Extract connection parameters
-        host = db_config.get("host", "localhost")
-        port = db_config.get("port", 3306)
-        user = db_config.get("user", "")
-        password = db_config.get("password", "")
-        database = db_config.get("database", "")
-        
-        # Create connection pool
-        pool = await aiomysql.create_pool(
-            host=host,
-            port=port,
-            user=user,
-            password=password,
-            db=database,
-            autocommit=True
-        )
+        # Shared connection pool for these connection parameters
+        pool = await _get_mysql_pool(db_config)
         
         async with pool.acquire() as conn:
             async with conn.cursor(aiomysql.DictCursor) as cursor:
@@ -267,74 +1423,42 @@ class AIQuery:
                 await cursor.execute(sql_query)
                 rows = await cursor.fetchall()
                 
-                # Convert results
-                result = []
-                for row in rows:
-                    # Convert non-serializable values ​​(such as bytes, datetime, etc.)
-                    row_dict = {}
-                    for key, value in row.items():
-                        if isinstance(value, (bytes, bytearray)):
-                            row_dict[key] = value.decode('utf-8', errors='replace')
-                        elif hasattr(value, 'isoformat'):  # datetime, date, time
-                            row_dict[key] = value.isoformat()
-                        else:
-                            row_dict[key] = value
-                    
-                    result.append(row_dict)
-                
-                return result
-        
-        # Close the pool
-        pool.close()
-        await pool.wait_closed()
+                # Convert non-serializable values (such as bytes, datetime, etc.)
+                return _coerce_rows(list(rows), _decode_utf8)
 
     @staticmethod
     async def execute_postgresql_query(sql_query: str, db_config: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Execute a query in PostgreSQL."""
-        import asyncpg
+        # Shared connection pool for these connection parameters
+        pool = await _get_postgresql_pool(db_config)
         
-        # Extract connection parameters
-        host = db_config.get("host", "localhost")
-        port = db_config.get("port", 5432)
-        user = db_config.get("user", "")
-        password = db_config.get("password", "")
-        database = db_config.get("database", "")
+        async with pool.acquire() as conn:
+            # Prepare the statement (capped to the rows the API returns) and
+            # read its column types to choose the conversions once per column
+            stmt = await conn.prepare(_limit_select(sql_query, _MAX_SQL_ROWS))
+            columns = stmt.get_attributes()
+            rows = await stmt.fetch()
         
-        # Connect to the database
-        conn = await asyncpg.connect(
-            host=host,
-            port=port,
-            user=user,
-            password=password,
-            database=database
-        )
+        names = [column.name for column in columns]
+        converters = [
+            (index, converter) for index, column in enumerate(columns)
+            if (converter := _pg_converter(column.type)) is not None
+        ]
         
-        try:
-            # Run the query
-            rows = await conn.fetch(sql_query)
-            
-            # Convert Record to Dict
-            result = []
-            for row in rows:
-                # Convert asyncpg.Record to dict
-                row_dict = dict(row)
-                
-                # Convert non-serializable values
-                for key, value in row_dict.items():
-                    if hasattr(value, 'isoformat'):  # datetime, date, time
-                        row_dict[key] = value.isoformat()
-                    elif isinstance(value, asyncpg.BitString):
-                        row_dict[key] = str(value)
-                    elif isinstance(value, (bytes, bytearray)):
-                        row_dict[key] = value.hex()
-                
-                result.append(row_dict)
-            
-            return result
-            
-        finally:
-            # Close the connection
-            await conn.close()
+        # Convert Record to Dict
+        if not converters:
+            return [dict(zip(names, row)) for row in rows]
+        
+        result = []
+        for row in rows:
+            values = list(row)
+            for index, converter in converters:
+                value = values[index]
+                if value is not None:
+                    values[index] = converter(value)
+            result.append(dict(zip(names, values)))
+        
+        return result
 
     @staticmethod
     async def execute_mongodb_query(mongo_query, db_config):
@@ -348,9 +1472,6 @@ class AIQuery:
         Returns:
             tuple: (result, explanation)
         """
-        import motor.motor_asyncio
-        from bson.json_util import dumps, loads
-        
         try:
             # Get connection parameters
             host = db_config.get("host", "localhost")
@@ -359,16 +1480,14 @@ class AIQuery:
             password = db_config.get("password", "")
             database = db_config.get("database", "")
             
-            # Build the connection URL
+            # Build the connection URL (credentials escaped for the URI)
             if user and password:
-                connection_string = f"mongodb://{user}:{password}@{host}:{port}/{database}"
+                connection_string = f"mongodb://{quote_plus(user)}:{quote_plus(password)}@{host}:{port}/{database}"
             else:
                 connection_string = f"mongodb://{host}:{port}/{database}"
             
-            # Connect to MongoDB
-            client = motor.motor_asyncio.AsyncIOMotorClient(connection_string)
-            db = client[database]
-            collection = db[mongo_query.collection]
+            # Reuse the client (and its connection pool) and the collection handle
+            collection = _get_mongo_collection(connection_string, database, mongo_query.collection)
             
             # Determine the operation to be performed
             if mongo_query.operation == "find":
@@ -381,16 +1500,14 @@ class AIQuery:
                 # Apply options if they exist
                 if mongo_query.sort:
                     cursor = cursor.sort(mongo_query.sort)
-                if mongo_query.limit:
-                    cursor = cursor.limit(mongo_query.limit)
+                # Limit to 100 documents by default
+                cursor = cursor.limit(min(mongo_query.limit or _MAX_MONGO_DOCS, _MAX_MONGO_DOCS))
                 if mongo_query.skip:
                     cursor = cursor.skip(mongo_query.skip)
+                cursor = cursor.batch_size(_MONGO_BATCH_SIZE)
                 
-                # Get results
-                result_list = await cursor.to_list(length=100)  # Limit to 100 documents by default
-                
-                # Convert ObjectId to string for JSON serialization
-                result_serializable = loads(dumps(result_list))
+                # Get results, converting ObjectId, dates, etc. as they arrive
+                result_serializable = await _collect_documents(cursor, _MAX_MONGO_DOCS)
                 
                 # Generate explanation
                 num_docs = len(result_serializable)
@@ -423,11 +1540,10 @@ class AIQuery:
                 if mongo_query.skip:
                     pipeline.append({"$skip": mongo_query.skip})
                 
-                cursor = collection.aggregate(pipeline)
+                cursor = collection.aggregate(pipeline, batchSize=_MONGO_BATCH_SIZE)
                 
                 # Get results
-                result_list = await cursor.to_list(length=100)
-                result_serializable = loads(dumps(result_list))
+                result_serializable = await _collect_documents(cursor, _MAX_MONGO_DOCS)
                 
                 num_docs = len(result_serializable)
                 if num_docs == 0:
@@ -443,15 +1559,46 @@ class AIQuery:
                         explanation += f" The search was limited to {mongo_query.limit} documents."
                 
                 return result_serializable, explanation
-            elif mongo_query.operation == "findOne":
+            elif mongo_query.operation == "page":
+                # Page of documents and total count in a single round trip:
+                # $facet runs both sub-pipelines over the documents matched once
+                page_size = min(mongo_query.limit or _MAX_MONGO_DOCS, _MAX_MONGO_DOCS)
+                data_pipeline = []
+                if mongo_query.sort:
+                    data_pipeline.append({"$sort": mongo_query.sort})
+                if mongo_query.skip:
+                    data_pipeline.append({"$skip": mongo_query.skip})
+                data_pipeline.append({"$limit": page_size})
+                if mongo_query.projection:
+                    data_pipeline.append({"$project": mongo_query.projection})
+                
+                cursor = collection.aggregate([
+                    {"$match": mongo_query.filter or {}},
+                    {"$facet": {"data": data_pipeline, "total": [{"$count": "n"}]}}
+                ])
+                facets = await _collect_documents(cursor, 1)
+                
+                page = facets[0] if facets else {}
+                data = page.get("data", [])
+                total = page["total"][0]["n"] if page.get("total") else 0
+                
+                if total == 0:
+                    explanation = "No documents were found that match the specified criteria."
+                else:
+                    explanation = f"Showing {len(data)} of {total} {'document' if total == 1 else 'documents'} that match the criteria."
+                    if mongo_query.sort:
+                        explanation += " The results are sorted according to the specified criteria."
+                
+                return {"data": data, "total": total}, explanation
+            elif mongo_query.operation == "findone":
                 # Run a search query on a document
                 document = await collection.find_one(
                     mongo_query.filter or {},
                     mongo_query.projection or None
                 )
                 
-                # Convert ObjectId to string for JSON serialization
-                result_serializable = loads(dumps(document))
+                # Convert ObjectId, dates, etc. to JSON-compatible values
+                result_serializable = _to_jsonable(document)
                 
                 # Generate explanation
                 if result_serializable:
@@ -464,7 +1611,7 @@ class AIQuery:
                 
                 return result_serializable, explanation
                 
-            elif mongo_query.operation == "insertOne":
+            elif mongo_query.operation == "insertone":
                 # Execute insertion of a document
                 result = await collection.insert_one(mongo_query.document)
                 
@@ -473,7 +1620,7 @@ class AIQuery:
                 
                 return {"insertedId": str(result.inserted_id)}, explanation
                 
-            elif mongo_query.operation == "updateOne":
+            elif mongo_query.operation == "updateone":
                 # Run a document update
                 result = await collection.update_one(
                     mongo_query.filter or {},
@@ -496,7 +1643,7 @@ class AIQuery:
                     "modifiedCount": modified
                 }, explanation
                 
-            elif mongo_query.operation == "deleteOne":
+            elif mongo_query.operation == "deleteone":
                 # Execute deletion of a document
                 result = await collection.delete_one(mongo_query.filter or {})
                 
@@ -510,6 +1657,41 @@ class AIQuery:
                 
                 return {"deletedCount": deleted}, explanation
                 
+            elif mongo_query.operation == "insertmany":
+                # Insert all the documents in a single batch
+                result = await collection.insert_many(mongo_query.documents or [], ordered=False)
+                
+                inserted = len(result.inserted_ids)
+                explanation = f"{inserted} {'document has' if inserted == 1 else 'documents have'} been inserted."
+                
+                return {
+                    "insertedCount": inserted,
+                    "insertedIds": [str(inserted_id) for inserted_id in result.inserted_ids]
+                }, explanation
+                
+            elif mongo_query.operation == "bulkwrite":
+                # Send every insert/update/delete in a single batch
+                requests = []
+                for op in mongo_query.operations or []:
+                    build = _BULK_WRITE_REQUESTS.get(str(op.get("op", "")).lower())
+                    if build is None:
+                        raise ValueError(f"bulkWrite operation not supported: {op.get('op')}")
+                    requests.append(build(op))
+                
+                result = await collection.bulk_write(requests, ordered=False)
+                
+                explanation = (
+                    f"Bulk write completed: {result.inserted_count} inserted, "
+                    f"{result.modified_count} modified and {result.deleted_count} deleted."
+                )
+                
+                return {
+                    "insertedCount": result.inserted_count,
+                    "matchedCount": result.matched_count,
+                    "modifiedCount": result.modified_count,
+                    "deletedCount": result.deleted_count
+                }, explanation
+                
             else:
                 # Unsupported operation
                 raise ValueError(f"MongoDB operation not supported: {mongo_query.operation}")
@@ -520,12 +1702,7 @@ class AIQuery:
             explanation = f"Error executing MongoDB query: {error_message}"
             
             # Suggest solutions based on the type of error
-            if "Authentication failed" in error_message:
-                explanation += " The login credentials are incorrect."
-            elif "not authorized" in error_message:
-                explanation += " The user does not have sufficient permissions for this operation."
-            elif "No such collection" in error_message:
-                explanation += " The specified collection does not exist in the database."
+            explanation += next((hint for marker, hint in _MONGO_ERROR_HINTS.items() if marker in error_message), "")
             
             raise ValueError(explanation)
 
@@ -549,7 +1726,7 @@ class AIQuery:
             MongoDBQuery object with the generated query
         """
         # Prepare the context with the information from the database
-        db_context = json.dumps(db_info, indent=2, default=str)
+        db_context = _render_db_context(db_info)
         
         # Get available collections
         available_collections = []
@@ -577,11 +1754,13 @@ class AIQuery:
                 # Include fields/structure
                 if "columns" in collection_data or "fields" in collection_data:
                     fields = collection_data.get("columns", collection_data.get("fields", []))
-                    collection_info += f"Fields: {json.dumps([f.get('name') for f in fields], default=str)}\n"
+                    field_names = ", ".join(str(f.get("name")) for f in fields)
+                    collection_info += f"Fields: {field_names}\n"
                 
                 # Include sample documents if available
                 if "sample_data" in collection_data and collection_data["sample_data"]:
-                    collection_info += f"Sample documents: {json.dumps(collection_data['sample_data'][:2], default=str)}\n"
+                    samples = _to_jsonable(collection_data["sample_data"][:2])
+                    collection_info += f"Sample documents: {_dumps(samples)}\n"
                     
             except Exception as e:
                 logger.warning(f"Error preparing collection information: {str(e)}")
@@ -627,8 +1806,8 @@ class AIQuery:
         """
         
         try:
-            # Initialize OpenAI client
-            client = openai.AsyncOpenAI(api_key=settings.OPENAI.OPENAI_API_KEY)
+            # Shared OpenAI client
+            client = get_openai_client()
             
             # Submit application to OpenAI
             response = await client.chat.completions.create(
@@ -646,27 +1825,33 @@ class AIQuery:
             json_text = AIQuery.clean_json_response(ai_response)
             
             # Parse JSON
-            query_data = json.loads(json_text)
+            query_data = orjson.loads(json_text)
             
             # Verify that the selected collection is being used
             if query_data.get("collection") != selected_collection:
                 logger.warning(f"The AI selected a different collection: {query_data.get('collection')}. Forcing use of {selected_collection}")
-                query_data["collection"] = selected_collection
             
-            # Create MongoDBQuery object
-            mongo_query = MongoDBQuery(
-                collection=query_data["collection"],
-                operation=query_data.get("operation", "find"),
-                query=query_data.get("query", {}),
-                pipeline=query_data.get("pipeline", []),
-                projection=query_data.get("projection"),
-                sort=query_data.get("sort"),
-                limit=query_data.get("limit", 10),
-                skip=query_data.get("skip", 0)
-            )
+            # Query fields, built once (mutable defaults are copied per query)
+            mongo_query_dict = {
+                name: query_data[name] if name in query_data else copy(default)
+                for name, default in _MONGO_QUERY_DEFAULTS.items()
+            }
+            mongo_query_dict["collection"] = selected_collection
+            
+            # Create MongoDBQuery object: skip Pydantic validation when the
+            # parsed JSON already has the expected types
+            if _is_well_formed_mongo_query(mongo_query_dict):
+                mongo_query = MongoDBQuery.from_trusted(mongo_query_dict)
+            else:
+                mongo_query = MongoDBQuery(**mongo_query_dict)
             
             # Record the generated query
-            logger.info(f"Generated MongoDB query for collection {mongo_query.collection}: {json.dumps(mongo_query.dict() if hasattr(mongo_query, 'dict') else vars(mongo_query), default=str)}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "Generated MongoDB query for collection %s: %s",
+                    mongo_query.collection,
+                    to_json(_to_dict(mongo_query))
+                )
             
             return mongo_query
             
@@ -677,7 +1862,8 @@ class AIQuery:
             if db_connection:
                 try:
                     debug_result = await Diagnostic.debug_mongodb_connection(db_connection, collection_name)
-                    logger.info(f"MongoDB Diagnostics: {json.dumps(debug_result, default=str)}")
+                    if logger.isEnabledFor(logging.INFO):
+                        logger.info("MongoDB Diagnostics: %s", to_json(debug_result))
                     
                     # Using diagnostic information for better fallback selection
                     if debug_result.get("available_collections"):
@@ -687,13 +1873,13 @@ class AIQuery:
             
             
             # In case of error, generate a safe and simple query with the selected collection
-            return MongoDBQuery(
-                collection=selected_collection or (available_collections[0] if available_collections else "users"),
-                operation="find",
-                query={},
-                limit=10,
-                skip=0
-            )
+            return MongoDBQuery.from_trusted({
+                "collection": selected_collection or (available_collections[0] if available_collections else "users"),
+                "operation": "find",
+                "query": {},
+                "limit": 10,
+                "skip": 0
+            })
             
     @staticmethod
     def clean_json_response(response_text: str) -> str:
@@ -705,7 +1891,7 @@ class AIQuery:
             json_text = json_text[3:-3].strip()
         elif '```' in json_text:
             # Extract content between the first triple quotes of code
-            match = re.search(r'```(?:json)?(.*?)```', json_text, re.DOTALL)
+            match = _JSON_FENCE_RE.search(json_text)
             if match:
                 json_text = match.group(1).strip()
                 
@@ -719,7 +1905,8 @@ class AIQuery:
     async def generate_result_explanation(
         query: str,
         mongo_query: Any,
-        result: QueryResult
+        result: QueryResult,
+        query_language: Optional[str] = None
     ) -> str:
         """
        Generates a natural language explanation of the results of a MongoDB query.
@@ -728,29 +1915,17 @@ class AIQuery:
             query: Original natural language query
             mongo_query: Generated MongoDB query (object or dictionary)
             result: Query result
+            query_language: Language of the query, if already detected
 
         Returns:
             Natural language explanation
         """
         # Convert mongo_query to dictionary if it is an object
-        if hasattr(mongo_query, "model_dump"):
-            mongo_query_dict = mongo_query.model_dump()
-        elif hasattr(mongo_query, "dict"):
-            mongo_query_dict = mongo_query.dict()
-        elif not isinstance(mongo_query, dict):
-            # Trying to extract common attributes
-            mongo_query_dict = {
-                "collection": getattr(mongo_query, "collection", ""),
-                "operation": getattr(mongo_query, "operation", "find"),
-                "filter": getattr(mongo_query, "filter", {}),
-                "projection": getattr(mongo_query, "projection", {}),
-                "sort": getattr(mongo_query, "sort", {}),
-                "limit": getattr(mongo_query, "limit", 0),
-                "skip": getattr(mongo_query, "skip", 0),
-                "pipeline": getattr(mongo_query, "pipeline", [])
-            }
-        else:
-            mongo_query_dict = mongo_query
+        mongo_query_dict = _to_dict(mongo_query)
+        
+        # Nothing for the model to explain: answer without calling OpenAI
+        if result.count == 0:
+            return f"No documents were found in the collection {mongo_query_dict.get('collection', '')} that match your query."
         
         # Limit output for the prompt
         result_sample = result.data[:5] if isinstance(result.data, list) else [result.data]
@@ -773,7 +1948,23 @@ class AIQuery:
         has_filter = bool(filter_criteria)
         has_projection = bool(fields)
         
-        # Create summary for context
+        # Specific information according to the type of operation
+        operation_name = operation.lower() if isinstance(operation, str) else operation
+        if operation_name in _FIND_OPERATIONS:
+            details = {
+                "filter_criteria": filter_criteria,
+                "sort": mongo_query_dict.get("sort", {}),
+                "limit": mongo_query_dict.get("limit", 0),
+                "skip": mongo_query_dict.get("skip", 0)
+            }
+        elif operation_name == "aggregate":
+            details = {"pipeline_stages": [next(iter(stage), None) if isinstance(stage, dict) else str(stage) for stage in pipeline]}
+        elif operation_name in _WRITE_ONE_OPERATIONS:
+            details = {"affected_documents": result.count}
+        else:
+            details = {}
+        
+        # Create summary for context in a single construction
         summary = {
             "query_type": query_type,
             "collection": collection,
@@ -783,20 +1974,10 @@ class AIQuery:
             "has_filter": has_filter,
             "has_projection": has_projection,
             "fields_selected": fields,
-            "fields_in_results": fields_in_results
+            "fields_in_results": fields_in_results,
+            **details
         }
         
-        # Add specific information according to the type of operation
-        if operation == "find" or operation == "findOne":
-            summary["filter_criteria"] = filter_criteria
-            summary["sort"] = mongo_query_dict.get("sort", {})
-            summary["limit"] = mongo_query_dict.get("limit", 0)
-            summary["skip"] = mongo_query_dict.get("skip", 0)
-        elif operation == "aggregate":
-            summary["pipeline_stages"] = [list(stage.keys())[0] if isinstance(stage, dict) else str(stage) for stage in pipeline]
-        elif operation in ["insertOne", "updateOne", "deleteOne"]:
-            summary["affected_documents"] = result.count
-        
         # Preparing context for OpenAI
         context = {
             "original_query": query,
@@ -807,16 +1988,10 @@ class AIQuery:
             "summary": summary
         }
         
-        try:
-            query_language = detect(query)
-        except:
-            query_language = "es"  # Default value if cannot be detected
-
-        query_language = detect(query)
+        if query_language is None:
+            query_language = _detect_language(query)
         context["detected_language"] = query_language
         
-        context_json = json.dumps(context, indent=2, default=str)
-                
         # Generar prompt para OpenAI
         system_prompt = f"""
         You are an assistant specialized in explaining MongoDB query results.
@@ -846,24 +2021,12 @@ class AIQuery:
         """
         
         try:
-            # Initialize OpenAI client
-            client = openai.AsyncOpenAI(api_key=settings.OPENAI.OPENAI_API_KEY)
-            
-            # Submit application to OpenAI
-            response = await client.chat.completions.create(
-                model=settings.OPENAI.OPENAI_MODEL,
-                max_tokens=settings.OPENAI.MAX_TOKENS,
-                temperature=0.7,  #A little more creativity for the explanation
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Explain the results of this MOngoDB query in {context['detected_language']}:\n{context_json}"}
-                ]
+            # Submit application to OpenAI (or reuse a cached explanation)
+            return await _create_explanation(
+                system_prompt,
+                f"Explain the results of this MOngoDB query in {context['detected_language']}",
+                context
             )
-            
-            # Extract explanation
-            explanation = response.choices[0].message.content
-            
-            return explanation
         
         except Exception as e:
             # In case of error, generate basic explanation
@@ -876,16 +2039,12 @@ class AIQuery:
                 explanation = f"{result.count} documents were found in the {collection} collection."
                 
                 # Add information about the type of operation
-                if operation == "findOne":
+                if operation_name == "findone":
                     explanation = f"The requested document was found in the {collection} collection."
-                elif operation == "aggregate":
+                elif operation_name == "aggregate":
                     explanation = f"Aggregation on collection {collection} returned {result.count} results."
-                elif operation == "insertOne":
-                    explanation = f"A new document has been successfully inserted into the {collection} collection."
-                elif operation == "updateOne":
-                    explanation = f"A document in the {collection} collection has been successfully updated."
-                elif operation == "deleteOne":
-                    explanation = f"A document has been successfully deleted from the {collection} collection."
+                elif operation_name in _WRITE_ONE_OPERATIONS:
+                    explanation = _WRITE_ONE_EXPLANATIONS[operation_name].format(collection=collection)
                 
                 # Add information about fields if available
                 if fields_in_results:
@@ -903,26 +2062,24 @@ class AIQuery:
                 return explanation
     
     @staticmethod
-    async def generate_sql_result_explanation(
+    def _sql_explanation_request(
         query: str,
         sql_query: str,
-        result: QueryResult
-    ) -> str:
+        result: QueryResult,
+        query_language: Optional[str] = None
+    ) -> Tuple[str, str, Dict[str, Any]]:
         """
-       Generates a natural language explanation of the results of an SQL query.
+        Prepares the OpenAI request that explains the results of an SQL query.
 
         Args:
             query: Original natural language query
             sql_query: Executed SQL query
-            result: Query result
+            result: Query result (with at least one row)
+            query_language: Language of the query, if already detected
 
         Returns:
-            Natural language explanation
+            Tuple (system prompt, instruction, results context)
         """
-        # Check for results
-        if result.count == 0:
-            return "No records were found that match your query."
-        
         # Limit output for the prompt
         result_sample = result.data[:5]
         
@@ -932,33 +2089,30 @@ class AIQuery:
             column_names = list(result.data[0].keys())
         
         # Analyze the SQL query to extract relevant information
-        sql_lower = sql_query.lower()
+        features = _sql_features(sql_query)
         selected_tables = []
         join_tables = []
         
         # Detect tables in the query
-        from_pattern = r'from\s+([a-zA-Z0-9_\.]+)'
-        join_pattern = r'join\s+([a-zA-Z0-9_\.]+)'
-        
-        from_matches = re.findall(from_pattern, sql_lower)
+        from_matches = _FROM_TABLE_RE.findall(sql_query)
         if from_matches:
             selected_tables.extend(from_matches)
         
-        join_matches = re.findall(join_pattern, sql_lower)
+        join_matches = _JOIN_TABLE_RE.findall(sql_query)
         if join_matches:
             join_tables.extend(join_matches)
         
         # Detectar tipo de consulta SQL
         query_type = "consulta"
-        if "count" in sql_lower and "group by" not in sql_lower:
+        if ("count" in features or "count(" in features) and "groupby" not in features:
             query_type = "conteo"
-        elif "group by" in sql_lower:
+        elif "groupby" in features:
             query_type = "agrupación"
-        elif "join" in sql_lower:
+        elif "join" in features:
             query_type = "relación"
-        elif "order by" in sql_lower:
+        elif "orderby" in features:
             query_type = "ordenamiento"
-        elif "where" in sql_lower:
+        elif "where" in features:
             query_type = "filtrado"
         
         # Crear resumen básico para incluir en el contexto
@@ -968,9 +2122,9 @@ class AIQuery:
             "execution_time_ms": result.query_time_ms,
             "tables_involved": selected_tables + join_tables,
             "columns_returned": column_names,
-            "has_aggregation": "group by" in sql_lower or "sum(" in sql_lower or "avg(" in sql_lower or "count(" in sql_lower,
-            "has_conditions": "where" in sql_lower,
-            "has_ordering": "order by" in sql_lower,
+            "has_aggregation": not features.isdisjoint(_SQL_AGGREGATION_FEATURES),
+            "has_conditions": "where" in features,
+            "has_ordering": "orderby" in features,
             "has_joins": len(join_tables) > 0
         }
         
@@ -985,102 +2139,127 @@ class AIQuery:
             "summary": summary,
             "column_names": column_names
         }
+        
+        # Estadísticas de todas las filas; de los datos solo se envía la muestra
+        column_stats = _numeric_column_stats(result.data)
+        if column_stats:
+            context["column_stats"] = column_stats
 
-        try:
-            query_language = detect(query)
-        except:
-            query_language = "es"  # Valor predeterminado si no se puede detectar
-
-        query_language = detect(query)
-        print("Lenguaje identificado: ", query_language)
+        if query_language is None:
+            query_language = _detect_language(query)
         context["detected_language"] = query_language
         
-        context_json = json.dumps(context, indent=2, default=str)
+        # Generar prompt para OpenAI (plantilla precalculada por idioma)
+        system_prompt = _sql_explanation_system_prompt(query_language)
         
-        LANGUAGE_MAPPING = {
-            "en": "English",
-            "es": "Spanish",
-            "fr": "French",
-            "de": "German",
-            "it": "Italian",
-            "pt": "Portuguese"
-        }
+        return (
+            system_prompt,
+            f"Explica los resultados de esta consulta SQL en {context['detected_language']}",
+            context
+        )
+    
+    @staticmethod
+    def _default_sql_explanation(result: QueryResult, context: Dict[str, Any]) -> str:
+        """
+        Builds a basic explanation of the results of an SQL query, used when
+        OpenAI cannot generate one.
 
-        language_name = LANGUAGE_MAPPING.get(query_language, "English")
+        Args:
+            result: Query result
+            context: Results context of the request
+
+        Returns:
+            Basic explanation
+        """
+        explanation = f"Se encontraron {result.count} registros en la base de datos."
         
-        # Generar prompt para OpenAI
-        system_prompt = f"""
-            You are a specialized assistant for explaining SQL query results.
-            YOUR ENTIRE RESPONSE MUST BE IN {language_name} ONLY.
+        # Añadir información básica sobre las columnas si están disponibles
+        column_names = context["column_names"]
+        if column_names:
+            explanation += f" Los campos presentes en los resultados son: {', '.join(column_names)}."
+        
+        # Añadir información sobre las tablas involucradas
+        tables = context["summary"]["tables_involved"]
+        if tables:
+            explanation += f" La consulta se realizó sobre {', '.join(set(tables))}."
+        
+        # Añadir información sobre el tiempo de ejecución
+        if result.query_time_ms > 0:
+            explanation += f" La consulta se ejecutó en {result.query_time_ms:.1f} ms."
+            
+        return explanation
+    
+    @staticmethod
+    async def generate_sql_result_explanation(
+        query: str,
+        sql_query: str,
+        result: QueryResult,
+        query_language: Optional[str] = None
+    ) -> str:
+        """
+       Generates a natural language explanation of the results of an SQL query.
 
-            Current detected language: {query_language} ({language_name})
+        Args:
+            query: Original natural language query
+            sql_query: Executed SQL query
+            result: Query result
+            query_language: Language of the query, if already detected
 
-            CRITICAL: The user's query was detected to be in {language_name}. 
-            YOU MUST RESPOND ONLY IN {language_name}.
+        Returns:
+            Natural language explanation
+        """
+        # Check for results
+        if result.count == 0:
+            return "No records were found that match your query."
+        
+        system_prompt, instruction, context = AIQuery._sql_explanation_request(query, sql_query, result, query_language)
+        
+        try:
+            # Enviar solicitud a OpenAI (o reutilizar una explicación en caché)
+            return await _create_explanation(system_prompt, instruction, context)
+        
+        except Exception as e:
+            # En caso de error, generar explicación básica
+            logger.error(f"Error al generar explicación SQL: {str(e)}")
+            return AIQuery._default_sql_explanation(result, context)
+    
+    @staticmethod
+    async def stream_sql_result_explanation(
+        query: str,
+        sql_query: str,
+        result: QueryResult,
+        query_language: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Streams the natural language explanation of the results of an SQL
+        query, so the client can show it while it is being generated.
 
-            Guidelines:
-            1. Begin with a concise summary of the results (how many records were found)
-            2. Describe the type of query performed (search, filtering, relation, count, etc.) without using SQL terminology
-            3. Comment on the most important findings or patterns identified
-            4. Highlight relevant information about the displayed data
-            5. When appropriate, mention specific values (maximums, minimums, averages, etc.)
-            6. The explanation should be understandable for people without technical knowledge
-            7. Use accessible but precise language
-            8. DO NOT mention SQL syntax or technical terms like JOIN, GROUP BY, etc.
-            9. Prioritize relevance to the user over technical details
+        Args:
+            query: Original natural language query
+            sql_query: Executed SQL query
+            result: Query result
+            query_language: Language of the query, if already detected
 
-            Desired format:
-            - Start with a direct and clear summary
-            - Continue with 1-3 important observations about the data
-            - If relevant, end with a brief conclusion
-            - Keep the explanation to 100-150 words maximum
-            - YOUR RESPONSE MUST BE ENTIRELY IN {language_name}
+        Yields:
+            Fragments of the explanation
         """
+        if result.count == 0:
+            yield "No records were found that match your query."
+            return
         
+        system_prompt, instruction, context = AIQuery._sql_explanation_request(query, sql_query, result, query_language)
+        
+        sent = False
         try:
-            # Inicializar cliente OpenAI
-            client = openai.AsyncOpenAI(api_key=settings.OPENAI.OPENAI_API_KEY)
-            
-            # Enviar solicitud a OpenAI
-            response = await client.chat.completions.create(
-                model=settings.OPENAI.OPENAI_MODEL,
-                max_tokens=settings.OPENAI.MAX_TOKENS,
-                temperature=0.7,  # Un poco más de creatividad para la explicación
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Explica los resultados de esta consulta SQL en {context['detected_language']}:\n{context_json}"}
-                ]
-            )
-            
-            # Extraer explicación
-            explanation = response.choices[0].message.content
-            
-            return explanation
+            async for part in _stream_explanation(system_prompt, instruction, context):
+                sent = True
+                yield part
         
         except Exception as e:
-            # En caso de error, generar explicación básica
             logger.error(f"Error al generar explicación SQL: {str(e)}")
-            
-            # Crear una explicación sencilla basada en los datos disponibles
-            if result.count == 0:
-                return "No se encontraron registros que coincidan con tu consulta."
-            else:
-                explanation = f"Se encontraron {result.count} registros en la base de datos."
-                
-                # Añadir información básica sobre las columnas si están disponibles
-                if column_names:
-                    explanation += f" Los campos presentes en los resultados son: {', '.join(column_names)}."
-                
-                # Añadir información sobre las tablas involucradas
-                if selected_tables or join_tables:
-                    tables = list(set(selected_tables + join_tables))
-                    explanation += f" La consulta se realizó sobre {', '.join(tables)}."
-                
-                # Añadir información sobre el tiempo de ejecución
-                if result.query_time_ms > 0:
-                    explanation += f" La consulta se ejecutó en {result.query_time_ms:.1f} ms."
-                    
-                return explanation
+            # Si aún no se envió nada, generar explicación básica
+            if not sent:
+                yield AIQuery._default_sql_explanation(result, context)
          
     @staticmethod
     async def process_natural_language_query(
@@ -1110,6 +2289,9 @@ class AIQuery:
                 # Para bases de datos SQL
                 engine = db_schema.get("engine", "sqlite").lower()
                 
+                # Detectar el idioma en segundo plano mientras se genera y ejecuta la consulta
+                language_task = asyncio.create_task(asyncio.to_thread(_detect_language, query))
+                
                 # Generar consulta SQL
                 sql_query = await AIQuery.generate_sql_query(query, db_schema, engine)
                 
@@ -1129,7 +2311,9 @@ class AIQuery:
                 )
                 
                 # Generar explicación
-                explanation = await AIQuery.generate_sql_result_explanation(query, sql_query, result)
+                explanation = await AIQuery.generate_sql_result_explanation(
+                    query, sql_query, result, query_language=await language_task
+                )
                 
                 # Devolver respuesta completa
                 return {
@@ -1145,8 +2329,10 @@ class AIQuery:
                 # Para MongoDB
                 
                 if db_connection:
-                    debug_info = await Diagnostic.debug_mongodb_connection(db_connection)
-                    logger.info(f"Diagnóstico MongoDB previo a consulta: {json.dumps(debug_info, default=str)}")
+                    # Un diagnóstico correcto de hace unos segundos evita otro ping
+                    debug_info = await Diagnostic.debug_mongodb_connection(db_connection, require_connected=True)
+                    if logger.isEnabledFor(logging.INFO):
+                        logger.info("Diagnóstico MongoDB previo a consulta: %s", to_json(debug_info))
                     
                     if debug_info.get("connection_status") != "connected":
                         return {
@@ -1157,6 +2343,9 @@ class AIQuery:
                             "debug_info": debug_info
                         }
                 
+                # Detectar el idioma en segundo plano mientras se genera la consulta
+                language_task = asyncio.create_task(asyncio.to_thread(_detect_language, query))
+                
                 # Generar consulta MongoDB
                 mongo_query = await AIQuery.generate_mongodb_query(
                     query, db_schema, collection_name, db_connection
@@ -1178,25 +2367,12 @@ class AIQuery:
                 
                 # Preparar el objeto de consulta para devolverlo
                 # Convertir MongoDBQuery a dict de forma segura
-                if hasattr(mongo_query, "model_dump"):
-                    query_dict = mongo_query.model_dump()
-                elif hasattr(mongo_query, "dict"):
-                    query_dict = mongo_query.dict()
-                else:
-                    # Fallback: crear diccionario manualmente
-                    query_dict = {
-                        "collection": getattr(mongo_query, "collection", ""),
-                        "operation": getattr(mongo_query, "operation", "find"),
-                        "query": getattr(mongo_query, "query", {}),
-                        "pipeline": getattr(mongo_query, "pipeline", []),
-                        "projection": getattr(mongo_query, "projection", {}),
-                        "sort": getattr(mongo_query, "sort", {}),
-                        "limit": getattr(mongo_query, "limit", 10),
-                        "skip": getattr(mongo_query, "skip", 0)
-                    }
+                query_dict = _to_dict(mongo_query)
                 
                 # Generar explicación
-                explanation = await AIQuery.generate_result_explanation(query, mongo_query, result)
+                explanation = await AIQuery.generate_result_explanation(
+                    query, mongo_query, result, query_language=await language_task
+                )
                 
                 # Devolver respuesta completa
                 return {
@@ -1215,9 +2391,11 @@ class AIQuery:
                 }
                 
         except Exception as e:
-            logger.error(f"Error al procesar consulta en lenguaje natural: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
+            logger.exception("Error al procesar consulta en lenguaje natural: %s", e)
+            
+            # El diagnóstico en caché puede no reflejar ya el estado de la conexión
+            if db_connection is not None:
+                Diagnostic.invalidate_mongodb_connection(db_connection)
             
             return {
                 "explanation": f"Error al procesar la consulta: {str(e)}",
@@ -1226,6 +2404,19 @@ class AIQuery:
                 "error": True
             }
             
+    @staticmethod
+    def _build_collections_system_prompt(db_schema: Dict[str, Any]) -> str:
+        """
+        Construye el system prompt que identifica las colecciones de una consulta.
+        
+        Args:
+            db_schema: Esquema de la base de datos
+            
+        Returns:
+            System prompt
+        """
+        return _collections_system_prompt(db_schema)
+    
     @staticmethod
     async def process_collections_query(
         question: str,
@@ -1244,46 +2435,24 @@ class AIQuery:
         """
 
         # Crear system prompt para consulta MongoDB
-        system_prompt = f"""
-        Eres un asistente especializado en identificar las colecciones necesarias y relativas a la consulta del usuario.
-        
-        ESTRUCTURA DE LA BASE DE DATOS:
-        {db_schema}
-    
-        Tu tarea es:
-        1. Analizar cuidadosamente la consulta del usuario
-        2. Entender el esquema de la base de datos
-        3. Determinar cual o cuales son las colecciones que se deben consultar
-        
-        Responde ÚNICAMENTE con las colecciones que se deben consultar en formato de lista, separadas por comas.
-        """
+        system_prompt = AIQuery._build_collections_system_prompt(db_schema)
         
         try:
-            # Inicializar cliente de OpenAI
-            client = openai.AsyncOpenAI(api_key=settings.OPENAI.OPENAI_API_KEY)
-
-            # Enviar solicitud a OpenAI
-            response = await client.chat.completions.create(
-                model=settings.OPENAI.OPENAI_MODEL,
-                max_tokens=settings.OPENAI.MAX_TOKENS,
-                temperature=0.2,  # Temperatura baja para respuestas más deterministas
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": question}
-                ]
-            )
+            # Reutilizar la respuesta de una pregunta parecida sobre el mismo esquema
+            scope = (settings.OPENAI.OPENAI_MODEL_CLASSIFIER, system_prompt)
+            query_data, vector = await SemanticCache.lookup(_SEMANTIC_COLLECTIONS_TAG, scope, question, _embed)
+            if query_data is not None:
+                return query_data
             
-            # Extraer y procesar respuesta JSON
-            ai_response = response.choices[0].message.content
-            json_text = AIQuery.clean_json_response(ai_response)
-            
-            # Parsear JSON
-            query_data = json.loads(json_text)
+            # Las consultas concurrentes sobre el mismo esquema comparten una solicitud a OpenAI
+            query_data = await _collections_batcher.submit(system_prompt, question)
             
+            await SemanticCache.store(_SEMANTIC_COLLECTIONS_TAG, scope, question, vector, query_data)
             return query_data
             
         except Exception as e:
-            logger.error(f"Error al generar consulta MongoDB: {str(e)}")
+            logger.exception("Error al generar consulta MongoDB: %s", e)
             
             
         
+    
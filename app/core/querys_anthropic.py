@@ -739,9 +739,7 @@ class AIQuery:
                 }
                 
         except Exception as e:
-            logger.error(f"Error al procesar consulta en lenguaje natural: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
+            logger.exception("Error al procesar consulta en lenguaje natural: %s", e)
             
             return {
                 "explanation": f"Error al procesar la consulta: {str(e)}",
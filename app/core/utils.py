@@ -1,12 +1,97 @@
 import uuid
 import json
 from datetime import datetime, date
+from functools import lru_cache
 from typing import Any
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional, Tuple
 
 from app.core.logging import logger
 
+# Palabras clave comunes en consultas de bases de datos, por tema
+_QUERY_THEMES = {
+    "usuarios": ("usuario", "user", "persona", "cliente", "correo", "email", "nombre"),
+    "productos": ("producto", "item", "artículo", "articulo", "mercancía", "mercancia"),
+    "ventas": ("venta", "compra", "transacción", "transaccion", "pedido", "orden"),
+    "servicios": ("servicio", "service", "prestación", "prestacion"),
+    "documentos": ("documento", "archivo", "fichero", "file", "record"),
+    "mensajes": ("mensaje", "message", "correo", "notificación", "notificacion", "comunicación", "comunicacion"),
+    "registros": ("registro", "record", "log", "entrada", "history", "actividad")
+}
+
+# Términos de consultas generales sobre la base de datos
+_DATABASE_TERMS = ("base de datos", "base datos", "bbdd", "bd", "database", "db", "schema", "estructura")
+
+# Colecciones comunes priorizadas en consultas generales
+_COMMON_COLLECTIONS = ("users", "customers", "clients", "accounts", "products", "orders", "items")
+
+@lru_cache(maxsize=256)
+def _collection_names(available_collections: Tuple[str, ...]) -> Tuple[Tuple[str, str, str], ...]:
+    """
+    Normaliza una vez por esquema los nombres de colecciones.
+    
+    Args:
+        available_collections: Colecciones disponibles
+        
+    Returns:
+        Tuplas (nombre original, nombre en minúsculas, singular en minúsculas)
+    """
+    names = []
+    for collection in available_collections:
+        collection_normalized = collection.lower()
+        collection_singular = collection_normalized[:-1] if collection_normalized.endswith('s') else collection_normalized
+        names.append((collection, collection_normalized, collection_singular))
+    return tuple(names)
+
+@lru_cache(maxsize=4096)
+def _match_collection(query_lower: str, available_collections: Tuple[str, ...]) -> Optional[Tuple[str, str]]:
+    """
+    Pasos de determine_best_collection que no consultan la base de datos.
+    
+    Args:
+        query_lower: Consulta normalizada a minúsculas
+        available_collections: Colecciones disponibles, en su orden original
+        
+    Returns:
+        Tupla (colección, motivo de la selección) o None si ningún paso coincide
+    """
+    names = _collection_names(available_collections)
+    
+    # 1. Buscar menciones directas de colecciones en la consulta
+    for collection, collection_normalized, collection_singular in names:
+        # Buscar el nombre completo o versión singular en la consulta
+        if collection_normalized in query_lower or collection_singular in query_lower:
+            return collection, "mención directa"
+    
+    # 2. Inferir el tema de la consulta y relacionarlo con los nombres de colecciones
+    theme_scores = {}
+    for theme, keywords in _QUERY_THEMES.items():
+        score = sum(1 for keyword in keywords if keyword in query_lower)
+        if score > 0:
+            theme_scores[theme] = score
+    
+    # Si encontramos temas relevantes, buscar colecciones que puedan relacionarse
+    if theme_scores:
+        # Ordenar temas por relevancia
+        sorted_themes = sorted(theme_scores.items(), key=lambda x: x[1], reverse=True)
+        
+        # Buscar colecciones que coincidan con los temas más relevantes
+        for theme, _ in sorted_themes:
+            for collection, collection_lower, _ in names:
+                # Comprobar si el tema está relacionado con el nombre de la colección
+                if (theme in collection_lower or
+                    any(kw in collection_lower for kw in _QUERY_THEMES[theme])):
+                    return collection, "tema de consulta"
+    
+    # 3. Para consultas generales sobre la base de datos, priorizar ciertas colecciones comunes
+    if any(term in query_lower for term in _DATABASE_TERMS):
+        for common in _COMMON_COLLECTIONS:
+            for collection, collection_lower, _ in names:
+                if common in collection_lower:
+                    return collection, "nombre común"
+    
+    return None
+
 class Utils:
     
     @staticmethod
@@ -29,64 +114,12 @@ class Utils:
         if len(available_collections) == 1:
             return available_collections[0]  # Si solo hay una colección, usarla
         
-        # Normalizar la consulta
-        query_lower = query.lower()
-        
-        # 1. Buscar menciones directas de colecciones en la consulta
-        for collection in available_collections:
-            # Normalizar el nombre de la colección para la comparación
-            collection_normalized = collection.lower()
-            collection_singular = collection_normalized[:-1] if collection_normalized.endswith('s') else collection_normalized
-            
-            # Buscar el nombre completo o versión singular en la consulta
-            if collection_normalized in query_lower or collection_singular in query_lower:
-                logger.info(f"Colección seleccionada por mención directa: {collection}")
-                return collection
-        
-        # 2. Inferir el tema de la consulta y relacionarlo con los nombres de colecciones
-        # Palabras clave comunes en consultas de bases de datos
-        query_themes = {
-            "usuarios": ["usuario", "user", "persona", "cliente", "correo", "email", "nombre"],
-            "productos": ["producto", "item", "artículo", "articulo", "mercancía", "mercancia"],
-            "ventas": ["venta", "compra", "transacción", "transaccion", "pedido", "orden"],
-            "servicios": ["servicio", "service", "prestación", "prestacion"],
-            "documentos": ["documento", "archivo", "fichero", "file", "record"],
-            "mensajes": ["mensaje", "message", "correo", "notificación", "notificacion", "comunicación", "comunicacion"],
-            "registros": ["registro", "record", "log", "entrada", "history", "actividad"]
-        }
-        
-        # Calcular relevancia de cada tema para la consulta
-        theme_scores = {}
-        for theme, keywords in query_themes.items():
-            score = sum(1 for keyword in keywords if keyword in query_lower)
-            if score > 0:
-                theme_scores[theme] = score
-        
-        # Si encontramos temas relevantes, buscar colecciones que puedan relacionarse
-        if theme_scores:
-            # Ordenar temas por relevancia
-            sorted_themes = sorted(theme_scores.items(), key=lambda x: x[1], reverse=True)
-            
-            # Buscar colecciones que coincidan con los temas más relevantes
-            for theme, _ in sorted_themes:
-                for collection in available_collections:
-                    collection_lower = collection.lower()
-                    
-                    # Comprobar si el tema está relacionado con el nombre de la colección
-                    if (theme in collection_lower or
-                        any(kw in collection_lower for kw in query_themes[theme])):
-                        logger.info(f"Colección seleccionada por tema de consulta: {collection}")
-                        return collection
-        
-        # 3. Para consultas generales sobre la base de datos, priorizar ciertas colecciones comunes
-        if any(term in query_lower for term in ["base de datos", "base datos", "bbdd", "bd", "database", "db", "schema", "estructura"]):
-            # Priorizar colecciones comunes por nombre
-            common_collections = ["users", "customers", "clients", "accounts", "products", "orders", "items"]
-            for common in common_collections:
-                for collection in available_collections:
-                    if common in collection.lower():
-                        logger.info(f"Colección seleccionada por nombre común: {collection}")
-                        return collection
+        # Pasos 1-3: dependen solo de la consulta y de las colecciones, así que se memorizan
+        match = _match_collection(query.lower().strip(), tuple(available_collections))
+        if match is not None:
+            collection, reason = match
+            logger.info(f"Colección seleccionada por {reason}: {collection}")
+            return collection
         
         # 4. Como última opción, intentar inferir la colección principal basada en el número de documentos
         if db_connection:
@@ -119,94 +152,106 @@ class Utils:
     
     class JSON:
 
+        @staticmethod
+        def default(obj: Any) -> Any:
+            """
+            Convierte tipos comunes no serializables por defecto en la aplicación
+            Corebrain. Sirve como hook `default` para json y orjson.
+            """
+            # Manejar modelos Pydantic
+            if isinstance(obj, BaseModel):
+                # Intentar primero con la versión V2 de Pydantic
+                if hasattr(obj, "model_dump"):
+                    return obj.model_dump()
+                # Luego con V1
+                elif hasattr(obj, "dict"):
+                    return obj.dict()
+            
+            # Manejar fechas y horas
+            if isinstance(obj, (datetime, date)):
+                return obj.isoformat()
+            
+            # Manejar UUID
+            if isinstance(obj, uuid.UUID):
+                return str(obj)
+            
+            # Manejar bytes y bytearray
+            if isinstance(obj, (bytes, bytearray)):
+                return obj.decode('utf-8', errors='replace')
+            
+            # Manejar sets y frozensets
+            if isinstance(obj, (set, frozenset)):
+                return list(obj)
+            
+            # Manejar objetos con método de serialización personalizado
+            if hasattr(obj, "to_json"):
+                return obj.to_json()
+            
+            # Manejar objetos personalizados con __dict__
+            if hasattr(obj, "__dict__"):
+                return {k: v for k, v in obj.__dict__.items() if not k.startswith("_")}
+            
+            raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
         class CorebrainJSONEncoder(json.JSONEncoder):
             """
             Encoder JSON personalizado para manejar tipos comunes no serializables 
             por defecto en la aplicación Corebrain.
             """
             def default(self, obj: Any) -> Any:
-                # Manejar modelos Pydantic
-                if isinstance(obj, BaseModel):
-                    # Intentar primero con la versión V2 de Pydantic
-                    if hasattr(obj, "model_dump"):
-                        return obj.model_dump()
-                    # Luego con V1
-                    elif hasattr(obj, "dict"):
-                        return obj.dict()
-                
-                # Manejar fechas y horas
-                if isinstance(obj, (datetime, date)):
-                    return obj.isoformat()
-                
-                # Manejar UUID
-                if isinstance(obj, uuid.UUID):
-                    return str(obj)
-                
-                # Manejar bytes y bytearray
-                if isinstance(obj, (bytes, bytearray)):
-                    return obj.decode('utf-8', errors='replace')
-                
-                # Manejar sets y frozensets
-                if isinstance(obj, (set, frozenset)):
-                    return list(obj)
-                
-                # Manejar objetos con método de serialización personalizado
-                if hasattr(obj, "to_json"):
-                    return obj.to_json()
-                
-                # Manejar objetos personalizados con __dict__
-                if hasattr(obj, "__dict__"):
-                    return {k: v for k, v in obj.__dict__.items() if not k.startswith("_")}
-                
-                # Dejar que JSONEncoder estándar maneje el error para tipos desconocidos
-                return super().default(obj)
+                return Utils.JSON.default(obj)
 
+        # Instancia reutilizada por dumps() cuando no se pasan opciones extra
+        _ENCODER = CorebrainJSONEncoder()
 
-            def dumps(obj: Any, **kwargs) -> str:
-                """
-                Wrapper para json.dumps que usa el encoder personalizado.
+        @staticmethod
+        def dumps(obj: Any, **kwargs) -> str:
+            """
+            Wrapper para json.dumps que usa el encoder personalizado.
+            
+            Args:
+                obj: Objeto a serializar a JSON
+                **kwargs: Argumentos adicionales para json.dumps
                 
-                Args:
-                    obj: Objeto a serializar a JSON
-                    **kwargs: Argumentos adicionales para json.dumps
-                    
-                Returns:
-                    Cadena JSON
-                """
-                return json.dumps(obj, cls=Utils.JSON.CorebrainJSONEncoder, **kwargs)
-
+            Returns:
+                Cadena JSON
+            """
+            if not kwargs:
+                return Utils.JSON._ENCODER.encode(obj)
+            return json.dumps(obj, cls=Utils.JSON.CorebrainJSONEncoder, **kwargs)
 
-            def loads(s: str, **kwargs) -> Any:
-                """
-                Wrapper para json.loads.
+        @staticmethod
+        def loads(s: str, **kwargs) -> Any:
+            """
+            Wrapper para json.loads.
+            
+            Args:
+                s: Cadena JSON a deserializar
+                **kwargs: Argumentos adicionales para json.loads
                 
-                Args:
-                    s: Cadena JSON a deserializar
-                    **kwargs: Argumentos adicionales para json.loads
-                    
-                Returns:
-                    Objeto Python
-                """
-                return json.loads(s, **kwargs)
-
+            Returns:
+                Objeto Python
+            """
+            return json.loads(s, **kwargs)
 
-            # Función para serializar modelos Pydantic específicamente
-            def serialize_model(model: Any) -> dict:
-                """
-                Convierte un modelo Pydantic u otro objeto a un diccionario serializable a JSON.
+        # Función para serializar modelos Pydantic específicamente
+        @staticmethod
+        def serialize_model(model: Any) -> dict:
+            """
+            Convierte un modelo Pydantic u otro objeto a un diccionario serializable a JSON.
+            
+            Args:
+                model: Modelo a serializar
                 
-                Args:
-                    model: Modelo a serializar
-                    
-                Returns:
-                    Diccionario serializable
-                """
-                if hasattr(model, "model_dump"):  # Pydantic V2
-                    return model.model_dump()
-                elif hasattr(model, "dict"):      # Pydantic V1
-                    return model.dict()
-                elif isinstance(model, dict):
-                    return model
-                elif hasattr(model, "__dict__"):
-                    return {k: v for k, v in model.__dict__.items() if not k.startswith("_")}
-                return model  # Si no podemos serializar, devolvemos el objeto original
\ No newline at end of file
+            Returns:
+                Diccionario serializable
+            """
+            if hasattr(model, "model_dump"):  # Pydantic V2
+                return model.model_dump()
+            elif hasattr(model, "dict"):      # Pydantic V1
+                return model.dict()
+            elif isinstance(model, dict):
+                return model
+            elif hasattr(model, "__dict__"):
+                return {k: v for k, v in model.__dict__.items() if not k.startswith("_")}
+            return model  # Si no podemos serializar, devolvemos el objeto original
@@ -156,4 +156,6 @@ class BaseRepository(Generic[T]):
         """
         Cuenta documentos según un filtro
         """
+        if not query:
+            return await self.collection.estimated_document_count()
         return await self.collection.count_documents(query)
\ No newline at end of file
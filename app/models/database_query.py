@@ -35,11 +35,27 @@ class MongoDBQuery(BaseModel):
     pipeline: Optional[List[Dict[str, Any]]] = None
     document: Optional[Dict[str, Any]] = None
     update: Optional[Dict[str, Any]] = None
+    # Operaciones masivas: documentos de insertMany y operaciones de bulkWrite
+    documents: Optional[List[Dict[str, Any]]] = None
+    operations: Optional[List[Dict[str, Any]]] = None
     
     class Config:
         extra = "allow"  # Permitir campos adicionales
     
     def __init__(self, **data):
+        super().__init__(**self._normalize(data))
+    
+    @staticmethod
+    def _normalize(data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Sincroniza filter/query y normaliza la operación a minúsculas.
+        
+        Args:
+            data: Campos de la consulta (se modifican in situ)
+            
+        Returns:
+            Los mismos campos normalizados
+        """
         # Normalizar filter/query para sincronizarlos
         # Si hay filter pero no query, usar filter como query
         if "filter" in data and data["filter"] is not None:
@@ -54,7 +70,21 @@ class MongoDBQuery(BaseModel):
         if "operation" in data:
             data["operation"] = data["operation"].lower()
         
-        super().__init__(**data)
+        return data
+    
+    @classmethod
+    def from_trusted(cls, data: Dict[str, Any]) -> "MongoDBQuery":
+        """
+        Construye la consulta sin validación de Pydantic, para datos cuyos
+        tipos ya se han comprobado. Aplica la misma normalización que __init__.
+        
+        Args:
+            data: Campos de la consulta (se modifican in situ)
+            
+        Returns:
+            Instancia de MongoDBQuery
+        """
+        return cls.model_construct(**cls._normalize(data))
     
     def model_dump(self, *args, **kwargs):
         """
@@ -102,6 +132,9 @@ class MongoDBQuerySimple(BaseModel):
     pipeline: Optional[List[Dict[str, Any]]] = None
     document: Optional[Dict[str, Any]] = None
     update: Optional[Dict[str, Any]] = None
+    # Operaciones masivas: documentos de insertMany y operaciones de bulkWrite
+    documents: Optional[List[Dict[str, Any]]] = None
+    operations: Optional[List[Dict[str, Any]]] = None
     
     class Config:
         extra = "allow"
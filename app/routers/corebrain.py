@@ -1,7 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Body, Request
 from typing import Dict, Any
 import json
-import traceback
 
 from app.models.database_query import DatabaseQuery, AIQueryResponse
 from app.models.api_key import ApiKeyInDB
@@ -9,7 +8,8 @@ from app.services import db_service
 from app.middleware.authentication import get_api_key
 from app.core.permissions import verify_permissions, PermissionError
 from app.core.logging import LogEntry, logger
-from app.core.querys import AIQuery
+from app.core.config import settings
+from app.core.querys import AIQuery, get_openai_client
 from app.models.database_query import QueryResult, MongoDBQuery
 
 router = APIRouter()
@@ -227,14 +227,11 @@ async def process_sdk_query(
         )
     
     except Exception as e:
-        # Capturar los detalles del error para un mejor diagnóstico
-        import traceback
-        error_details = traceback.format_exc()
-        
+        # La traza solo se formatea si el log llega a emitirse
         LogEntry("sdk_query_error", "error") \
             .set_api_key_id(api_key.id) \
             .add_data("error", str(e)) \
-            .add_data("traceback", error_details) \
+            .add_traceback(e) \
             .log()
             
         raise HTTPException(
@@ -409,14 +406,11 @@ async def process_query_results(
         )
     
     except Exception as e:
-        # Capturar los detalles del error para un mejor diagnóstico
-        import traceback
-        error_details = traceback.format_exc()
-        
+        # La traza solo se formatea si el log llega a emitirse
         LogEntry("sdk_results_processing_error", "error") \
             .set_api_key_id(api_key.id) \
             .add_data("error", str(e)) \
-            .add_data("traceback", error_details) \
+            .add_traceback(e) \
             .log()
             
         raise HTTPException(
@@ -489,8 +483,8 @@ async def identify_query_collections(
                 Responde ÚNICAMENTE con un array JSON de nombres de tablas, sin ningún otro texto.
                 """
                 
-                # Inicializar cliente OpenAI
-                client = openai.AsyncOpenAI(api_key=settings.OPENAI.OPENAI_API_KEY)
+                # Cliente OpenAI compartido (reutiliza su pool de conexiones)
+                client = get_openai_client()
                 
                 # Enviar solicitud a OpenAI
                 response = await client.chat.completions.create(
@@ -563,8 +557,8 @@ async def identify_query_collections(
                 Responde ÚNICAMENTE con un array JSON de nombres de colecciones, sin ningún otro texto.
                 """
                 
-                # Inicializar cliente OpenAI
-                client = openai.AsyncOpenAI(api_key=settings.OPENAI.OPENAI_API_KEY)
+                # Cliente OpenAI compartido (reutiliza su pool de conexiones)
+                client = get_openai_client()
                 
                 # Enviar solicitud a OpenAI
                 response = await client.chat.completions.create(
@@ -650,14 +644,11 @@ async def identify_query_collections(
         )
     
     except Exception as e:
-        # Capturar los detalles del error para un mejor diagnóstico
-        import traceback
-        error_details = traceback.format_exc()
-        
+        # La traza solo se formatea si el log llega a emitirse
         LogEntry("collection_identification_error", "error") \
             .set_api_key_id(api_key.id) \
             .add_data("error", str(e)) \
-            .add_data("traceback", error_details) \
+            .add_traceback(e) \
             .log()
             
         raise HTTPException(
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Body, Request
+from fastapi.responses import StreamingResponse
 from typing import List, Optional, Dict, Any
 from statistics import mean
 from datetime import datetime
@@ -14,7 +15,6 @@ from app.models.database_query import QueryResult, MongoDBQuery
 
 import re
 import json
-import traceback
 import time
 import bson
 from bson import ObjectId, Decimal128
@@ -339,21 +339,7 @@ async def process_sdk_query(
                 )
                 
                 # Preparar el objeto de consulta para devolverlo
-                if hasattr(mongo_query, "model_dump"):
-                    query_dict = mongo_query.model_dump()
-                elif hasattr(mongo_query, "dict"):
-                    query_dict = mongo_query.dict()
-                else:
-                    # Fallback: crear diccionario manualmente
-                    query_dict = {
-                        "collection": mongo_query.collection,
-                        "operation": mongo_query.operation,
-                        "filter": mongo_query.filter,
-                        "projection": mongo_query.projection,
-                        "sort": mongo_query.sort,
-                        "limit": mongo_query.limit,
-                        "skip": mongo_query.skip
-                    }
+                query_dict = serialize_model(mongo_query)
                 
                 # Generar explicación con validación
                 try:
@@ -435,14 +421,11 @@ async def process_sdk_query(
         )
     
     except Exception as e:
-        # Capturar los detalles del error para un mejor diagnóstico
-        import traceback
-        error_details = traceback.format_exc()
-        
+        # La traza solo se formatea si el log llega a emitirse
         LogEntry("sdk_query_error", "error") \
             .set_api_key_id(api_key.id) \
             .add_data("error", str(e)) \
-            .add_data("traceback", error_details) \
+            .add_traceback(e) \
             .log()
             
         raise HTTPException(
@@ -500,6 +483,46 @@ def generate_default_explanation(sql_query: str, result_data: list) -> str:
     # Fallback general
     return f"Se ejecutó la consulta y se obtuvieron {result_count} resultados."
 
+# Explicaciones predeterminadas por operación MongoDB: (colección, nº de resultados, datos) -> texto
+def _explain_find(collection: str, result_count: int, result_data: Any) -> str:
+    if result_count == 0:
+        return f"No se encontraron documentos en {collection} que coincidan con los criterios de búsqueda."
+    return f"Se encontraron {result_count} documentos en {collection} que coinciden con los criterios de búsqueda."
+
+def _explain_find_one(collection: str, result_count: int, result_data: Any) -> str:
+    if result_data:
+        return f"Se encontró el documento solicitado en {collection}."
+    return f"No se encontró ningún documento en {collection} que coincida con los criterios de búsqueda."
+
+def _explain_aggregate(collection: str, result_count: int, result_data: Any) -> str:
+    return f"La agregación en {collection} devolvió {result_count} resultados."
+
+def _explain_insert_one(collection: str, result_count: int, result_data: Any) -> str:
+    return f"Se ha insertado correctamente un nuevo documento en {collection}."
+
+def _explain_update_one(collection: str, result_count: int, result_data: Any) -> str:
+    return f"Se ha actualizado correctamente un documento en {collection}."
+
+def _explain_delete_one(collection: str, result_count: int, result_data: Any) -> str:
+    return f"Se ha eliminado correctamente un documento de {collection}."
+
+# Variantes de nombre de operación (en minúsculas) -> nombre canónico
+_OP_CANON = {
+    "findone": "find_one",
+    "insertone": "insert_one",
+    "updateone": "update_one",
+    "deleteone": "delete_one"
+}
+
+_OP_HANDLERS = {
+    "find": _explain_find,
+    "find_one": _explain_find_one,
+    "aggregate": _explain_aggregate,
+    "insert_one": _explain_insert_one,
+    "update_one": _explain_update_one,
+    "delete_one": _explain_delete_one
+}
+
 def generate_default_mongo_explanation(mongo_query, result_data: list) -> str:
     """
     Genera una explicación predeterminada para consultas MongoDB cuando la IA falla.
@@ -515,30 +538,11 @@ def generate_default_mongo_explanation(mongo_query, result_data: list) -> str:
     operation = getattr(mongo_query, "operation", "find")
     result_count = len(result_data) if isinstance(result_data, list) else (1 if result_data else 0)
     
-    # Determinar tipo de operación
-    if operation == "find":
-        if result_count == 0:
-            return f"No se encontraron documentos en {collection} que coincidan con los criterios de búsqueda."
-        else:
-            return f"Se encontraron {result_count} documentos en {collection} que coinciden con los criterios de búsqueda."
-    
-    elif operation == "findOne":
-        if result_data:
-            return f"Se encontró el documento solicitado en {collection}."
-        else:
-            return f"No se encontró ningún documento en {collection} que coincida con los criterios de búsqueda."
-    
-    elif operation == "aggregate":
-        return f"La agregación en {collection} devolvió {result_count} resultados."
-    
-    elif operation == "insertOne":
-        return f"Se ha insertado correctamente un nuevo documento en {collection}."
-    
-    elif operation == "updateOne":
-        return f"Se ha actualizado correctamente un documento en {collection}."
-    
-    elif operation == "deleteOne":
-        return f"Se ha eliminado correctamente un documento de {collection}."
+    # Determinar tipo de operación (MongoDBQuery normaliza la operación a minúsculas)
+    op = str(operation).lower()
+    handler = _OP_HANDLERS.get(_OP_CANON.get(op, op))
+    if handler is not None:
+        return handler(collection, result_count, result_data)
     
     # Fallback general
     return f"Se ejecutó la operación {operation} y se obtuvieron {result_count} resultados."
@@ -704,7 +708,7 @@ async def process_query_results(
         LogEntry("process_results_error", "error") \
             .set_api_key_id(api_key.id) \
             .add_data("error", str(e)) \
-            .add_data("traceback", traceback.format_exc()) \
+            .add_traceback(e) \
             .log()
             
         raise HTTPException(
@@ -712,6 +716,84 @@ async def process_query_results(
             detail=f"Error al procesar resultados: {str(e)}"
         )
 
+@router.post("/sdk/query/explain/stream")
+async def stream_query_results(
+    request: Request,
+    api_key: ApiKeyInDB = Depends(get_api_key)
+):
+    """
+    Igual que /sdk/query/explain, pero envía la explicación como Server-Sent Events
+    a medida que se genera. Cada evento lleva {"delta": "..."} y el último es "[DONE]".
+    Las consultas MongoDB se explican en un único evento.
+    """
+    try:
+        # Verificar permisos básicos
+        verify_permissions(api_key.level, "read")
+        
+        try:
+            data = await request.json()
+        except json.JSONDecodeError:
+            raise ValueError("El cuerpo de la solicitud no es un JSON válido")
+        
+        question = data.get("question")
+        query = data.get("query")
+        result = data.get("result", [])
+        query_time_ms = data.get("query_time_ms", 0)
+        metadata = data.get("metadata", {})
+        
+        if not question or not query:
+            raise ValueError("La pregunta y la consulta ejecutada son obligatorias")
+        
+        # Si el resultado viene con estructura anidada (formato completo)
+        if isinstance(result, dict) and "data" in result:
+            query_time_ms = result.get("query_time_ms", query_time_ms)
+            result = result.get("data", [])
+        
+        is_sql_query = isinstance(query, dict) and "sql" in query
+        
+        query_result = QueryResult(
+            data=result,
+            count=len(result) if isinstance(result, list) else 1,
+            query_time_ms=query_time_ms,
+            has_more=False,
+            metadata={
+                "engine": query.get("engine", "") if is_sql_query else "",
+                "config_id": data.get("config_id"),
+                "executed_by": metadata.get("executed_by", "sdk"),
+                **metadata
+            }
+        )
+    
+    except PermissionError as e:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e))
+    
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    async def events():
+        try:
+            if is_sql_query:
+                async for part in AIQuery.stream_sql_result_explanation(
+                    query=question,
+                    sql_query=query.get("sql", ""),
+                    result=query_result
+                ):
+                    yield f"data: {json.dumps({'delta': part})}\n\n"
+            else:
+                explanation = await AIQuery.generate_result_explanation(
+                    query=question,
+                    mongo_query=query,
+                    result=query_result
+                )
+                yield f"data: {json.dumps({'delta': explanation})}\n\n"
+        except Exception as e:
+            logger.error(f"Error en la generación de explicación: {str(e)}")
+            yield f"data: {json.dumps({'delta': enrich_explanation(question, query, result, is_sql_query)})}\n\n"
+        
+        yield "data: [DONE]\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 def enrich_explanation(question: str, query: Any, result: List[Dict], is_sql_query: bool) -> str:
     """
     Genera una explicación mejorada cuando la explicación original es insuficiente
@@ -869,7 +951,7 @@ async def identify_query_collections(
         LogEntry("process_results_error", "error") \
             .set_api_key_id(api_key.id) \
             .add_data("error", str(e)) \
-            .add_data("traceback", traceback.format_exc()) \
+            .add_traceback(e) \
             .log()
             
         raise HTTPException(
@@ -962,8 +1044,6 @@ async def get_truth(
                 print("  La agregación no devolvió resultados. Intentando método alternativo...")
                 
                 # Método 2: Procesar los datos en Python si la agregación no funciona
-                from statistics import mean
-                
                 documentos = await transactions_collection.find(
                     {"transactions": {"$exists": True}}
                 ).to_list(length=None)
@@ -1048,7 +1128,7 @@ async def get_database_schema(
         collections_to_remove = []
 
         for collection_name in db_info["collections"]:
-            if not await db_service.check_collection_access(api_key.level, collection_name):
+            if not db_service.check_collection_access(api_key.level, collection_name):
                 collections_to_remove.append(collection_name)
 
         for collection_name in collections_to_remove:
@@ -46,8 +46,10 @@ async def track_event(
     result = await analytics_collection.insert_one(event)
     
     # Invalidar caché de estadísticas
-    Cache.delete(Cache.generate_key("stats_daily"))
-    Cache.delete(Cache.generate_key("stats_monthly"))
+    await Cache.mdelete([
+        Cache.generate_key("stats_daily"),
+        Cache.generate_key("stats_monthly")
+    ])
     
     return str(result.inserted_id)
 
@@ -164,15 +166,27 @@ async def get_top_queries(
     Returns:
         Lista de consultas más populares
     """
-    # Calcular fecha de inicio
-    start_date = datetime.now() - timedelta(days=days)
-    
-    # Intentar obtener de caché
+    # Obtener de caché o calcular (1 hora)
     cache_key = Cache.generate_key("top_queries", limit, days)
-    cached_data = Cache.get(cache_key)
+    return await Cache.get_or_set(
+        cache_key,
+        lambda: _aggregate_top_queries(limit, days),
+        ttl=3600
+    )
+
+async def _aggregate_top_queries(limit: int, days: int) -> List[Dict[str, Any]]:
+    """
+    Calcula las consultas más populares a partir de los eventos registrados
     
-    if cached_data:
-        return cached_data
+    Args:
+        limit: Número máximo de consultas a devolver
+        days: Número de días para analizar
+        
+    Returns:
+        Lista de consultas más populares
+    """
+    # Calcular fecha de inicio
+    start_date = datetime.now() - timedelta(days=days)
     
     # Pipeline de agregación
     pipeline = [
@@ -209,9 +223,6 @@ async def get_top_queries(
         
         formatted_results.append(formatted_result)
     
-    # Guardar en caché (1 hora)
-    Cache.set(cache_key, formatted_results, ttl=3600)
-    
     return formatted_results
 
 
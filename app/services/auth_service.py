@@ -22,6 +22,9 @@ db = db_client[settings.MONGODB.MONGODB_DB_NAME]
 api_key_repo = ApiKeyRepository(db)
 user_repo = UserRepository(db)
 
+# Generador de claves de caché para API keys
+_api_key_cache_key = Cache.compile_key("api_key", (str,))
+
 async def create_user(user_data: UserCreate) -> UserInDB:
     """Crea un nuevo usuario"""
     # Verificar si el email ya existe
@@ -242,22 +245,11 @@ async def get_api_key_data(api_key: str, validate: bool = True) -> Optional[ApiK
         ApiKeyInDB o None si no es válida
     """
     # Intentar obtener de caché primero
-    cache_key = Cache.generate_key("api_key", api_key)
-    cached_data = Cache.get(cache_key)
-    
-    if cached_data:
-        # Convertir strings ISO a objetos datetime para campos de fecha
-        if isinstance(cached_data.get('created_at'), str):
-            cached_data['created_at'] = datetime.fromisoformat(cached_data['created_at'])
-        if isinstance(cached_data.get('updated_at'), str):
-            cached_data['updated_at'] = datetime.fromisoformat(cached_data['updated_at'])
-        if cached_data.get('expires_at') and isinstance(cached_data['expires_at'], str):
-            cached_data['expires_at'] = datetime.fromisoformat(cached_data['expires_at'])
-        if cached_data.get('last_used_at') and isinstance(cached_data['last_used_at'], str):
-            cached_data['last_used_at'] = datetime.fromisoformat(cached_data['last_used_at'])
-        
-        apiKeyInDB = ApiKeyInDB(**cached_data)
-        return apiKeyInDB
+    cache_key = _api_key_cache_key(api_key)
+    cached_api_key = await Cache.get(cache_key, model=ApiKeyInDB)
+    
+    if cached_api_key:
+        return cached_api_key
     
     # Buscar en la base de datos
     print("Busca la db")
@@ -290,7 +282,7 @@ async def get_api_key_data(api_key: str, validate: bool = True) -> Optional[ApiK
     # Convertir el modelo Pydantic a diccionario antes de guardarlo
     print("Guarda en cache")
     api_key_dict = api_key_data.model_dump() if hasattr(api_key_data, "model_dump") else api_key_data.dict()
-    Cache.set(cache_key, api_key_dict, ttl=300)  # 5 minutos
+    await Cache.set(cache_key, api_key_dict, ttl=300)  # 5 minutos
     
     print("Return key data")
     return api_key_data
@@ -314,8 +306,8 @@ async def revoke_api_key(api_key_id: str, user_id: str = None) -> bool:
     await api_key_repo.update("key", api_key_id, update_data)
     
     # Invalidar caché
-    cache_key = Cache.generate_key("api_key", api_key.key)
-    Cache.delete(cache_key)
+    cache_key = _api_key_cache_key(api_key.key)
+    await Cache.delete(cache_key)
     
     # Registrar revocación
     LogEntry("api_key_revoked") \
@@ -1,5 +1,6 @@
 
 import anthropic
+import re
 import uuid
 import json
 import time
@@ -9,7 +10,8 @@ from app.core.config import settings
 from app.core.cache import Cache
 from app.core.logging import LogEntry
 from app.core.security import sanitize_mongo_query
-from app.core.permissions import verify_permissions
+from app.core.permissions import verify_permissions, check_collection_access, PermissionError
+from app.database.session import get_database
 from app.models.message import MessageInDB, AIResponse, MessageWithAIResponse
 from app.models.conversation import ConversationInDB, ConversationUpdate
 from app.database.repositories.message_repository import MessageRepository
@@ -150,7 +152,7 @@ async def process_message(
         [msg.id for msg in message_history[-5:] if msg.id != user_message_id]
     )
     
-    cached_response = Cache.get(cache_key)
+    cached_response = await Cache.get(cache_key, model=AIResponse)
     ai_response = None
     
     if cached_response:
@@ -158,7 +160,7 @@ async def process_message(
             .set_api_key_id(api_key_id) \
             .add_data("conversation_id", conversation_id) \
             .log()
-        ai_response = AIResponse(**cached_response)
+        ai_response = cached_response
         
         # Recuperar uso de tokens del caché si está disponible
         if "tokens" in ai_response.metadata:
@@ -394,7 +396,7 @@ async def process_message(
             )
             
             # Guardar en caché
-            Cache.set(cache_key, ai_response.model_dump(), ttl=3600)  # 1 hora
+            await Cache.set(cache_key, ai_response.model_dump(), ttl=3600)  # 1 hora
             
         except Exception as e:
             # Registrar error
@@ -484,7 +486,6 @@ def extract_mongodb_queries(text: str) -> List[str]:
     """
     Extrae consultas MongoDB del formato markdown code blocks
     """
-    import re
     pattern = r"```(?:mongodb|js|javascript)?\s*([\s\S]*?)```"
     matches = re.findall(pattern, text)
     return [query.strip() for query in matches if query.strip()]
@@ -493,10 +494,6 @@ async def execute_mongodb_query(query_str: str, api_key_level: str) -> Any:
     """
     Ejecuta una consulta MongoDB de forma segura
     """
-    from app.database.session import get_database
-    from app.core.security import sanitize_mongo_query
-    import re
-    
     # Obtener la instancia de la base de datos
     db = get_database()
     
@@ -509,7 +506,6 @@ async def execute_mongodb_query(query_str: str, api_key_level: str) -> Any:
     operation = collection_match.group(2)
     
     # Verificar permisos para acceder a esta colección
-    from app.core.permissions import check_collection_access
     if not check_collection_access(api_key_level, collection_name):
         raise PermissionError(f"Sin acceso a la colección: {collection_name}")
     
@@ -524,7 +520,6 @@ async def execute_mongodb_query(query_str: str, api_key_level: str) -> Any:
         params_str = find_params.group(1).strip()
         if params_str:
             # Evaluar la consulta de forma segura
-            import ast
             # Reemplazar notación de MongoDB por Python
             params_str = params_str.replace("$", "_$_")
             params_str = params_str.replace("_$_", "$")
@@ -603,8 +598,10 @@ async def execute_mongodb_query(query_str: str, api_key_level: str) -> Any:
         # Sanitizar la consulta
         query = sanitize_mongo_query(query)
         
-        # Ejecutar count
+        # Ejecutar count (sin filtro basta el conteo de los metadatos)
         collection = db[collection_name]
+        if not query:
+            return await collection.estimated_document_count()
         return await collection.count_documents(query)
     
     elif operation == "distinct":
@@ -1,5 +1,5 @@
-import json
 import time
+import orjson
 from typing import List, Dict, Any, Optional, Union, Tuple
 from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo.errors import OperationFailure
@@ -9,7 +9,7 @@ from app.core.config import settings
 from app.core.logging import LogEntry
 from app.core.cache import Cache
 from app.core.security import sanitize_mongo_query
-from app.core.permissions import verify_permissions, check_collection_access
+from app.core.permissions import verify_permissions, check_collection_access, PermissionError
 from app.models.database_query import MongoDBQuery, QueryResult, AIQueryResponse
 from app.core.querys import AIQuery
 
@@ -105,8 +105,12 @@ async def execute_query(
     try:
         collection = db[collection_name]
         
-        # Contar total de documentos que coinciden (para pagination)
-        total_count = await collection.count_documents(safe_query)
+        # Contar total de documentos que coinciden (para pagination).
+        # Sin filtro basta el conteo de los metadatos de la colección
+        if safe_query:
+            total_count = await collection.count_documents(safe_query)
+        else:
+            total_count = await collection.estimated_document_count()
         
         # Ejecutar consulta
         cursor = collection.find(
@@ -242,7 +246,7 @@ async def get_database_info() -> Dict[str, Any]:
     """
     # Intentar obtener de caché
     cache_key = Cache.generate_key("db_info")
-    cached_info = Cache.get(cache_key)
+    cached_info = await Cache.get(cache_key)
     
     if cached_info:
         return cached_info
@@ -255,8 +259,8 @@ async def get_database_info() -> Dict[str, Any]:
     for collection_name in collections:
         collection = db[collection_name]
         
-        # Obtener conteo de documentos
-        count = await collection.count_documents({})
+        # Obtener conteo de documentos (de los metadatos, sin recorrer la colección)
+        count = await collection.estimated_document_count()
         
         # Obtener esquema inferido
         schema = await get_collection_schema(collection_name)
@@ -268,7 +272,7 @@ async def get_database_info() -> Dict[str, Any]:
         }
     
     # Guardar en caché (10 minutos)
-    Cache.set(cache_key, result, ttl=600)
+    await Cache.set(cache_key, result, ttl=600)
     
     return result
 
@@ -293,7 +297,7 @@ async def get_sql_database_info(db_config: Dict[str, Any]) -> Dict[str, Any]:
                                       db_config.get("host", ""),
                                       db_config.get("database", ""),
                                       db_config.get("config_id", ""))
-        cached_info = Cache.get(cache_key)
+        cached_info = await Cache.get(cache_key)
         
         if cached_info:
             return cached_info
@@ -507,7 +511,7 @@ async def get_sql_database_info(db_config: Dict[str, Any]) -> Dict[str, Any]:
             logger.warning(f"Motor SQL desconocido: {engine}")
         
         # Guardar en caché (10 minutos)
-        Cache.set(cache_key, result, ttl=600)
+        await Cache.set(cache_key, result, ttl=600)
         
         return result
         
@@ -563,7 +567,7 @@ async def process_sql_query(
     
     # Intentar obtener respuesta de caché
     cache_key = Cache.generate_key("sql_query", query, collection_name, config_id)
-    cached_response = Cache.get(cache_key)
+    cached_response = await Cache.get(cache_key)
     
     sql_query = None
     if cached_response:
@@ -583,7 +587,7 @@ async def process_sql_query(
         sql_query = await AIQuery.generate_sql_query(query, db_info, engine)
         
         # Guardar en caché (1 hora)
-        Cache.set(cache_key, sql_query, ttl=3600)
+        await Cache.set(cache_key, sql_query, ttl=3600)
     
     # Ejecutar la consulta SQL
     try:
@@ -770,7 +774,7 @@ async def process_natural_language_query(
     
     # Intentar obtener respuesta de caché
     cache_key = Cache.generate_key("nl_query", query, collection_name, config_id)
-    cached_response = Cache.get(cache_key)
+    cached_response = await Cache.get(cache_key)
     
     mongo_query = None
     if cached_response:
@@ -790,7 +794,7 @@ async def process_natural_language_query(
         mongo_query = await AIQuery.generate_mongodb_query(query, db_info)
         
         # Guardar en caché (1 hora)
-        Cache.set(cache_key, mongo_query.model_dump(), ttl=3600)
+        await Cache.set(cache_key, mongo_query.model_dump(), ttl=3600)
     
     # Si se especificó una colección y no coincide con la inferida, usamos la especificada
     if collection_name and mongo_query.collection != collection_name:
@@ -885,7 +889,8 @@ async def generate_result_explanation(
         "query_time_ms": result.query_time_ms
     }
     
-    context_json = json.dumps(context, indent=2)
+    # JSON compacto: los espacios de la indentación también cuentan como tokens
+    context_json = orjson.dumps(context, default=str).decode()
     
     # Generar prompt para Anthropic
     system_prompt = """
@@ -10,6 +10,8 @@ from app.routers import auth, chat, cli_token, database, analytics, public, api_
 from app.database import connect_to_mongodb, close_mongodb_connection
 from app.middleware import setup_middleware
 from app.core.config import settings
+from app.core.cache import Cache
+from app.core.querys import close_openai_client, close_sql_pools, close_mongodb_clients
 from app.core.logging import LogEntry
 from app.core.permissions import PermissionError
 
@@ -63,6 +65,14 @@ async def shutdown_event():
     # Cerrar conexión a MongoDB
     await close_mongodb_connection()
     
+    # Aplicar escrituras de caché pendientes y cerrar Redis
+    await Cache.close()
+    
+    # Cerrar el cliente compartido de OpenAI y las conexiones a bases de datos de clientes
+    await close_openai_client()
+    await close_sql_pools()
+    close_mongodb_clients()
+    
     # Registrar apagado
     LogEntry("app_shutdown", "info").log()
 
@@ -0,0 +1,120 @@
+import asyncio
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from bson import Decimal128, ObjectId
+
+from app.core import cache
+from app.core.cache import _deserialize, _serialize
+
+
+def test_deserialize_reads_incrby_counters():
+    # INCRBY guarda el contador como entero ASCII, sin byte de formato
+    assert _deserialize(b"42") == 42
+    assert _deserialize(b"-3") == -3
+
+
+def test_deserialize_tagged_values_and_unknown_format():
+    assert _deserialize(_serialize({"a": 1})) == {"a": 1}
+    assert _deserialize(_serialize("text")) == "text"
+    assert _deserialize(b"not-a-number", "default") == "default"
+
+
+def test_serialize_round_trips_mongo_documents():
+    document = {
+        "_id": ObjectId(),
+        "total": Decimal128("1234.5678"),
+        "created_at": datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+        "tags": ["a", "b"],
+    }
+    
+    assert _deserialize(_serialize(document)) == document
+
+
+def test_serialize_decimals_and_naive_datetimes_as_text():
+    value = {"price": Decimal("19.99"), "at": datetime(2024, 1, 2, 3, 4, 5)}
+    
+    assert _deserialize(_serialize(value)) == {"price": "19.99", "at": "2024-01-02T03:04:05"}
+
+
+def test_local_namespaces_keep_their_prefix_on_hashed_keys():
+    assert cache.Cache.generate_key("api_key", "x" * 100).startswith("api_key:")
+    assert cache.Cache.compile_key("api_key", (str,))("secret").startswith("api_key:")
+    assert ":" not in cache.Cache.generate_key("chat_cache", "x" * 100)
+
+
+def test_local_cache_skips_other_namespaces_and_expires(monkeypatch):
+    monkeypatch.setattr(cache, "_local_cache_ready", True)
+    monkeypatch.setattr(cache, "_local_cache", cache.OrderedDict())
+    monkeypatch.setattr(cache, "_LOCAL_CACHE_TTL", 30)
+    gen = cache._invalidation_gen
+    
+    cache._local_put("api_key:abc", b"value", gen)
+    cache._local_put("chat_cache:abc", b"value", gen)
+    assert cache._local_get("api_key:abc") == b"value"
+    assert cache._local_get("chat_cache:abc") is None
+    
+    monkeypatch.setattr(cache.time, "monotonic", lambda: float("inf"))
+    assert cache._local_get("api_key:abc") is None
+    assert "api_key:abc" not in cache._local_cache
+
+
+def test_exists_and_increment_wait_for_queued_writes(monkeypatch):
+    calls = []
+    
+    async def drain_writes():
+        calls.append("drain")
+    
+    class _FakeRedis:
+        async def exists(self, key):
+            calls.append("exists")
+            return 1
+        
+        async def incrby(self, key, amount):
+            calls.append("incrby")
+            return amount
+    
+    monkeypatch.setattr(cache, "_ENABLE_CACHE", True)
+    monkeypatch.setattr(cache, "_drain_writes", drain_writes)
+    monkeypatch.setattr(cache, "redis_client", _FakeRedis())
+    
+    assert asyncio.run(cache.Cache.exists("counter")) is True
+    assert asyncio.run(cache.Cache.increment("counter", 2)) == 2
+    assert calls == ["drain", "exists", "drain", "incrby"]
+
+
+def test_get_or_set_survives_cancelling_the_first_caller(monkeypatch):
+    class _FakeRedis:
+        async def get(self, key):
+            return None
+        
+        async def set(self, key, value, ex=None, nx=False):
+            return True
+    
+    monkeypatch.setattr(cache, "_ENABLE_CACHE", True)
+    monkeypatch.setattr(cache, "redis_client", _FakeRedis())
+    
+    async def scenario():
+        release = asyncio.Event()
+        calls = []
+        
+        async def factory():
+            calls.append(1)
+            await release.wait()
+            return "value"
+        
+        owner = asyncio.create_task(cache.Cache.get_or_set("key", factory))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.Cache.get_or_set("key", factory))
+        await asyncio.sleep(0)
+        
+        owner.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        
+        assert await waiter == "value"
+        assert owner.cancelled()
+        assert calls == [1]
+        assert "key" not in cache._inflight
+    
+    asyncio.run(scenario())
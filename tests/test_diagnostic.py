@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from app.core import diagnostic
+from app.core.diagnostic import Diagnostic
+
+
+class _FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+    
+    def sort(self, sort):
+        return self
+    
+    def skip(self, skip):
+        return self
+    
+    def limit(self, limit):
+        return self
+    
+    def batch_size(self, size):
+        return self
+    
+    async def to_list(self, length=None):
+        return list(self.documents)
+
+
+class _FakeCollection:
+    def __init__(self, documents):
+        self.documents = documents
+    
+    def find(self, filter=None, projection=None):
+        return _FakeCursor(self.documents)
+
+
+class _FakeDatabase:
+    name = "shop"
+    client = None
+    
+    def __init__(self, collections):
+        self.collections = collections
+        self.listings = 0
+    
+    def __getitem__(self, name):
+        return _FakeCollection(self.collections.get(name, []))
+    
+    async def list_collection_names(self):
+        self.listings += 1
+        return list(self.collections)
+
+
+def test_empty_new_collection_is_not_replaced_by_a_stale_listing(monkeypatch):
+    monkeypatch.setattr(diagnostic, "_collections_cache", {})
+    db = _FakeDatabase({"orders": [{"_id": 1}], "invoices": []})
+    # Listado en caché anterior a la creación de "invoices"
+    diagnostic._collections_cache[diagnostic._db_cache_key(db)] = (time.monotonic() + 30, ["orders"])
+    
+    results = asyncio.run(Diagnostic.execute_mongodb_query(db, {"collection": "invoices", "operation": "find"}))
+    
+    assert results == []
+    assert db.listings == 1
+    assert diagnostic._collections_cache[diagnostic._db_cache_key(db)][1] == ["orders", "invoices"]
@@ -0,0 +1,129 @@
+import asyncio
+from datetime import date
+
+from bson import ObjectId
+
+from app.core import querys
+from app.core.querys import AIQuery
+from app.models.database_query import MongoDBQuery, QueryResult
+
+
+class _FakeCursor:
+    """Cursor de Motor mínimo: encadena sort/limit/skip/batch_size e itera los documentos"""
+    def __init__(self, documents):
+        self.documents = list(documents)
+        self.closed = False
+    
+    def sort(self, sort):
+        return self
+    
+    def limit(self, limit):
+        self.documents = self.documents[:limit]
+        return self
+    
+    def skip(self, skip):
+        return self
+    
+    def batch_size(self, size):
+        return self
+    
+    def __aiter__(self):
+        return self._iterate()
+    
+    async def _iterate(self):
+        for document in self.documents:
+            yield document
+    
+    async def close(self):
+        self.closed = True
+
+
+class _FakeCollection:
+    def __init__(self, documents):
+        self.documents = documents
+        self.cursor = None
+    
+    def find(self, query_filter, projection=None):
+        self.cursor = _FakeCursor(self.documents)
+        return self.cursor
+
+
+def test_execute_mongodb_query_returns_result_and_explanation(monkeypatch):
+    documents = [{"_id": ObjectId(), "name": "a"}, {"_id": ObjectId(), "name": "b"}]
+    collection = _FakeCollection(documents)
+    monkeypatch.setattr(querys, "_get_mongo_collection", lambda *args: collection)
+    
+    query = MongoDBQuery(collection="products", operation="find", filter={}, limit=10)
+    response = asyncio.run(AIQuery.execute_mongodb_query(query, {"database": "shop"}))
+    
+    result, explanation = response
+    assert [doc["name"] for doc in result] == ["a", "b"]
+    assert result[0]["_id"] == str(documents[0]["_id"])
+    assert explanation.startswith("The query returned 2 documents.")
+    assert collection.cursor.closed
+
+
+def test_coerce_rows_converts_every_type_in_a_column():
+    rows = [
+        {"id": 1, "value": "text"},
+        {"id": 2, "value": b"\x01\x02"},
+        {"id": 3, "value": date(2024, 1, 2)},
+        {"id": 4, "value": None},
+    ]
+    querys._coerce_rows(rows, querys._hex)
+    
+    assert [row["value"] for row in rows] == ["text", "0102", "2024-01-02", None]
+    assert [row["id"] for row in rows] == [1, 2, 3, 4]
+
+
+def test_to_dict_dumps_models_and_plain_objects():
+    query = MongoDBQuery(collection="products", filter={"price": 1})
+    assert querys._to_dict(query)["query"] == {"price": 1}
+    
+    class Plain:
+        def __init__(self):
+            self.collection = "products"
+    
+    assert querys._to_dict(Plain()) == {"collection": "products"}
+    assert querys._to_dict({"collection": "products"}) == {"collection": "products"}
+
+
+def test_collections_batch_falls_back_per_question(monkeypatch):
+    class _FailingCompletions:
+        async def create(self, **kwargs):
+            assert kwargs["max_tokens"] <= querys._COMPLETION_TOKEN_LIMIT
+            raise RuntimeError("batch request failed")
+    
+    class _FakeClient:
+        class chat:
+            completions = _FailingCompletions()
+    
+    async def request_collections(system_prompt, question):
+        if question == "bad":
+            raise ValueError(question)
+        return [question]
+    
+    monkeypatch.setattr(querys, "get_openai_client", lambda: _FakeClient())
+    monkeypatch.setattr(querys, "_request_collections", request_collections)
+    
+    answers = asyncio.run(querys._request_collections_many("prompt", ["users", "bad"] * 300))
+    
+    assert answers[0] == ["users"]
+    assert isinstance(answers[1], ValueError)
+    assert len(answers) == 600
+
+
+def test_fallback_explanation_matches_operations_case_insensitively(monkeypatch):
+    async def failing_explanation(*args):
+        raise RuntimeError("openai unavailable")
+    
+    monkeypatch.setattr(querys, "_create_explanation", failing_explanation)
+    result = QueryResult(data=[{"name": "Ana"}], count=1, query_time_ms=0)
+    
+    def explain(operation):
+        mongo_query = {"collection": "users", "operation": operation}
+        return asyncio.run(AIQuery.generate_result_explanation("q", mongo_query, result, "en"))
+    
+    assert explain("findone").startswith("The requested document was found in the users collection.")
+    assert explain("updateOne").startswith("A document in the users collection has been successfully updated.")
+    assert explain("find").startswith("1 documents were found in the users collection.")